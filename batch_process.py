@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Batch (backfill) processing of memory images already on disk, without the directory watchdog.
+i.e. python batch_process.py /evidence --case 'SIR00123*' --jobs 4 --plugin-workers 2 --resume
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import fnmatch
+import argparse
+import threading
+from pathlib import Path
+from datetime import datetime
+from configs.defaults import MEM_DUMP_FILE_PATTERN, MONITORED_FOLDERS, log_level, enable_splunk_integration, \
+    splunk_config, case_output_dir, case_archive_dir, case_log_dir, case_processed_flag, distributed_mode, lease_dir, \
+    lease_ttl, lease_heartbeat_interval, node_id, async_logging, plugin_workers
+from volatility_worker.core.utils import whoami, set_default_logger, add_logger_filehandler, \
+    add_logger_streamhandler, add_logger_splunkhandler, start_queue_listener, stop_queue_listener
+from volatility_worker.core.vol_worker import get_case_id
+from volatility_worker.core.lease import LeaseManager
+from volatility_worker.core.admission import get_admission_controller
+from volatility_worker.core.scheduler import JobScheduler, run_job_tier
+from volatility_worker.core.profiling import install_profiling
+from volatility_worker.core.ioc_scan import shutdown_pools
+
+DEFAULT_STATE = Path.joinpath(Path(__file__).resolve().parents[0], "logs", "batch_state.json")
+
+
+def find_images(roots, patterns=MEM_DUMP_FILE_PATTERN, cases=None):
+    """
+    Walk folders for memory images using os.scandir.  Plugin output, archive and log folders are not descended into,
+    so files dumped by plugins (i.e. '.dmp') are not picked up.
+    :param roots: folders to walk
+    :param patterns: file name patterns
+    :param cases: case ID patterns (i.e. 'SIR00123*'), None for all cases.  Images outside a case folder are ignored.
+    :return: generator of (path, size)
+    """
+    skip_dirs = {case_output_dir, case_archive_dir, case_log_dir}
+    cases = [case.upper() for case in cases] if cases else None
+    stack = [Path(root).as_posix() for root in reversed(roots)]
+    while len(stack) > 0:
+        try:
+            entries = sorted(os.scandir(stack.pop()), key=lambda _entry: _entry.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in skip_dirs and not entry.name.startswith('.'):
+                        subdirs.append(entry.path)
+                    continue
+                if not entry.is_file() or not any(fnmatch.fnmatch(entry.name, pattern) for pattern in patterns):
+                    continue
+                case_id, _ = get_case_id(entry.path)
+                if case_id == "" or (cases is not None and not any(fnmatch.fnmatchcase(case_id, case)
+                                                                   for case in cases)):
+                    continue
+                yield entry.path, entry.stat().st_size
+            except OSError:
+                continue
+        # Depth-first, in name order
+        stack.extend(reversed(subdirs))
+
+
+def processed_flag(image_path):
+    """
+    :param image_path: path to memory image
+    :return: (Path) processing completed flag of the image
+    """
+    _, case_dir = get_case_id(image_path)
+    return Path.joinpath(case_dir, "{}{}".format(Path(image_path).stem, case_processed_flag))
+
+
+class BatchState:
+    """
+    Outcome of each image, saved after every image so an interrupted batch can be resumed.
+    """
+    def __init__(self, state_file, resume=False):
+        """
+        :param state_file: (Path) JSON state file
+        :param resume: keep the outcomes of a previous run
+        """
+        self.state_file = Path(state_file)
+        self._lock = threading.Lock()
+        self.images = dict()
+        if resume:
+            try:
+                with self.state_file.open('r') as f:
+                    self.images = json.load(f).get('images', dict())
+            except (FileNotFoundError, ValueError):
+                pass
+
+    def done(self, image_path):
+        return self.images.get(image_path, dict()).get('status') == 'done'
+
+    def record(self, image_path, status, seconds):
+        with self._lock:
+            self.images[image_path] = {'status': status, 'seconds': seconds,
+                                       'finished': datetime.now().isoformat(timespec='seconds')}
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            _tmp = self.state_file.with_name(self.state_file.name + '.tmp')
+            with _tmp.open('w') as f:
+                json.dump({'images': self.images}, f, indent=1)
+            _tmp.replace(self.state_file)
+
+
+class BatchProgress:
+    """
+    Image counts and throughput, reported on one status line.
+    """
+    def __init__(self, total, total_bytes, stream=sys.stderr):
+        self.total = total
+        self.total_bytes = total_bytes
+        self.stream = stream
+        self.started = time.time()
+        self.counts = {'done': 0, 'failed': 0, 'skipped': 0}
+        self.done_bytes = 0
+        self._lock = threading.Lock()
+
+    def record(self, status, size):
+        with self._lock:
+            self.counts[status] += 1
+            self.done_bytes += size
+
+    def line(self, running):
+        elapsed = max(time.time() - self.started, 1)
+        with self._lock:
+            finished = sum(self.counts.values())
+            rate = self.done_bytes / elapsed
+            eta = (self.total_bytes - self.done_bytes) / rate if rate > 0 else None
+            return "[%s] %d/%d images (%d done, %d failed, %d skipped), %d running | %.1f images/h, %.1f MB/s%s" % (
+                time.strftime('%H:%M:%S', time.gmtime(elapsed)), finished, self.total, self.counts['done'],
+                self.counts['failed'], self.counts['skipped'], running, finished * 3600 / elapsed, rate / 1024 ** 2,
+                ", ETA %s" % time.strftime('%H:%M:%S', time.gmtime(eta)) if eta is not None else "")
+
+    def report(self, running, final=False):
+        line = self.line(running)
+        if self.stream.isatty() and not final:
+            self.stream.write("\r%s\033[K" % line)
+        else:
+            self.stream.write("%s\n" % line)
+        self.stream.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process memory images already on disk (backfill), without the "
+                                                 "directory watchdog.")
+    parser.add_argument('roots', nargs='*', default=[folder.as_posix() for folder in MONITORED_FOLDERS],
+                        help="folders to walk.  Default: MONITORED_FOLDERS")
+    parser.add_argument('--case', action='append', dest='cases',
+                        help="case ID or pattern (i.e. 'SIR00123*'); repeatable.  Default: all cases")
+    parser.add_argument('--pattern', action='append', dest='patterns',
+                        help="image file name pattern; repeatable.  Default: MEM_DUMP_FILE_PATTERN")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="images processed concurrently (memory admission still applies).  "
+                             "Default: max_concurrent_jobs, or 1 without admission_control")
+    parser.add_argument('--plugin-workers', type=int, default=plugin_workers,
+                        help="plugins of a tier run concurrently per image.  Default: %(default)s")
+    parser.add_argument('--force', action='store_true',
+                        help="re-process images already processed (removes their '%s' flag)" % case_processed_flag)
+    parser.add_argument('--resume', action='store_true',
+                        help="skip images completed by a previous (interrupted) batch using the state file")
+    parser.add_argument('--state', default=DEFAULT_STATE.as_posix(), help="state file.  Default: %(default)s")
+    parser.add_argument('--progress-interval', type=float, default=5, help="seconds between progress reports")
+    parser.add_argument('--dry-run', action='store_true', help="list the images that would be processed")
+    args = parser.parse_args(argv)
+
+    logger = set_default_logger('root')
+    _format = "%(asctime)s  %(levelname)s  %(module)s  %(message)s"
+    # Keep the console for progress; everything goes to the batch log
+    add_logger_streamhandler(logger, logger_level='WARNING', log_format=_format)
+    add_logger_filehandler(logger, logger_level=log_level,
+                           filename=Path.joinpath(DEFAULT_STATE.parent, "batch-%s.log"
+                                                  % datetime.now().strftime("%Y-%m-%d")).as_posix(),
+                           log_format=_format)
+    if enable_splunk_integration:
+        try:
+            add_logger_splunkhandler(logger, **splunk_config)
+        except Exception as err:
+            logger.warning("Failed to add Splunk log handler. %s" % err)
+    if async_logging:
+        start_queue_listener(logger)
+        atexit.register(stop_queue_listener, logger)
+
+    # Opt-in profiling ('profiling' in 'defaults.py' or SIGUSR1)
+    install_profiling(logger)
+
+    state = BatchState(args.state, resume=args.resume)
+    images = []
+    skipped = 0
+    for image_path, size in find_images(args.roots, args.patterns or MEM_DUMP_FILE_PATTERN, args.cases):
+        image_path = Path(image_path).as_posix()
+        if state.done(image_path):
+            skipped += 1
+            continue
+        flag = processed_flag(image_path)
+        if flag.exists():
+            if not args.force:
+                skipped += 1
+                continue
+            if not args.dry_run:
+                flag.unlink()
+        images.append((image_path, size))
+
+    logger.info({'_action': whoami(),
+                 'message': "Batch of %d images (%d skipped)." % (len(images), skipped),
+                 'details': {'roots': args.roots, 'cases': args.cases, 'force': args.force, 'resume': args.resume}
+                 })
+    if args.dry_run:
+        for image_path, size in images:
+            print("%s\t%d" % (image_path, size))
+        print("%d images, %d skipped (processed or completed in a previous batch)" % (len(images), skipped))
+        return 0
+
+    admission = get_admission_controller()
+    if args.jobs is not None:
+        admission.max_jobs = max(1, args.jobs)
+
+    leases = LeaseManager(lease_dir, ttl=lease_ttl, heartbeat_interval=lease_heartbeat_interval,
+                          node_id=node_id, logger=logger) if distributed_mode else None
+    sizes = dict(images)
+    progress = BatchProgress(len(images), sum(sizes.values()))
+    started = dict()
+
+    def runner(job):
+        started.setdefault(job.image_path, time.time())
+        exit_code = run_job_tier(job, logger, leases, args.plugin_workers)
+        if job.finished:
+            if exit_code == 0:
+                # Exit code 0 without a worker: previously processed, or claimed by another node
+                status = 'done' if job.worker is not None else 'skipped'
+            else:
+                status = 'failed'
+            state.record(job.image_path, status, int(time.time() - started[job.image_path]))
+            progress.record(status, sizes.get(job.image_path, 0))
+        return exit_code
+
+    scheduler = JobScheduler(admission, runner, logger, plugin_workers=args.plugin_workers)
+    for image_path, _ in images:
+        scheduler.submit(image_path)
+
+    if leases is not None:
+        leases.start_heartbeat()
+    last_report = 0
+    interrupted = False
+    try:
+        while len(scheduler) > 0 or len(scheduler.running()) > 0:
+            try:
+                scheduler.dispatch()
+                if time.time() - last_report >= args.progress_interval:
+                    progress.report(len(scheduler.running()))
+                    last_report = time.time()
+                time.sleep(1)
+            except KeyboardInterrupt:
+                if interrupted:
+                    raise
+                interrupted = True
+                # Running images are finished; '--resume' picks up the rest
+                for job in scheduler.pending():
+                    scheduler.remove(job.image_path)
+                sys.stderr.write("\nInterrupted.  Waiting for running images; interrupt again to exit.\n")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if leases is not None:
+            leases.stop_heartbeat()
+        # IOC scanner pool processes are kept between images
+        shutdown_pools()
+    progress.report(len(scheduler.running()), final=True)
+    return 1 if progress.counts['failed'] > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
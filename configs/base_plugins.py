@@ -1,4 +1,6 @@
+from collections import OrderedDict
 from ordered_set import OrderedSet
+from configs.defaults import ioc_pattern_files, native_strings
 
 
 class BasePlugins:
@@ -27,6 +29,10 @@ class BasePlugins:
                                 'joblinks', 'memmap', 'memdump', 'procdump', 'vaddump', 'windows', 'wintree',
                                 'evtlogs', 'iehistory', 'notepad', 'screenshot', 'servicediff', 'sessions']
 
+        if native_strings:
+            # Native extraction makes 'strings' affordable; see 'native_strings' in defaults.py
+            process_memory_group.append('strings')
+
         kernel_memory_objects_group = ['modules', 'modscan', 'moddump', 'ssdt', 'driverscan', 'filescan',
                                        'mutantscan', 'symlinkscan', 'thrdscan', 'dumpfiles', 'unloadedmodules',
                                        'crashinfo', 'devicetree', 'driverirp', 'drivermodule', 'hibinfo', 'mbrparser',
@@ -38,6 +44,9 @@ class BasePlugins:
                           'shellbags', 'shimcache', 'getservicesids', 'dumpregistry', 'shutdowntime', 'svcscan']
 
         filesystem_group = ['mftparser', 'yarascan']
+        if len(ioc_pattern_files) > 0:
+            # Native multi-pattern scanner
+            filesystem_group.append('iocscan')
 
         contrib_group = ['timeliner']
 
@@ -56,8 +65,66 @@ class BasePlugins:
                          'verinfo', 'vaddump', 'vadtree', 'vadwalk', 'vadinfo', 'handles', 'printkey',
                          'hivedump', 'hashdump', 'ssdt', 'strings', 'volshell']
 
+        if native_strings:
+            exclude_group.remove('strings')
+
         for plugin in exclude_group:
             try:
                 self.active_plugins.remove(plugin)
             except KeyError:
                 pass
+
+        # Plugin tiers.  Queued images are processed tier by tier: every queued image gets the 'triage' tier
+        # before any image starts deep analysis.  Fast, high-value plugins belong in 'triage'.
+        # A tier set to None collects all active plugins not listed in any other tier.
+        # Note: 'mactime' depends on the outputs of mftparser, shellbags and timeliner; keep it in the last tier.
+        triage_tier = ['pslist', 'pstree', 'cmdline', 'cmdscan', 'consoles', 'netscan', 'connections', 'sockets',
+                       'malfind']
+
+        self.plugin_tiers = OrderedDict([('triage', triage_tier),
+                                         ('deep', None),
+                                         ('post', custom_group)])
+
+
+_base_plugins = None
+
+
+def get_base_plugins():
+    """
+    BasePlugins is built once and shared.  Callers must copy 'active_plugins' before modifying it.
+    :return: BasePlugins
+    """
+    global _base_plugins
+    if _base_plugins is None:
+        _base_plugins = BasePlugins()
+    return _base_plugins
+
+
+def split_into_tiers(active_plugins, plugin_tiers):
+    """
+    Split active plugins into tiers, preserving the 'active_plugins' order within each tier.
+    :param active_plugins: iterable with plugin names
+    :param plugin_tiers: OrderedDict of tier name: plugin names (or None for all remaining plugins).  Without a None
+    tier, plugins not listed in any tier are added to the last tier.
+    :return: list of (tier name, list of plugin names), one entry per declared tier
+    """
+    assigned = set()
+    for plugins in plugin_tiers.values():
+        if plugins is not None:
+            assigned.update(plugins)
+
+    remaining = [plugin for plugin in active_plugins if plugin not in assigned]
+    tiers = []
+    for name, plugins in plugin_tiers.items():
+        if plugins is None:
+            tiers.append((name, remaining))
+            remaining = []
+        else:
+            tiers.append((name, [plugin for plugin in active_plugins if plugin in plugins]))
+
+    # Without a catch-all tier, unassigned plugins run in the last tier
+    if len(remaining) > 0:
+        if len(tiers) == 0:
+            tiers.append(('default', []))
+        tiers[-1][1].extend(remaining)
+    return tiers
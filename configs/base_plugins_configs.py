@@ -1,7 +1,9 @@
 from pathlib import Path
 from collections import OrderedDict
-from configs.base_plugins import BasePlugins
+from configs.base_plugins import get_base_plugins
 from configs.vol_config import volatility_default_timeout
+from configs.defaults import native_mactime, mactime_date_range, ioc_pattern_files, native_strings, \
+    output_compression, strings_timeout
 
 
 class VolPlugin:
@@ -10,144 +12,162 @@ class VolPlugin:
         self.extra_flags = kwargs.get('extra_flags', None)
         self.splunk_output = kwargs.get('splunk_output', True)
         self.json_output = kwargs.get('json_output', False)
-        self.timeout = volatility_default_timeout
+        # Seconds, None for no limit
+        self.timeout = kwargs.get('timeout', volatility_default_timeout)
+        # Name of the in-process implementation (see volatility_worker/core/native_plugins.py), None for Volatility
+        self.native = kwargs.get('native', None)
+        # Options for native plugins
+        self.options = kwargs.get('options', dict())
+        # Output file compression: 'gzip', 'lzma' or None
+        self.compression = kwargs.get('compression', output_compression)
+        # Seconds, estimated from the pool tag prescan for pool scanners; None if unknown
+        self.estimated_runtime = None
 
 
-class BasePluginsConfigs:
-    def __init__(self, vol_worker):
-        # vol_worker is used to access details like case id, folder, profile etc.
-        self.worker = vol_worker
-        self.default_active_plugins = BasePlugins().active_plugins
+# Options for plug-ins shipped with default Volatility
+# 'extra_flags' are plug-in specific options.  Default: None
+# 'json_output' run the plug-in with JSON output.  Default: False
+# 'splunk_output' Should the plugin output be written to Splunk.  Subjected to SPLUNK_OUTPUT_MAX
+# if SPLUNK_OUTPUT is set to "Auto".  Non Splunk-SIEMs can simply ingest from plugins output folder.
+# 'native' / 'options' in-process implementation of the plug-in and its options (see core/native_plugins.py)
+# 'compression' of the output files: 'gzip', 'lzma' or None.  Default: 'output_compression' in 'defaults.py'
+# 'timeout' in seconds, None for no limit.  Default: 'volatility_default_timeout' in 'vol_config.py'
+# Paths are templates resolved for each memory image: '{dir}' is the plug-in's own output folder and '{output}' the
+# image's plugins output folder.  Output folders are created only for plug-ins that run.
+#
+# See https://github.com/volatilityfoundation/volatility/wiki/Command-Reference
+#
+PLUGINS_CONFIG = {
+    'dumpcerts': {'extra_flags': "--dump-dir {dir}", 'splunk_output': False},
+    'dlldump': {'extra_flags': "--dump-dir {dir}", 'splunk_output': False},
+    'dumpfiles': {'extra_flags': "--dump-dir {dir} --summary-file {dir}/summary.txt", 'splunk_output': True},
+    'dumpregistry': {'extra_flags': "--dump-dir {dir}", 'splunk_output': True},
+    'evtlogs': {'extra_flags': "--dump-dir {dir}"},
+    'filescan': {'splunk_output': False, 'compression': 'lzma'},
+    'handles': {'splunk_output': False, 'compression': 'lzma'},
+    'malfind': {'extra_flags': "--dump-dir {dir}"},
+    'memdump': {'extra_flags': "--dump-dir {dir}"},
+    # set for mactime - https://volatility-labs.blogspot.com/2013/05/movp-ii-23-creating-timelines-with.html
+    'mftparser': {'extra_flags': "--output=body --output-file {dir}/mftparser.txt", 'splunk_output': False},
+    'moddump': {'extra_flags': "--dump-dir {dir}", 'splunk_output': False},
+    'mutantscan': {'extra_flags': "--silent"},
+    # JSON rows for the image diff ('diff_plugins' in 'defaults.py'); the text output has no column rule
+    'netscan': {'json_output': True},
+    'procdump': {'extra_flags': "--dump-dir {dir}"},
+    'screenshot': {'extra_flags': "--dump-dir {dir}", 'splunk_output': False},
+    # set for mactime - https://volatility-labs.blogspot.com/2013/05/movp-ii-23-creating-timelines-with.html
+    'shellbags': {'extra_flags': "--output body --output-file {dir}/shellbags.txt", 'splunk_output': False},
+    'ssdt': {'splunk_output': False},
+    # JSON rows for the image diff ('diff_plugins' in 'defaults.py'); the text output is not a table
+    'svcscan': {'json_output': True},
+    # set for mactime - https://volatility-labs.blogspot.com/2013/05/movp-ii-23-creating-timelines-with.html
+    'timeliner': {'extra_flags': "--output body --output-file {dir}/timeliner.txt", 'splunk_output': False},
+    'verinfo': {'splunk_output': False},
+    'vadinfo': {'splunk_output': False},
+    'vadwalk': {'splunk_output': False},
+    'vadtree': {'splunk_output': False},
+    'vaddump': {'extra_flags': "--dump-dir {dir}", 'splunk_output': False},
+    # Strings are extracted natively, then mapped to processes by Volatility's 'strings' plugin
+    'strings': {'native': 'strings' if native_strings else None, 'splunk_output': False,
+                'timeout': strings_timeout, 'options': {'output': "{dir}/strings_offsets.txt"}},
+    # Native IOC scanner, see volatility_worker/core/ioc_scan.py
+    'iocscan': {'native': 'ioc_scan', 'options': {'patterns': ioc_pattern_files}},
+    # 'mactime' should be run after 'mftparser', 'shellbags' and 'timeliner' plugins have run
+    'mactime': {'extra_flags': "--mftparser_body={output}/mftparser/mftparser.txt "
+                               "--shellbags_body={output}/shellbags/shellbags.txt "
+                               "--timeliner_body={output}/timeliner/timeliner.txt "
+                               "--mactime_output={dir}/mactime.txt",
+                'splunk_output': False,
+                'native': 'timeline' if native_mactime else None,
+                'options': {'bodies': ["{output}/mftparser/mftparser.txt",
+                                       "{output}/shellbags/shellbags.txt",
+                                       "{output}/timeliner/timeliner.txt"],
+                            'output': "{dir}/mactime.txt",
+                            'date_range': mactime_date_range}
+                },
+}
 
-        # Options for plug-ins shipped with default Volatility
-        # 'extra_flags' are plug-in specific options.  Default: None
-        # 'output_format' format of plug-in output. Default: Text
-        # 'timeout' how long the plugin should run before timing out.  Default: 300 seconds
-        # 'splunk_output' Should the plugin output be written to Splunk.  Subjected to SPLUNK_OUTPUT_MAX
-        # if SPLUNK_OUTPUT is set to "Auto".  Non Splunk-SIEMs can simply ingest from plugins output folder.
-        self.all_plugins_config = dict({
-            #
-            # See https://github.com/volatilityfoundation/volatility/wiki/Command-Reference
-            #
-            'dumpcerts': VolPlugin('dumpcerts',
-                                   **{'extra_flags': "--dump-dir %s" % self._make_plugin_output_dir('dumpcerts'),
-                                      'splunk_output': False
-                                      }),
-            'dlldump': VolPlugin('dlldump', **{'splunk_output': False,
-                                               'extra_flags': "--dump-dir %s"
-                                                              % self._make_plugin_output_dir('dlldump')
-                                               }),
-            'dumpfiles': VolPlugin('dumpfiles', **{'splunk_output': True,
-                                                   'extra_flags': "--dump-dir %s --summary-file %s" %
-                                                                  (self._make_plugin_output_dir('dumpfiles'),
-                                                                   self._make_plugin_output_file('dumpfiles',
-                                                                                                 'summary.txt'))
-                                                   }),
-            'dumpregistry': VolPlugin('dumpregistry', **{'splunk_output': True,
-                                                         'extra_flags': "--dump-dir %s"
-                                                                        % self._make_plugin_output_dir('dumpregistry')
-                                                         }),
-            'evtlogs': VolPlugin('evtlogs',
-                                 **{'extra_flags': "--dump-dir %s" % self._make_plugin_output_dir('evtlogs')
-                                    }),
-            'filescan': VolPlugin('filescan', **{'splunk_output': False}),
-            'handles': VolPlugin('handles', **{'splunk_output': False}),
-            'malfind': VolPlugin('malfind',
-                                 **{'extra_flags': "--dump-dir %s" % self._make_plugin_output_dir('malfind')
-                                    }),
-            'memdump': VolPlugin('memdump',
-                                 **{'extra_flags': "--dump-dir %s" % self._make_plugin_output_dir('memdump')
-                                    }),
-            # set for mactime - https://volatility-labs.blogspot.com/2013/05/movp-ii-23-creating-timelines-with.html
-            'mftparser': VolPlugin('mftparser', **{'splunk_output': False,
-                                                   'extra_flags': "--output=body --output-file %s"
-                                                                  % self._make_plugin_output_file('mftparser',
-                                                                                                  'mftparser.txt')
-                                                   }),
-            'moddump': VolPlugin('moddump', **{'splunk_output': False,
-                                               'extra_flags': "--dump-dir %s"
-                                                              % self._make_plugin_output_dir('moddump')
-                                               }),
-            'mutantscan': VolPlugin('mutantscan', **{'extra_flags': "--silent"}),
-            'procdump': VolPlugin('procdump',
-                                  **{'extra_flags': "--dump-dir %s" % self._make_plugin_output_dir('procdump')
-                                     }),
-            'screenshot': VolPlugin('screenshot',
-                                    **{'extra_flags': "--dump-dir %s" % self._make_plugin_output_dir('screenshot'),
-                                       'splunk_output': False
-                                       }),
-            # set for mactime - https://volatility-labs.blogspot.com/2013/05/movp-ii-23-creating-timelines-with.html
-            'shellbags': VolPlugin('shellbags', **{'splunk_output': False,
-                                                   'extra_flags': "--output body --output-file %s"
-                                                                  % self._make_plugin_output_file('shellbags',
-                                                                                                  'shellbags.txt')
-                                                   }),
-            'ssdt': VolPlugin('ssdt', **{'splunk_output': False}),
-            # set for mactime - https://volatility-labs.blogspot.com/2013/05/movp-ii-23-creating-timelines-with.html
-            'timeliner': VolPlugin('timeliner', **{'splunk_output': False,
-                                                   'extra_flags': "--output body --output-file %s"
-                                                                  % self._make_plugin_output_file('timeliner',
-                                                                                                  'timeliner.txt')
-                                                   }),
-            'verinfo': VolPlugin('verinfo', **{'splunk_output': False}),
-            'vadinfo': VolPlugin('vadinfo', **{'splunk_output': False}),
-            'vadwalk': VolPlugin('vadwalk', **{'splunk_output': False}),
-            'vadtree': VolPlugin('vadtree', **{'splunk_output': False}),
-            'vaddump': VolPlugin('vaddump', **{'splunk_output': False,
-                                               'extra_flags': "--dump-dir %s" % self._make_plugin_output_dir('vaddump')
-                                               }),
-            # 'mactime' should be run after 'mftparser', 'shellbags' and 'timeliner' plugins have run
-            'mactime': VolPlugin(
-                'mactime', **{'extra_flags': "--mftparser_body=%s --shellbags_body=%s --timeliner_body=%s --mactime_output=%s"
-                                             % (self._make_plugin_output_file('mftparser', 'mftparser.txt'),
-                                                self._make_plugin_output_file('shellbags', 'shellbags.txt'),
-                                                self._make_plugin_output_file('timeliner', 'timeliner.txt'),
-                                                self._make_plugin_output_file('mactime', 'mactime.txt')),
-                              'splunk_output': False
-                              }),
-        })
+# Options accepted in PLUGINS_CONFIG and in the case override 'plugins_configs'
+PLUGIN_OPTIONS = ('extra_flags', 'splunk_output', 'json_output', 'native', 'options', 'compression', 'timeout')
 
-        # defaults for plugins not explicitly configured in all_plugins_config
-        for plugin in self.default_active_plugins:
-            if plugin not in self.all_plugins_config.keys():
-                self.all_plugins_config[plugin] = VolPlugin(plugin)
 
-    def _make_plugin_output_dir(self, plugin):
-        """
-        Sometimes plugins create artifacts on disk.  This function allows us to create a folder specific to the
-        case and memory image in the outputs folder.
-        :param plugin: volatility plugin name
-        :return: path to plugin output folder
-        """
-        p_dir = Path.joinpath(self.worker.plugins_output_dir, plugin)
-        if p_dir.exists() is False:
-            p_dir.mkdir(parents=True)
+def _resolve(value, **paths):
+    """
+    Substitute path templates in strings, recursing into lists and dicts.
+    """
+    if isinstance(value, str):
+        return value.format(**paths)
+    if isinstance(value, (list, tuple)):
+        return [_resolve(item, **paths) for item in value]
+    if isinstance(value, dict):
+        return {k: _resolve(v, **paths) for k, v in value.items()}
+    return value
+
+
+def compile_plugins_config(plugins_config, templates=True):
+    """
+    Validate plugin configurations.  Done once, when this module is imported (and when a case override file is
+    loaded), so mistakes surface before processing an image rather than half way through.
+    :param plugins_config: dict of plugin name: options
+    :param templates: check path templates.  Case override options are used as-is, without templates.
+    :return: plugins_config
+    """
+    if not isinstance(plugins_config, dict):
+        raise ValueError("Plugin configurations must be a dict of plugin name: options.")
+    for plugin, options in plugins_config.items():
+        if not isinstance(options, dict):
+            raise ValueError("Options for plugin '%s' must be a dict." % plugin)
+        unknown = set(options.keys()).difference(PLUGIN_OPTIONS)
+        if len(unknown) > 0:
+            raise ValueError("Unknown option(s) %s for plugin '%s'." % (sorted(unknown), plugin))
+        if options.get('compression', None) not in (None, 'gzip', 'lzma'):
+            raise ValueError("Unknown compression '%s' for plugin '%s'." % (options['compression'], plugin))
+        timeout = options.get('timeout', None)
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float))
+                                    or timeout <= 0):
+            raise ValueError("Invalid timeout '%s' for plugin '%s'." % (timeout, plugin))
+        if not templates:
+            continue
+        try:
+            _resolve(options, dir='', output='')
+        except (KeyError, IndexError, ValueError) as _err:
+            raise ValueError("Invalid path template for plugin '%s': %s" % (plugin, _err))
+    return plugins_config
 
-        if p_dir.exists() and p_dir.is_dir():
-            return p_dir.as_posix()
-        else:
-            return self.worker.plugins_output_dir
 
-    def _make_plugin_output_file(self, plugin, file_name):
+PLUGINS_CONFIG = compile_plugins_config(PLUGINS_CONFIG)
+
+
+class BasePluginsConfigs:
+    def __init__(self, vol_worker):
+        # vol_worker is used to access details like case id, folder, profile etc.
+        self.worker = vol_worker
+
+    def plugin_config(self, plugin, options=None):
         """
-        Sometimes plugins create artifacts on disk.  This function allows us to create a folder specific to the
-        case and memory image in the outputs folder.
+        Configuration of a plugin for this memory image.
         :param plugin: volatility plugin name
-        :return: path to plugin output folder
+        :param options: plugin options used as-is (i.e. from a case override file).  Default: the PLUGINS_CONFIG
+        entry with path templates resolved; plugins not in PLUGINS_CONFIG use defaults.
+        :return: VolPlugin
         """
-        p_dir = Path(self._make_plugin_output_dir(plugin))
-        return Path.joinpath(p_dir, file_name).as_posix()
+        if options is not None:
+            return VolPlugin(plugin, **options)
+        options = PLUGINS_CONFIG.get(plugin, dict())
+        output_dir = Path(self.worker.plugins_output_dir)
+        return VolPlugin(plugin, **_resolve(options,
+                                            dir=Path.joinpath(output_dir, plugin).as_posix(),
+                                            output=output_dir.as_posix()))
 
     def get_active_plugins_configs(self, plugins=None):
         """
         Default configurations for Activated plugins or specified plugins
-        :param plugins: iterable with plugin names
+        :param plugins: iterable with plugin names, default: active plugins in 'base_plugins.py'
         :return: dict of configurations
         """
         # Beyond some common plugin flags (-f, --profile etc.), there could be any number of arbitrary flags.
         # These flags can be specified in 'base_plugins_configs.py'
         # or at a Case ID level using the override config file.
-        active_plugins_config = OrderedDict({plugin: self.all_plugins_config[plugin] for plugin in plugins
-                                             if plugin in self.all_plugins_config.keys()})
-
-        return active_plugins_config
+        if plugins is None:
+            plugins = get_base_plugins().active_plugins
+        return OrderedDict((plugin, self.plugin_config(plugin)) for plugin in plugins)
@@ -4,6 +4,21 @@ import re
 
 # Default log level
 log_level = "INFO"
+# Write logs from a background thread (QueueHandler/QueueListener) instead of the worker threads
+async_logging = True
+
+# Profile the daemon's hot paths (worker runs, result storage, Volatility commands, watchdog callbacks) with cProfile
+# and tracemalloc, writing snapshots of the top functions and allocation sites to 'profiling_dir' every
+# 'profiling_interval' seconds.  Can also be toggled at run time with SIGUSR1.  Nothing is patched while disabled.
+profiling = False
+profiling_interval = 300
+profiling_top = 30
+profiling_dir = Path.joinpath(Path(__file__).resolve().parents[1], "logs")
+
+# Write a trace of each image (Chrome trace event format: chrome://tracing or https://ui.perfetto.dev) to the case
+# logs folder, with spans for file transfer, queueing, image load, profile identification, archiving, plugins,
+# result storage and Splunk on the threads and processes that ran them.
+trace_jobs = True
 
 enable_splunk_integration = False
 splunk_config = {'host': 'localhost',
@@ -28,6 +43,41 @@ memdumps = Path.joinpath(Path(__file__).resolve().parents[1], "memdumps")
 MONITORED_FOLDERS = [Path(memdumps.as_posix())]
 #MONITORED_FOLDERS = [Path(r'/var/tmp/memdumps')]
 
+# Multi-node processing.  Nodes monitoring the same (shared) folders claim images using lease files in 'lease_dir'
+# so each image is processed by a single node.  Leases are renewed every 'lease_heartbeat_interval' seconds; leases
+# not renewed within 'lease_ttl' seconds (i.e. dead node) are reclaimed by other nodes.
+distributed_mode = False
+lease_dir = Path.joinpath(MONITORED_FOLDERS[0], '.leases')
+lease_ttl = 300
+lease_heartbeat_interval = 60
+# Unique node name.  Default (None): hostname:pid
+node_id = None
+
+# Memory-aware admission control for concurrent image processing.  Images are processed concurrently while their
+# estimated memory footprint fits in available memory (/proc/meminfo).  Footprints are learnt per plugin from
+# previous runs: baseline ('min_job_memory_bytes') + ratio * image size.  False processes one image at a time
+# (no memory checks, so no concurrency either).
+admission_control = True
+# Memory kept free for the OS and other services
+memory_headroom_bytes = 2 * 1024 ** 3
+# Estimated memory per byte of image size for plugins without history
+default_memory_ratio = 0.25
+# Baseline memory of a Volatility process, regardless of image size
+min_job_memory_bytes = 512 * 1024 ** 2
+# Upper limit on concurrent jobs, regardless of available memory.  Only applies with 'admission_control'.
+max_concurrent_jobs = 8
+# Plugins of the same tier run concurrently per image.  Memory estimates scale with it.
+plugin_workers = 1
+# Address space limit (RLIMIT_AS) of each Volatility process as a multiple of its estimated footprint.  None disables.
+child_memory_limit_factor = 4
+# A Volatility process using more than its estimated footprint is killed (keeping its output so far as a partial
+# result) when available memory drops below this.  None disables.
+memory_pressure_kill_bytes = 512 * 1024 ** 2
+# CPU time limit (RLIMIT_CPU) of each Volatility process, in seconds.  None disables.
+child_cpu_limit_seconds = None
+# Per-plugin memory history
+admission_history_file = Path.joinpath(Path(__file__).resolve().parents[1], "logs", "admission_history.json")
+
 # File extensions of memory dumps.
 # hpak format is auto-extracted to *.raw using 'hpakextract' plugin
 MEM_DUMP_FILE_PATTERN = ["*.hpak", "*.vmem", "*.dump", "*.img", "*.dmp", "*.raw"]
@@ -38,9 +88,118 @@ AUTO_EXTRACT_SUFFIX = "vol"
 # Clean-up converted memory dumps (*.vol) following successful execution.
 extracted_mem_dump_cleanup = True
 
+# Cache converted memory dumps (*.vol) instead of deleting and re-extracting them on every run.
+# Cached images are keyed by source image fingerprint and evicted least-recently-used once the cache exceeds
+# 'converted_image_cache_max_bytes'.  Images in use by an active job are never evicted.
+# When enabled, 'extracted_mem_dump_cleanup' does not apply to cached images.
+converted_image_cache = False
+converted_image_cache_dir = Path.joinpath(Path(__file__).resolve().parents[1], "cache", "converted")
+converted_image_cache_max_bytes = 50 * 1024 ** 3
+
+# Stage images to fast local scratch before processing (i.e. MONITORED_FOLDERS on NFS/SMB shares).  Each image is
+# copied once, as a sparse copy (zero-filled blocks are not written), and all plugins read the local copy; results
+# still go to the case folder.  Staged copies are evicted least-recently-used beyond 'image_staging_max_bytes' (disk
+# usage), except while in use.  Images larger than the budget are processed in place.
+image_staging = False
+image_staging_dir = Path.joinpath(Path(__file__).resolve().parents[1], "cache", "staging")
+image_staging_max_bytes = 200 * 1024 ** 3
+
+# Write plugin outputs ('--dump-dir' artifacts included) and the image log to local scratch, then publish them to
+# the case folder in bulk: each plugin output folder is copied in one pass under a temporary name and renamed into
+# place, so readers never see half-written outputs.  'output_publish': 'plugin' publishes each plugin's folder when
+# it completes (local copies are kept for dependent plugins until the image is done), 'image' publishes everything
+# once the image is done.  The image log is appended to the case log when the worker finishes.
+output_staging = False
+output_staging_dir = Path.joinpath(Path(__file__).resolve().parents[1], "cache", "outputs")
+output_publish = 'plugin'
+
+# Content-addressed store for artifacts extracted by '--dump-dir' plugins.  Artifacts are hashed (SHA-256), stored
+# once and the per-image copies are replaced with hardlinks.  Must be on the same file system as the case folders.
+# None disables.
+dedup_store_dir = None
+dedup_plugins = ['dlldump', 'procdump', 'moddump', 'dumpfiles', 'dumpregistry', 'evtlogs']
+dedup_workers = 4
+
+# Parse Volatility's fixed-width text tables into structured rows (saved as <plugin>.json next to <plugin>.txt, sent
+# to Splunk and the results database like JSON output), so plugins need not run in JSON mode.
+parse_text_tables = True
+
+# Plugin outputs (<plugin>.txt / .json, native timeline CSV) are written through streaming compression: 'gzip', 'lzma'
+# or None for plain files.  Plugins can select their own with the 'compression' option in 'base_plugins_configs.py'.
+# Read them with volatility_worker.core.compressed_output (open_result(), or the CLI: python -m
+# volatility_worker.core.compressed_output <plugin>.txt).  Files written by Volatility itself are not compressed.
+output_compression = 'gzip'
+
+# Once an image is processed, diff its structured results against the previously processed image of the case.
+# Reports: <case dir>/<case_output_dir>/diffs/<previous image>__<image>/<plugin>.json.  'key' columns identify a row
+# (rows with the same key but other differences are 'changed'); 'ignore' columns are left out of the comparison.
+diff_reports = False
+# Also send the added/removed/changed rows to the Splunk results index
+diff_to_splunk = False
+diff_plugins = {'pslist': {'key': ['PID', 'Name', 'Start'], 'ignore': ['Offset(V)', 'Thds', 'Hnds']},
+                'modules': {'key': ['Name', 'File'], 'ignore': ['Offset(V)']},
+                'svcscan': {'key': ['ServiceName'], 'ignore': ['Offset', 'Order']},
+                'netscan': {'key': ['Proto', 'LocalAddr', 'ForeignAddr', 'PID'], 'ignore': ['Offset(P)']}}
+
+# Native multi-pattern IOC scanner ('iocscan' plugin, run when pattern files are set).  Pattern files list one IOC
+# per line: strings (matched as ASCII and UTF-16LE), 'utf16:<text>' or 'hex:<bytes>'.  Install 'pyahocorasick' for
+# the Aho-Corasick matcher; otherwise a regular expression is used.
+ioc_pattern_files = []
+ioc_scan_workers = 4
+ioc_scan_chunk_size = 64 * 1024 ** 2
+# Hits reported per pattern (per chunk); None for all
+ioc_scan_max_hits = 1000
+
+# Native strings extraction (vectorised with 'numpy' if installed) feeding Volatility's 'strings' plugin, which maps
+# each string to the processes / kernel memory containing it.  Enables 'strings'.  The mapping only runs for raw
+# images (file offsets are physical addresses); crash dumps and other formats only get the strings file.
+native_strings = False
+strings_min_length = 4
+# Longer strings are truncated
+strings_max_length = 1024
+strings_workers = 4
+strings_chunk_size = 64 * 1024 ** 2
+# Seconds for Volatility's mapping of the strings (millions of lines on large images); None for no limit
+strings_timeout = 6 * 3600
+
+# Native pool tag prescan, before the first tier after triage running pool scanners (triage never waits for it): one
+# parallel pass over the image counts the pool tags of Volatility's pool scanners
+# ('psscan', 'filescan', 'mutantscan', ...) and saves a tag -> offsets index beside the image ('<image>.pooltags').
+# Scanners without a single tag hit are not run.  Images with fewer than 'pool_prescan_min_hits' hits in total are
+# probably in a format hiding pool memory (i.e. compressed hibernation files); nothing is skipped for them.
+pool_prescan = True
+pool_prescan_workers = 4
+pool_prescan_chunk_size = 64 * 1024 ** 2
+pool_prescan_min_hits = 1000
+# Rough pool scanner runtime estimate: bytes scanned per second, plus seconds per tag hit.  Parallel plugin workers
+# start the longest scanners first.
+pool_scan_rate = 100 * 1024 ** 2
+pool_scan_hit_seconds = 0.001
+# Run the pool scanners of a tier ('psscan', 'thrdscan', 'filescan', 'mutantscan', 'driverscan', 'symlinkscan',
+# 'modscan', 'sockscan', 'connscan') in a single pass over the image with the 'multiscan' plugin (vol_plugins), then
+# split its output per scanner.  Scanner options ('extra_flags') are shared by the combined run.
+multiscan_pool_scanners = True
+
+# Per-case SQLite database of structured (JSON output or parsed text table) plugin results, one table per plugin with an 'image' column:
+# <case dir>/<case_output_dir>/<CASE_ID>.sqlite.  Columns listed in 'results_db_pivots' are indexed.
+results_db = False
+results_db_pivots = ['pid', 'ppid', 'name', 'process', 'imagefilename', 'owner', 'localaddr', 'foreignaddr', 'path',
+                     'fullpath', 'filename', 'commandline']
+
 # How long to wait for file transfer to complete
 file_transfer_timeout = 600
 
+# Local HTTP API of the watchdog daemon (i.e. for a SOAR platform): submit images already on disk straight into the
+# scheduler (no transfer wait), poll job status, per-plugin progress and result locations, and stream progress
+# events.  See volatility_worker/core/api.py.  Listens on 'api_host' only; keep it on the loopback interface.
+api_enabled = False
+api_host = '127.0.0.1'
+api_port = 8765
+# Required as 'Authorization: Bearer <token>' when set
+api_token = None
+# Finished jobs kept for status queries
+api_job_history = 1000
+
 # Regex to identify task folders
 case_dir_filter = re.compile('^SIR[0-9]{6,8}', re.I)
 # Directories created in each task folder
@@ -53,6 +212,19 @@ case_archive_dir = 'archives'
 case_processed_flag = '.processed'
 
 
+# Generate the 'mactime' timeline natively (sorted and merged in Python) instead of running the Perl 'mactime'.
+native_mactime = True
+# Only include timeline events within this UTC date range, i.e. '2019-01-01..2019-01-31'.  None includes everything.
+mactime_date_range = None
+# Timeline events sorted in memory at once; larger inputs are sorted in chunks and merged from disk.
+timeline_sort_chunk = 1000000
+# Also write the timeline as sorted binary records with a time-bucket index ('mactime.bin', 'mactime.idx') for fast
+# time-window and path queries: python -m volatility_worker.core.timeline_index <mactime.bin> --start --end --path
+timeline_index = True
+# Width of a timeline index bucket, in seconds
+timeline_index_bucket = 60
+
+
 #
 # Volatility Profile
 #
@@ -13,7 +13,8 @@ else:
 
 # --plugins=PLUGINS     Additional plugin directories to use (colon separated)
 # Paths must be absolute (https://volatilevirus.home.blog/2018/09/06/writing-plugins-for-volatility/)
-VOLATILITY_CONTRIB_PLUGINS = r'%s' % Path.joinpath(Path(__file__).resolve().parents[1], "vol_plugins").as_posix()
+VOLATILITY_CONTRIB_PLUGINS = r'%s' % Path.joinpath(Path(__file__).resolve().parents[1],
+                                                   "volatility_worker", "vol_plugins").as_posix()
 
 # Timeout for volatility sub-process commands
 # This timeout can be overridden at plugin level (global and per-plugin)
@@ -1,4 +1,5 @@
 from ordered_set import OrderedSet
+from collections import OrderedDict
 from pathlib import Path
 #
 # This is a template for the Case-level override configuration file.
@@ -25,3 +26,13 @@ active_plugins.update(limited_plugins_group)
 #                },
 #    'dumpregistry': {'splunk_output': False}
 #})
+
+# Custom plugin tiers (see 'plugin_tiers' in configs/base_plugins.py).  None collects all remaining active plugins.
+#plugin_tiers = OrderedDict([('triage', ['pslist', 'netscan']),
+#                            ('deep', None),
+#                            ('post', ['mactime'])])
+
+# Fair-share scheduling across case IDs.  'case_weight' is this case's share of job dispatches relative to other
+# cases (default 1), 'case_max_concurrency' caps the number of this case's images processed at once (default: no cap).
+#case_weight = 2
+#case_max_concurrency = 2
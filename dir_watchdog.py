@@ -1,18 +1,24 @@
 # -*- coding: utf-8 -*-
 import time
+import atexit
 from pathlib import Path
 from datetime import datetime
 from watchdog.observers import Observer
 from watchdog.events import PatternMatchingEventHandler
 from configs.defaults import MEM_DUMP_FILE_PATTERN, MONITORED_FOLDERS, \
-    log_level, enable_splunk_integration, splunk_config, case_output_dir, AUTO_EXTRACT_SUFFIX, case_processed_flag, \
-    file_transfer_timeout
+    log_level, enable_splunk_integration, splunk_config, case_output_dir, AUTO_EXTRACT_SUFFIX, \
+    file_transfer_timeout, distributed_mode, lease_dir, lease_ttl, lease_heartbeat_interval, node_id, async_logging, \
+    api_enabled
 from volatility_worker.core.utils import whoami, set_default_logger, add_logger_filehandler, \
-    add_logger_streamhandler, add_logger_splunkhandler, file_transfer_complete
-from volatility_worker.core.exceptions import *
-from volatility_worker.core.vol_worker import VolWorker
-
-JOBS_QUEUE = list()
+    add_logger_streamhandler, add_logger_splunkhandler, file_transfer_complete, start_queue_listener, \
+    stop_queue_listener
+from volatility_worker.core.lease import LeaseManager
+from volatility_worker.core.admission import get_admission_controller
+from volatility_worker.core.scheduler import JobScheduler, run_job_tier
+from volatility_worker.core.profiling import install_profiling
+from volatility_worker.core.tracing import get_trace, pop_trace
+from volatility_worker.core.api import ApiServer
+from volatility_worker.core.ioc_scan import shutdown_pools
 
 logger = set_default_logger('root')
 _format = "%(asctime)s  %(levelname)s  %(module)s  %(message)s"
@@ -28,6 +34,15 @@ if enable_splunk_integration:
     except Exception as err:
         logger.warning("Failed to add Splunk log handler. %s" % err)
 
+if async_logging:
+    start_queue_listener(logger)
+    # Flush queued records on exit
+    atexit.register(stop_queue_listener, logger)
+
+# Image claiming across nodes sharing the monitored folders
+LEASES = LeaseManager(lease_dir, ttl=lease_ttl, heartbeat_interval=lease_heartbeat_interval,
+                      node_id=node_id, logger=logger) if distributed_mode else None
+
 
 class DirectoryMonitor:
     def __init__(self, directory_to_watch):
@@ -40,21 +55,26 @@ class DirectoryMonitor:
         logger.info({'_action': whoami(),
                      'message': "Start monitoring %s" % self.directory_to_watch})
         self.observer.start()
+        if LEASES is not None:
+            LEASES.start_heartbeat()
         try:
             while True:
-                logger.debug("Current Queue Length: %d" % len(JOBS_QUEUE))
-                while len(JOBS_QUEUE) > 0:
-                    exit_code = threader()
-                    if exit_code == 0:
-                        logger.info("Job successful")
-                    else:
-                        logger.warning("Job unsuccessful")
-
-                time.sleep(35)
+                if LEASES is not None:
+                    reclaim_expired_leases()
+                logger.debug("Current Queue Length: %d, Running Jobs: %d" % (len(SCHEDULER),
+                                                                             len(SCHEDULER.running())))
+                SCHEDULER.dispatch()
+
+                # Re-check admission sooner while work is waiting
+                time.sleep(5 if len(SCHEDULER) > 0 else 35)
         except KeyboardInterrupt:
             logger.info({'_action': whoami(),
                          'message': "End monitoring %s" % self.directory_to_watch})
             self.observer.stop()
+            if LEASES is not None:
+                LEASES.stop_heartbeat()
+            # IOC scanner pool processes are kept between images
+            shutdown_pools()
 
         self.observer.join()
 
@@ -75,9 +95,9 @@ class Handler(PatternMatchingEventHandler):
         # Ignore newly created files as a result of running Volatility plugsins (such as .dmp by memorydump plugin)
         # Ignore memory image extracted from non-standard format (i.e output created by hpackextract)
         if (event.src_path.count(case_output_dir) == 0) or (event.src_path.endswith(".%s" % AUTO_EXTRACT_SUFFIX)):
-            JOBS_QUEUE.append(event)
+            SCHEDULER.submit(event.src_path)
             logger.info({'_action': whoami(),
-                         'message': "Queue length: %d" % len(JOBS_QUEUE),
+                         'message': "Queue length: %d" % len(SCHEDULER),
                          'details': {'path': event.src_path,
                                      'type': event.event_type}
                          })
@@ -96,8 +116,14 @@ class Handler(PatternMatchingEventHandler):
                                  'timeout': file_transfer_timeout}
                      })
 
+        s_time = time.time()
         if file_transfer_complete(event.src_path, file_transfer_timeout):
+            e_time = time.time()
             self.process(event)
+            # Only images queued for processing get a trace
+            trace = get_trace(event.src_path) if SCHEDULER.contains(event.src_path) else None
+            if trace is not None:
+                trace.add('file transfer wait', s_time, e_time, 'io')
         else:
             logger.error({'_action': whoami(),
                           'message': "File transfer failure.  Skipping %s" % event.src_path,
@@ -110,87 +136,73 @@ class Handler(PatternMatchingEventHandler):
         :param event: watchdog event
         :return: none
         """
-        for _job in JOBS_QUEUE:
-            if _job.src_path == event.src_path:
-                logger.info({'_action': whoami(),
-                             'message': "File is already in queue.",
-                             'details': {'path': event.src_path,
-                                         'type': event.event_type}
-                             })
-                return
+        if SCHEDULER.contains(event.src_path):
+            logger.info({'_action': whoami(),
+                         'message': "File is already in queue.",
+                         'details': {'path': event.src_path,
+                                     'type': event.event_type}
+                         })
+            return
 
         self.on_created(event)
 
     def on_moved(self, event):
-        _q_len = len(JOBS_QUEUE)
-        for _job in JOBS_QUEUE:
-            if _job.src_path == event.src_path:
-                JOBS_QUEUE.pop(JOBS_QUEUE.index(_job))
-                logger.info({'_action': whoami(),
-                             'message': "Removing moved file from queue.  Queue length changed from %d to %d."
-                                        % (_q_len, len(JOBS_QUEUE)),
-                             'details': {'path': event.src_path,
-                                         'type': event.event_type}
-                             })
+        _q_len = len(SCHEDULER)
+        if SCHEDULER.remove(event.src_path):
+            pop_trace(event.src_path)
+            logger.info({'_action': whoami(),
+                         'message': "Removing moved file from queue.  Queue length changed from %d to %d."
+                                    % (_q_len, len(SCHEDULER)),
+                         'details': {'path': event.src_path,
+                                     'type': event.event_type}
+                         })
         self.process(event)
 
     def on_deleted(self, event):
-        _q_len = len(JOBS_QUEUE)
-        for _job in JOBS_QUEUE:
-            if _job.src_path == event.src_path:
-                JOBS_QUEUE.pop(JOBS_QUEUE.index(_job))
-                logger.info({'_action': whoami(),
-                             'message': "Removing deleted file from queue.  Queue length changed from %d to %d."
-                                        % (_q_len, len(JOBS_QUEUE)),
-                             'details': {'path': event.src_path,
-                                         'type': event.event_type}
-                             })
-
-
-def threader():
-    w = JOBS_QUEUE.pop()
-    logger.info({'_action': whoami(),
-                 'message': "Starting worker thread for %s" % w.src_path})
-    try:
-        worker = VolWorker(w.src_path)
-        worker.run()
-    except CaseFolderNotFound as _err:
-        logger.error({'_action': whoami(),
-                      'message': "Unable to determine case ID. Skipping.",
-                      'errors': [str(_err)]})
-    except PreviouslyProcessed as _err:
-        logger.warning({'_action': whoami(),
-                        'message': "Previously processed case %s. Remove %s to re-process."
-                                   % (Path(w.src_path).name, case_processed_flag),
-                        'details': [str(_err)]
-                        })
-        return 0
-    except MemoryImageLoadFailure as _err:
-        logger.error({'_action': whoami(),
-                      'message': "Unable to load image. Skipping.",
-                      'details': {'path': w.src_path},
-                      'errors': [str(_err)]})
-    except MemoryImageProfileFailure:
-        logger.error({'_action': whoami(),
-                      'message': "Unable to determine profile. Terminating.",
-                      'details': {'path': w.src_path}
-                      })
-    except OverrideConfigFailure as _err:
-        logger.error({'_action': whoami(),
-                      'message': "Override configuration import failed.",
-                      'errors': [str(_err)]})
-    except Exception as _err:
-        logger.warning({'_action': whoami(),
-                        'message': "Failed to process %s" % w.src_path,
-                        'details': {'path': w.src_path,
-                                    'error': str(_err)}
-                        })
-        return -1
-    else:
-        return 0
+        _q_len = len(SCHEDULER)
+        if SCHEDULER.remove(event.src_path):
+            pop_trace(event.src_path)
+            logger.info({'_action': whoami(),
+                         'message': "Removing deleted file from queue.  Queue length changed from %d to %d."
+                                    % (_q_len, len(SCHEDULER)),
+                         'details': {'path': event.src_path,
+                                     'type': event.event_type}
+                         })
+
+
+def reclaim_expired_leases():
+    """
+    Queue images whose leases expired, i.e. the node processing them died.
+    :return: None
+    """
+    for image_path in LEASES.reclaimable():
+        if SCHEDULER.submit(image_path) is not None:
+            logger.warning({'_action': whoami(),
+                            'message': "Queued image abandoned by another node.",
+                            'details': {'path': image_path}
+                            })
+
+
+def threader(job):
+    """
+    Run the next plugin tier of a job.  See run_job_tier().
+    :param job: scheduler Job
+    :return: exit code
+    """
+    return run_job_tier(job, logger, LEASES)
+
+
+# Queued images, run tier by tier with memory-aware admission
+SCHEDULER = JobScheduler(get_admission_controller(), threader, logger)
+
+# Opt-in profiling ('profiling' in 'defaults.py' or SIGUSR1)
+install_profiling(logger, [(Handler, name) for name in ('on_created', 'on_modified', 'on_moved', 'on_deleted')])
 
 
 if __name__ == '__main__':
+    # Local HTTP API ('api_enabled' in 'defaults.py')
+    if api_enabled:
+        ApiServer(SCHEDULER, logger).start()
     for monitored_folder in MONITORED_FOLDERS:
         d = DirectoryMonitor(monitored_folder.as_posix())
         d.run()
@@ -0,0 +1,68 @@
+import sys
+import pytest
+from volatility_worker.core import admission
+from volatility_worker.core.admission import AdmissionController, read_meminfo
+from volatility_worker.core.utils import run_command
+
+GB = 1024 ** 3
+MB = 1024 ** 2
+
+
+def controller(tmp_path, max_jobs=8, memory_checks=True, limit_factor=4):
+    return AdmissionController(tmp_path / 'history.json', headroom_bytes=1 * GB, default_ratio=0.25,
+                               min_bytes=512 * MB, max_jobs=max_jobs, limit_factor=limit_factor,
+                               memory_checks=memory_checks)
+
+
+def test_read_meminfo(tmp_path):
+    meminfo = tmp_path / 'meminfo'
+    meminfo.write_text("MemTotal:       16000000 kB\nMemAvailable:    8000000 kB\n")
+    assert read_meminfo(meminfo=meminfo.as_posix()) == 8000000 * 1024
+    assert read_meminfo('SwapTotal', meminfo=meminfo.as_posix()) is None
+
+
+def test_estimate_from_history(tmp_path):
+    ac = controller(tmp_path)
+    assert ac.estimate(4 * GB, ['pslist']) == 512 * MB + GB
+    ac.record_peak('pslist', 4 * GB, 512 * MB + 2 * GB)
+    assert ac.estimate(4 * GB, ['pslist']) > 512 * MB + GB
+    # History is persisted
+    assert controller(tmp_path).estimate(4 * GB, ['pslist']) == ac.estimate(4 * GB, ['pslist'])
+
+
+def test_admission_by_available_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(admission, 'read_meminfo', lambda *args, **kwargs: 6 * GB)
+    ac = controller(tmp_path)
+    # 1.5 GB per 4 GB image, 1 GB headroom
+    assert ac.try_admit('a', 4 * GB, ['pslist'])
+    assert ac.try_admit('b', 4 * GB, ['pslist'])
+    assert ac.try_admit('c', 4 * GB, ['pslist'])
+    assert not ac.try_admit('d', 4 * GB, ['pslist'])
+    ac.release('a')
+    assert ac.try_admit('d', 4 * GB, ['pslist'])
+
+
+def test_idle_host_always_admits_one_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(admission, 'read_meminfo', lambda *args, **kwargs: 1 * GB)
+    ac = controller(tmp_path)
+    assert ac.try_admit('a', 64 * GB, ['pslist'])
+    assert not ac.try_admit('b', 1 * MB, ['pslist'])
+
+
+def test_max_jobs(tmp_path):
+    ac = controller(tmp_path, max_jobs=1, memory_checks=False)
+    assert ac.try_admit('a', GB)
+    assert not ac.try_admit('b', GB)
+
+
+def test_child_memory_limit(tmp_path):
+    assert controller(tmp_path).child_memory_limit('pslist', 4 * GB) == 4 * (512 * MB + GB)
+    assert controller(tmp_path, limit_factor=None).child_memory_limit('pslist', 4 * GB) is None
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="RLIMIT_AS is POSIX only")
+def test_memory_limit_is_set_before_exec(tmp_path):
+    monitor = controller(tmp_path).child_monitor('pslist', 1 * GB)
+    proc = run_command([sys.executable, '-c', "import resource; print(resource.getrlimit(resource.RLIMIT_AS)[0])"],
+                       monitor=monitor)
+    assert int(proc.stdout) == monitor.memory_limit
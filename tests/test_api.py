@@ -0,0 +1,196 @@
+import json
+import logging
+import threading
+import urllib.request
+import urllib.error
+from collections import Counter
+import pytest
+from volatility_worker.core.api import ApiServer
+from volatility_worker.core.scheduler import JobScheduler
+
+TOKEN = 's3cret'
+
+
+class Admission:
+    def try_admit(self, job_key, image_size, plugins=None, parallel=1):
+        return True
+
+    def track(self, job_key):
+        pass
+
+    def release(self, job_key):
+        pass
+
+
+class StubWorker:
+    def __init__(self, job):
+        self.case_dir = job.case_dir
+        self.image_name = 'host'
+        self.plugins = {name: None for name in ('pslist', 'netscan')}
+        self.plugin_tiers = [('triage', ['pslist', 'netscan'])]
+        self.plugin_status = {name: 'pending' for name in self.plugins}
+        self.runtime_stats = Counter()
+        self.published_output_dir = job.case_dir / 'plugins_output' / 'host'
+        self.log_file = job.case_dir / 'logs' / 'host.log'
+        self.trace_file = job.case_dir / 'logs' / 'host.trace.json'
+
+
+@pytest.fixture
+def api(tmp_path):
+    proceed = threading.Event()
+
+    def runner(job):
+        # A single tier: pslist runs until the test lets it finish, then netscan has no output
+        job.clear_processed_flag()
+        job.worker = worker = StubWorker(job)
+        worker.plugin_status['pslist'] = 'running'
+        proceed.wait(10)
+        worker.published_output_dir.joinpath('pslist').mkdir(parents=True)
+        worker.runtime_stats['pslist'] = 3
+        worker.plugin_status['pslist'] = 'done'
+        worker.plugin_status['netscan'] = 'empty'
+        job.tier += 1
+        job.finished = True
+        return 0
+
+    scheduler = JobScheduler(Admission(), runner, logging.getLogger('test'))
+    server = ApiServer(scheduler, host='127.0.0.1', port=0, token=TOKEN, folders=[tmp_path / 'memdumps'],
+                       patterns=['*.raw', '*.dmp'])
+    server.start()
+    case_dir = tmp_path / 'memdumps' / 'SIR001234'
+    case_dir.mkdir(parents=True)
+    image = case_dir / 'host.raw'
+    image.write_bytes(b'\0' * 16)
+    yield server, image, proceed
+    proceed.set()
+    server.stop()
+
+
+def request(server, method, path, body=None, token=TOKEN):
+    req = urllib.request.Request("http://127.0.0.1:%d%s" % (server.port, path), method=method,
+                                 data=json.dumps(body).encode() if body is not None else None)
+    if token is not None:
+        req.add_header('Authorization', "Bearer %s" % token)
+    try:
+        with urllib.request.urlopen(req, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as _err:
+        return _err.code, json.loads(_err.read())
+
+
+def read_events(server, path):
+    req = urllib.request.Request("http://127.0.0.1:%d%s" % (server.port, path))
+    req.add_header('Authorization', "Bearer %s" % TOKEN)
+    events = []
+    with urllib.request.urlopen(req, timeout=10) as response:
+        assert response.headers['Content-Type'] == 'text/event-stream'
+        event = None
+        for line in response:
+            line = line.decode('utf-8').rstrip('\n')
+            if line.startswith('event: '):
+                event = line[len('event: '):]
+            elif line.startswith('data: '):
+                events.append((event, json.loads(line[len('data: '):])))
+                if event == 'end':
+                    break
+    return events
+
+
+def test_token_required(api):
+    server, _, _ = api
+    assert request(server, 'GET', '/health', token=None)[0] == 401
+    assert request(server, 'GET', '/health', token='wrong')[0] == 401
+    assert request(server, 'GET', '/health') == (200, {'queued': 0, 'running': 0})
+
+
+def test_submit_validation(api, tmp_path):
+    server, image, _ = api
+    assert request(server, 'POST', '/jobs', {})[0] == 400
+    assert request(server, 'POST', '/jobs', {'image_path': 'relative.raw'})[0] == 400
+    assert request(server, 'POST', '/jobs', {'image_path': (image.parent / 'missing.raw').as_posix()})[0] == 404
+
+    # Only image files in the monitored folders, as the watchdog would pick up
+    outside = tmp_path / 'SIR001234' / 'host.raw'
+    outside.parent.mkdir()
+    outside.write_bytes(b'\0' * 16)
+    assert request(server, 'POST', '/jobs', {'image_path': outside.as_posix()})[0] == 400
+    escape = "%s/../../SIR001234/host.raw" % image.parent.as_posix()
+    assert request(server, 'POST', '/jobs', {'image_path': escape})[0] == 400
+    (image.parent / 'link.raw').symlink_to(outside)
+    assert request(server, 'POST', '/jobs', {'image_path': (image.parent / 'link.raw').as_posix()})[0] == 400
+    (image.parent / 'notes.txt').write_text('not an image')
+    assert request(server, 'POST', '/jobs', {'image_path': (image.parent / 'notes.txt').as_posix()})[0] == 400
+    dumped = image.parent / 'plugins_output' / 'host' / 'memdump' / '4.dmp'
+    dumped.parent.mkdir(parents=True)
+    dumped.write_bytes(b'\0' * 16)
+    assert request(server, 'POST', '/jobs', {'image_path': dumped.as_posix()})[0] == 400
+    upper = image.with_name('HOST2.RAW')
+    upper.write_bytes(b'\0' * 16)
+    assert request(server, 'POST', '/jobs', {'image_path': upper.as_posix(), 'plugins': []})[0] == 400
+    status, body = request(server, 'POST', '/jobs', {'image_path': image.as_posix(), 'case_id': 'SIR999999'})
+    assert status == 400 and body['case_id'] == 'SIR001234'
+    assert request(server, 'POST', '/jobs', {'image_path': image.as_posix(), 'priority': 'high'})[0] == 400
+    assert request(server, 'POST', '/jobs', {'image_path': image.as_posix(), 'plugins': []})[0] == 400
+    assert request(server, 'GET', '/jobs/unknown')[0] == 404
+
+
+def test_submit_status_and_events(api):
+    server, image, proceed = api
+    status, body = request(server, 'POST', '/jobs', {'image_path': image.as_posix(), 'case_id': 'sir001234',
+                                                     'priority': 5, 'plugins': ['pslist', 'netscan']})
+    assert status == 201
+    job_id = body['job_id']
+    assert body['links'] == {'status': "/jobs/%s" % job_id, 'events': "/jobs/%s/events" % job_id}
+
+    # Already queued or running
+    status, body = request(server, 'POST', '/jobs', {'image_path': image.as_posix()})
+    assert status == 409 and body['job_id'] == job_id
+
+    threading.Timer(1, proceed.set).start()
+    events = read_events(server, "/jobs/%s/events" % job_id)
+    assert events[0][0] == 'status'
+    assert events[-1][0] == 'end'
+    assert events[-1][1]['state'] == 'done'
+    plugin_events = {data['plugin']: data['status'] for event, data in events if event == 'plugin'}
+    assert plugin_events == {'pslist': 'done', 'netscan': 'empty'}
+
+    status, body = request(server, 'GET', "/jobs/%s" % job_id)
+    assert status == 200
+    assert body['state'] == 'done'
+    assert body['priority'] == 5
+    assert body['requested_plugins'] == ['pslist', 'netscan']
+    assert body['progress']['completed'] == body['progress']['total'] == 2
+    assert body['progress']['plugins']['pslist'] == {'status': 'done', 'tier': 'triage', 'seconds': 3}
+    assert list(body['results']['plugins'].keys()) == ['pslist']
+
+    status, body = request(server, 'GET', '/jobs')
+    assert status == 200 and [job['job_id'] for job in body['jobs']] == [job_id]
+    # Only queued jobs can be cancelled
+    assert request(server, 'DELETE', "/jobs/%s" % job_id)[0] == 409
+
+
+def wait_state(server, job_id, state):
+    for _ in range(100):
+        status, body = request(server, 'GET', "/jobs/%s" % job_id)
+        if body['state'] == state:
+            return
+        threading.Event().wait(0.1)
+    raise AssertionError("Job not %s." % state)
+
+
+def test_processed_image_needs_force(api):
+    server, image, proceed = api
+    flag = image.with_name('host.processed')
+    flag.touch()
+    assert request(server, 'POST', '/jobs', {'image_path': image.as_posix()})[0] == 409
+    status, body = request(server, 'POST', '/jobs', {'image_path': image.as_posix(), 'force': True})
+    assert status == 201
+    # Removed once the job starts
+    wait_state(server, body['job_id'], 'running')
+    assert not flag.exists()
+
+    # A forced submission refused as already running keeps the flag
+    flag.touch()
+    assert request(server, 'POST', '/jobs', {'image_path': image.as_posix(), 'force': True})[0] == 409
+    assert flag.exists()
+    proceed.set()
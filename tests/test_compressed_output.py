@@ -0,0 +1,70 @@
+import json
+import zipfile
+import pytest
+from volatility_worker.core.compressed_output import compressed_path, resolve_output, open_output, \
+    detect_compression, open_result, load_json, compress_file, main
+from volatility_worker.core.utils import zip_dir
+
+
+@pytest.mark.parametrize('compression, suffix', [(None, ''), ('gzip', '.gz'), ('lzma', '.xz')])
+def test_write_and_read_back(tmp_path, compression, suffix):
+    plain = tmp_path / 'pslist.txt'
+    written = compressed_path(plain, compression)
+    assert written.name == 'pslist.txt' + suffix
+    with open_output(written, compression) as f:
+        f.write("PID Name\n4 System\n")
+    assert detect_compression(written) == compression
+    # Found and decompressed from the plain output file name
+    assert resolve_output(plain) == written
+    with open_result(plain) as f:
+        assert f.read() == "PID Name\n4 System\n"
+
+
+def test_unknown_compression(tmp_path):
+    with pytest.raises(ValueError):
+        compressed_path(tmp_path / 'pslist.txt', 'zip')
+    with pytest.raises(ValueError):
+        open_output(tmp_path / 'pslist.txt', 'zip')
+
+
+def test_missing_output(tmp_path):
+    assert resolve_output(tmp_path / 'pslist.txt') is None
+    with pytest.raises(FileNotFoundError):
+        open_result(tmp_path / 'pslist.txt')
+
+
+def test_load_json(tmp_path):
+    with open_output(tmp_path / 'netscan.json.xz', 'lzma') as f:
+        json.dump([{'PID': 4}], f)
+    assert load_json(tmp_path / 'netscan.json') == [{'PID': 4}]
+
+
+def test_compress_file(tmp_path):
+    plain = tmp_path / 'strings.txt'
+    plain.write_text("0:MZ\n")
+    assert compress_file(plain, None) == plain
+    written = compress_file(plain, 'gzip')
+    assert written.name == 'strings.txt.gz' and not plain.exists()
+    with open_result(plain) as f:
+        assert f.read() == "0:MZ\n"
+
+
+def test_command_line(tmp_path, capsys):
+    with open_output(tmp_path / 'pslist.txt.gz', 'gzip') as f:
+        f.writelines("line %d\n" % i for i in range(10))
+    assert main([(tmp_path / 'pslist.txt').as_posix(), '--head', '2']) == 0
+    assert capsys.readouterr().out == "line 0\nline 1\n"
+    assert main([(tmp_path / 'missing.txt').as_posix()]) == 1
+
+
+def test_archive_stores_compressed_outputs(tmp_path):
+    output_dir = tmp_path / 'host'
+    (output_dir / 'pslist').mkdir(parents=True)
+    with open_output(output_dir / 'pslist' / 'pslist.txt.gz', 'gzip') as f:
+        f.write("4 System\n")
+    (output_dir / 'pslist' / 'notes.txt').write_text("plain " * 100)
+    archive = tmp_path / 'host.zip'
+    zip_dir(output_dir, archive)
+    with zipfile.ZipFile(archive.as_posix()) as z:
+        types = {info.filename: info.compress_type for info in z.infolist() if not info.is_dir()}
+    assert types == {'host/pslist/pslist.txt.gz': zipfile.ZIP_STORED, 'host/pslist/notes.txt': zipfile.ZIP_DEFLATED}
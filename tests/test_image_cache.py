@@ -0,0 +1,104 @@
+import os
+import threading
+from volatility_worker.core.image_cache import ImageCache
+
+
+def write_image(path, size, head=b'MZ'):
+    with open(path, 'wb') as f:
+        f.write(head)
+        f.truncate(size)
+    return path
+
+
+def producer(content):
+    def _produce(output_file):
+        with open(output_file, 'wb') as f:
+            f.write(content)
+    return _produce
+
+
+def test_fingerprint_same_file(tmp_path):
+    image = write_image(tmp_path / 'a.hpak', 4 * 1024 ** 2)
+    assert ImageCache.fingerprint(image) == ImageCache.fingerprint(image)
+
+
+def test_fingerprint_same_samples_different_images(tmp_path):
+    # Same size and identical start, middle and end samples (zero-filled)
+    a = write_image(tmp_path / 'a.hpak', 8 * 1024 ** 2)
+    b = write_image(tmp_path / 'b.hpak', 8 * 1024 ** 2)
+    assert ImageCache.fingerprint(a) != ImageCache.fingerprint(b)
+
+
+def test_fingerprint_image_replaced_in_place(tmp_path):
+    image = write_image(tmp_path / 'a.hpak', 1024 ** 2)
+    before = ImageCache.fingerprint(image)
+    stat = image.stat()
+    os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    assert ImageCache.fingerprint(image) != before
+
+
+def test_add_get_and_lru_eviction(tmp_path):
+    cache = ImageCache(tmp_path / 'cache', max_bytes=10000)
+    first = cache.add('k1', producer(b'1' * 6000), 'vol')
+    assert first.read_bytes() == b'1' * 6000
+    cache.release('k1')
+    assert cache.get('k1') == first
+    cache.release('k1')
+
+    cache.add('k2', producer(b'2' * 6000), 'vol')
+    # Over budget: the least recently used, unpinned entry goes
+    assert cache.get('k1') is None
+    assert not first.exists()
+    assert cache.get('k2') is not None
+    assert list(cache.cache_dir.glob('*.partial')) == []
+
+
+def test_pinned_entries_are_not_evicted(tmp_path):
+    cache = ImageCache(tmp_path / 'cache', max_bytes=10000)
+    first = cache.add('k1', producer(b'1' * 6000), 'vol')
+    cache.add('k2', producer(b'2' * 6000), 'vol')
+    assert first.exists()
+    cache.release('k1')
+    cache.evict()
+    assert not first.exists()
+
+
+def test_index_survives_restart(tmp_path):
+    cache = ImageCache(tmp_path / 'cache', max_bytes=10000)
+    cache.add('k1', producer(b'1' * 100), 'vol')
+    cache.release('k1')
+    assert ImageCache(tmp_path / 'cache', max_bytes=10000).get('k1') is not None
+
+
+def test_failed_producer_leaves_nothing(tmp_path):
+    cache = ImageCache(tmp_path / 'cache', max_bytes=10000)
+
+    def _fail(output_file):
+        output_file.write_bytes(b'partial')
+        raise OSError("extraction failed")
+
+    try:
+        cache.add('k1', _fail, 'vol')
+    except OSError:
+        pass
+    assert cache.get('k1') is None
+    assert list(cache.cache_dir.glob('k1*')) == []
+
+
+def test_concurrent_misses_use_separate_files(tmp_path):
+    cache = ImageCache(tmp_path / 'cache', max_bytes=10 ** 6)
+    written = []
+    barrier = threading.Barrier(2)
+
+    def _produce(output_file):
+        written.append(output_file)
+        barrier.wait(5)
+        output_file.write_bytes(b'x' * 1000)
+
+    threads = [threading.Thread(target=cache.add, args=('k1', _produce, 'vol')) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(written)) == 2
+    assert cache.get('k1').read_bytes() == b'x' * 1000
@@ -0,0 +1,92 @@
+import os
+import json
+import gzip
+from volatility_worker.core.image_diff import diff_rows, previous_image, write_diff_report, main
+
+
+def test_added_removed_changed():
+    base = [{'PID': 4, 'Name': 'System', 'Thds': 80},
+            {'PID': 312, 'Name': 'smss.exe', 'Thds': 2},
+            {'PID': 500, 'Name': 'old.exe', 'Thds': 1}]
+    target = [{'PID': 4, 'Name': 'System', 'Thds': 95},
+              {'PID': 312, 'Name': 'smss.exe', 'Thds': 3, 'Hnds': 29},
+              {'PID': 600, 'Name': 'new.exe', 'Thds': 1}]
+    diff = diff_rows(base, target, key=['PID', 'Name'], ignore=['Thds'])
+    assert diff['added'] == [target[2]]
+    assert diff['removed'] == [base[2]]
+    # Only the non-ignored 'Hnds' column differs
+    assert diff['changed'] == [{'before': base[1], 'after': target[1]}]
+
+
+def test_whole_row_key_never_changed():
+    diff = diff_rows([{'a': 1}], [{'a': 2}])
+    assert diff['added'] == [{'a': 2}]
+    assert diff['removed'] == [{'a': 1}]
+    assert diff['changed'] == []
+
+
+def test_duplicate_keys_are_counted():
+    base = [{'Name': 'svchost.exe'}] * 3
+    target = [{'Name': 'svchost.exe'}] * 5
+    diff = diff_rows(base, target, key=['Name'])
+    assert len(diff['added']) == 2
+    assert diff['removed'] == []
+
+
+def test_unhashable_values():
+    base = [{'Name': 'a', 'Args': ['-x']}]
+    target = [{'Name': 'a', 'Args': ['-y']}]
+    diff = diff_rows(base, target, key=['Name', 'Args'])
+    assert len(diff['added']) == 1 and len(diff['removed']) == 1
+
+
+def test_many_repeated_keys():
+    rows = [{'Name': 'x', 'Value': i} for i in range(100000)]
+    diff = diff_rows(rows, rows[:-1], key=['Name'])
+    assert len(diff['removed']) == 1
+
+
+def write_results(case_output_dir, image, plugin, rows, compressed=False, mtime=None):
+    results_file = case_output_dir / image / plugin / ("%s.json" % plugin)
+    results_file.parent.mkdir(parents=True)
+    if compressed:
+        results_file = results_file.with_name(results_file.name + '.gz')
+        with gzip.open(results_file, 'wt') as f:
+            json.dump(rows, f)
+    else:
+        results_file.write_text(json.dumps(rows))
+    if mtime is not None:
+        os.utime(results_file, (mtime, mtime))
+    return results_file
+
+
+def test_previous_image(tmp_path):
+    write_results(tmp_path, 'host-1', 'pslist', [], mtime=1000)
+    write_results(tmp_path, 'host-2', 'pslist', [], compressed=True, mtime=2000)
+    write_results(tmp_path, 'host-3', 'pslist', [], mtime=3000)
+    write_results(tmp_path, 'other', 'netscan', [], mtime=4000)
+    (tmp_path / 'diffs').mkdir()
+    assert previous_image(tmp_path, 'host-3', 'pslist') == 'host-2'
+    assert previous_image(tmp_path, 'host-1', 'netscan') == 'other'
+    assert previous_image(tmp_path, 'other', 'netscan') is None
+
+
+def test_write_diff_report(tmp_path):
+    write_results(tmp_path, 'host-1', 'pslist', [{'PID': 4, 'Name': 'System', 'Offset(V)': '0x1'}])
+    write_results(tmp_path, 'host-2', 'pslist', [{'PID': 4, 'Name': 'System', 'Offset(V)': '0x2'},
+                                                 {'PID': 8, 'Name': 'evil.exe', 'Offset(V)': '0x3'}], compressed=True)
+    report_file = write_diff_report(tmp_path, 'host-1', 'host-2', 'pslist', key=['PID', 'Name'],
+                                    ignore=['Offset(V)'])
+    assert report_file == tmp_path / 'diffs' / 'host-1__host-2' / 'pslist.json'
+    report = json.loads(report_file.read_text())
+    assert report['counts'] == {'added': 1, 'removed': 0, 'changed': 0}
+    assert report['added'] == [{'PID': 8, 'Name': 'evil.exe', 'Offset(V)': '0x3'}]
+
+
+def test_no_structured_results(tmp_path, capsys):
+    write_results(tmp_path, 'host-1', 'pslist', {'not': 'rows'})
+    (tmp_path / 'host-2' / 'pslist').mkdir(parents=True)
+    (tmp_path / 'host-2' / 'pslist' / 'pslist.json').write_text('{truncated')
+    assert write_diff_report(tmp_path, 'host-1', 'host-2', 'pslist') is None
+    assert main([tmp_path.as_posix(), 'host-1', 'host-2', 'pslist', 'netscan']) == 0
+    assert capsys.readouterr().out.splitlines() == ['pslist: no structured results', 'netscan: no structured results']
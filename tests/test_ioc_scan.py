@@ -0,0 +1,104 @@
+import mmap
+import os
+import pytest
+from volatility_worker.core import ioc_scan
+from volatility_worker.core.ioc_scan import load_patterns, scan_image, get_pattern_set, shutdown_pools, PatternSet
+
+
+@pytest.fixture(autouse=True)
+def pools():
+    yield
+    shutdown_pools()
+
+
+def make_image(path, size, values):
+    data = bytearray(size)
+    for offset, value in values:
+        data[offset:offset + len(value)] = value
+    path.write_bytes(bytes(data))
+    return path
+
+
+def write_patterns(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+    return path
+
+
+def test_load_patterns(tmp_path):
+    patterns = load_patterns([write_patterns(tmp_path / 'iocs.txt', [
+        '# comment', '', 'evil.exe', 'utf16:wide', 'hex:de ad be ef'])])
+    assert patterns == {b'evil.exe': ('evil.exe', 'ascii'), 'evil.exe'.encode('utf-16-le'): ('evil.exe', 'utf16'),
+                        'wide'.encode('utf-16-le'): ('wide', 'utf16'), b'\xde\xad\xbe\xef': ('de ad be ef', 'hex')}
+
+
+def test_trie_regex_prefers_longest_pattern():
+    pattern_set = PatternSet({b'evil': ('evil', 'ascii'), b'evil.exe': ('evil.exe', 'ascii')})
+    if pattern_set.automaton:
+        pytest.skip("the automaton reports overlapping matches")
+    assert list(pattern_set.scan(b'xx evil.exe evil', 100)) == [(103, 'evil.exe', 'ascii'), (112, 'evil', 'ascii')]
+
+
+def test_scan_raw_image_across_chunks(tmp_path):
+    chunk = mmap.ALLOCATIONGRANULARITY
+    patterns = write_patterns(tmp_path / 'iocs.txt', ['evil.exe', 'hex:deadbeef'])
+    # 'evil.exe' crosses the end of the first chunk
+    image = make_image(tmp_path / 'image.raw', 3 * chunk, [(chunk - 4, b'evil.exe'),
+                                                           (chunk + 100, 'evil.exe'.encode('utf-16-le')),
+                                                           (2 * chunk + 8, b'\xde\xad\xbe\xef')])
+    rows = scan_image(image, [patterns], workers=2, chunk_size=chunk)
+    assert rows == [
+        {'Offset(File)': "0x%x" % (chunk - 4), 'Offset(P)': "0x%x" % (chunk - 4), 'Pattern': 'evil.exe',
+         'Type': 'ascii'},
+        {'Offset(File)': "0x%x" % (chunk + 100), 'Offset(P)': "0x%x" % (chunk + 100), 'Pattern': 'evil.exe',
+         'Type': 'utf16'},
+        {'Offset(File)': "0x%x" % (2 * chunk + 8), 'Offset(P)': "0x%x" % (2 * chunk + 8), 'Pattern': 'deadbeef',
+         'Type': 'hex'}]
+
+
+def test_crash_dump_has_file_offsets_only(tmp_path):
+    patterns = write_patterns(tmp_path / 'iocs.txt', ['evil.exe'])
+    image = make_image(tmp_path / 'image.dmp', 8192, [(4096, b'evil.exe')])
+    assert scan_image(image, [patterns], workers=1) == [
+        {'Offset(File)': '0x1000', 'Pattern': 'evil.exe', 'Type': 'ascii'}]
+
+
+def test_max_hits(tmp_path):
+    patterns = write_patterns(tmp_path / 'iocs.txt', ['hex:c0ffee'])
+    image = make_image(tmp_path / 'image.raw', 4096, [(offset, b'\xc0\xff\xee') for offset in range(0, 400, 40)])
+    assert len(scan_image(image, [patterns], workers=1, max_hits=3)) == 3
+    assert len(scan_image(image, [patterns], workers=1, max_hits=None)) == 10
+
+
+def test_changed_pattern_file_replaces_cached_set_and_pool(tmp_path):
+    patterns = write_patterns(tmp_path / 'iocs.txt', ['hex:c0ffee'])
+    image = make_image(tmp_path / 'image.raw', 4096, [(16, b'\xc0\xff\xee'), (64, b'\xba\xdc\x0d\xe5')])
+    assert len(scan_image(image, [patterns], workers=1)) == 1
+    version, _ = get_pattern_set([patterns])
+    assert [key[0] for key in ioc_scan._pools.keys()] == [version]
+
+    write_patterns(patterns, ['hex:badc0de5'])
+    stat = patterns.stat()
+    os.utime(patterns, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    assert [row['Pattern'] for row in scan_image(image, [patterns], workers=1)] == ['badc0de5']
+    assert version not in ioc_scan._pattern_sets
+    assert len(ioc_scan._pools) == 1
+
+
+def test_shutdown_pools(tmp_path):
+    patterns = write_patterns(tmp_path / 'iocs.txt', ['evil.exe'])
+    image = make_image(tmp_path / 'image.raw', 4096, [(0, b'evil.exe')])
+    scan_image(image, [patterns], workers=1)
+    pool = next(iter(ioc_scan._pools.values()))
+    shutdown_pools()
+    assert ioc_scan._pools == {}
+    with pytest.raises(RuntimeError):
+        pool.submit(len, b'')
+    # Started again by the next scan
+    assert len(scan_image(image, [patterns], workers=1)) == 1
+
+
+def test_empty_pattern_files(tmp_path):
+    patterns = write_patterns(tmp_path / 'iocs.txt', ['# nothing yet'])
+    image = make_image(tmp_path / 'image.raw', 4096, [])
+    assert scan_image(image, [patterns], workers=1) == []
+    assert ioc_scan._pools == {}
@@ -0,0 +1,115 @@
+import json
+import threading
+from volatility_worker.core.lease import LeaseManager
+
+
+def expire(manager, image):
+    _path = manager.lease_path(image)
+    lease = json.loads(_path.read_text())
+    lease['expires'] = 0
+    _path.write_text(json.dumps(lease))
+
+
+def test_claim_is_exclusive(tmp_path):
+    image = tmp_path / 'SIR001' / 'host.raw'
+    a = LeaseManager(tmp_path / 'leases', ttl=60, node_id='a')
+    b = LeaseManager(tmp_path / 'leases', ttl=60, node_id='b')
+    assert a.claim(image)
+    assert not b.claim(image)
+    assert json.loads(a.lease_path(image).read_text())['node'] == 'a'
+
+    a.release(image)
+    assert not a.lease_path(image).exists()
+    assert b.claim(image)
+
+
+def test_release_keeps_lease_taken_over(tmp_path):
+    image = tmp_path / 'host.raw'
+    a = LeaseManager(tmp_path / 'leases', ttl=60, node_id='a')
+    b = LeaseManager(tmp_path / 'leases', ttl=60, node_id='b')
+    assert a.claim(image)
+    expire(a, image)
+    assert b.claim(image)
+    a.release(image)
+    assert json.loads(b.lease_path(image).read_text())['node'] == 'b'
+
+
+def test_expired_lease_is_reclaimable(tmp_path):
+    image = tmp_path / 'host.raw'
+    image.write_bytes(b'\0')
+    gone = tmp_path / 'deleted.raw'
+    dead = LeaseManager(tmp_path / 'leases', ttl=60, node_id='dead')
+    assert dead.claim(image) and dead.claim(gone)
+    live = LeaseManager(tmp_path / 'leases', ttl=60, node_id='live')
+    assert live.reclaimable() == []
+
+    expire(dead, image)
+    expire(dead, gone)
+    # Images deleted since are not processed again
+    assert live.reclaimable() == [image.as_posix()]
+    assert live.claim(image)
+    assert live.reclaimable() == []
+    assert list(live.lease_dir.glob('*.stale')) == []
+
+
+def test_renew_extends_and_drops_lost_leases(tmp_path):
+    kept, lost = tmp_path / 'kept.raw', tmp_path / 'lost.raw'
+    a = LeaseManager(tmp_path / 'leases', ttl=60, node_id='a')
+    b = LeaseManager(tmp_path / 'leases', ttl=60, node_id='b')
+    assert a.claim(kept) and a.claim(lost)
+    before = json.loads(a.lease_path(kept).read_text())['expires']
+    expire(a, lost)
+    assert b.claim(lost)
+
+    a.renew()
+    assert json.loads(a.lease_path(kept).read_text())['expires'] >= before
+    assert json.loads(a.lease_path(lost).read_text())['node'] == 'b'
+    assert list(a._held.keys()) == [kept.as_posix()]
+    assert list(a.lease_dir.glob('*.tmp')) == []
+
+
+def test_unreadable_fresh_lease_is_not_taken(tmp_path):
+    # A lease file being written by its owner
+    image = tmp_path / 'host.raw'
+    a = LeaseManager(tmp_path / 'leases', ttl=60, node_id='a')
+    a.lease_path(image).write_text('')
+    assert not a.claim(image)
+
+
+def test_one_winner_for_an_expired_lease(tmp_path):
+    image = tmp_path / 'host.raw'
+    dead = LeaseManager(tmp_path / 'leases', ttl=60, node_id='dead')
+    assert dead.claim(image)
+    expire(dead, image)
+
+    nodes = [LeaseManager(tmp_path / 'leases', ttl=60, node_id=str(i)) for i in range(8)]
+    barrier = threading.Barrier(len(nodes))
+    results = [None] * len(nodes)
+
+    def claim(i):
+        barrier.wait()
+        results[i] = nodes[i].claim(image)
+
+    threads = [threading.Thread(target=claim, args=(i,)) for i in range(len(nodes))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 1
+    assert json.loads(dead.lease_path(image).read_text())['node'] == str(results.index(True))
+
+
+def test_heartbeat(tmp_path):
+    image = tmp_path / 'host.raw'
+    a = LeaseManager(tmp_path / 'leases', ttl=60, heartbeat_interval=0.05, node_id='a')
+    assert a.claim(image)
+    expire(a, image)
+    a.start_heartbeat()
+    try:
+        for _ in range(100):
+            if json.loads(a.lease_path(image).read_text() or '{}').get('expires', 0) > 0:
+                break
+            threading.Event().wait(0.05)
+    finally:
+        a.stop_heartbeat()
+    assert json.loads(a.lease_path(image).read_text())['expires'] > 0
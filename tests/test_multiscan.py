@@ -0,0 +1,90 @@
+import logging
+from types import SimpleNamespace
+from volatility_worker.core import multiscan
+from volatility_worker.core.multiscan import MULTISCAN_PLUGIN, MultiscanGroup, multiscan_groups, split_output
+
+OUTPUT = """\
+### multiscan: psscan
+Offset(P)          Name
+------------------ ----------------
+0x000000001a2b3c40 System
+### multiscan: filescan
+Offset(P)            #Ptr   #Hnd Access Name
+------------------ ------ ------ ------ ----
+### multiscan: modscan
+"""
+
+
+def test_split_output_sections():
+    sections = split_output(OUTPUT)
+    assert list(sections.keys()) == ['psscan', 'filescan', 'modscan']
+    assert sections['psscan'] == ("Offset(P)          Name\n"
+                                  "------------------ ----------------\n"
+                                  "0x000000001a2b3c40 System\n")
+    assert sections['filescan'].startswith("Offset(P)            #Ptr")
+    assert sections['modscan'] == ""
+
+
+def test_split_output_without_markers():
+    assert split_output("Volatility Foundation Volatility Framework 2.6\n") == dict()
+
+
+def _plugin(name, native=None, json_output=False, extra_flags=None, timeout=60):
+    return SimpleNamespace(name=name, native=native, json_output=json_output, extra_flags=extra_flags,
+                           timeout=timeout)
+
+
+def _worker():
+    return SimpleNamespace(memory_dump='image.raw', logger=logging.getLogger('test'))
+
+
+def test_multiscan_groups_per_tier():
+    plugins = {name: _plugin(name) for name in ('psscan', 'filescan', 'modscan', 'pslist', 'driverscan')}
+    plugins['modscan'].json_output = True
+    plugins['driverscan'].native = object()
+    tiers = [('triage', ['pslist', 'psscan', 'filescan', 'modscan']), ('full', ['driverscan', 'pslist'])]
+    groups = multiscan_groups(tiers, plugins)
+    assert sorted(groups.keys()) == ['filescan', 'psscan']
+    assert groups['psscan'] is groups['filescan']
+    assert [plugin.name for plugin in groups['psscan'].plugins] == ['psscan', 'filescan']
+
+
+def test_multiscan_groups_needs_two_scanners():
+    plugins = {name: _plugin(name) for name in ('psscan', 'filescan')}
+    assert multiscan_groups([('triage', ['psscan']), ('full', ['filescan'])], plugins) == dict()
+
+
+def test_group_runs_once_and_falls_back(monkeypatch):
+    calls = []
+
+    def execute(memory_dump, plugin_name, logger, extra_flags=None, timeout=None, **kwargs):
+        calls.append((plugin_name, extra_flags, timeout))
+        return OUTPUT if plugin_name == MULTISCAN_PLUGIN else 'alone'
+
+    monkeypatch.setattr(multiscan, 'execute_volatility_command', execute)
+    psscan, filescan, mutantscan = (_plugin('psscan', extra_flags='--physical-offset'), _plugin('filescan'),
+                                    _plugin('mutantscan', timeout=30))
+    group = MultiscanGroup([psscan, filescan, mutantscan])
+    assert group.output(_worker(), filescan).startswith("Offset(P)            #Ptr")
+    assert group.output(_worker(), psscan).endswith("System\n")
+    # Missing from the combined output: run alone
+    assert group.output(_worker(), mutantscan) == 'alone'
+    assert calls == [(MULTISCAN_PLUGIN, '--scanners=psscan,filescan,mutantscan --physical-offset', 150),
+                     ('mutantscan', None, 30)]
+
+
+def test_group_failure_runs_scanners_alone(monkeypatch):
+    calls = []
+
+    def execute(memory_dump, plugin_name, logger, extra_flags=None, timeout=None, **kwargs):
+        calls.append(plugin_name)
+        if plugin_name == MULTISCAN_PLUGIN:
+            raise RuntimeError("unsupported profile")
+        return plugin_name
+
+    monkeypatch.setattr(multiscan, 'execute_volatility_command', execute)
+    psscan, filescan = _plugin('psscan', timeout=None), _plugin('filescan')
+    group = MultiscanGroup([psscan, filescan])
+    assert group.output(_worker(), psscan) == 'psscan'
+    assert group.output(_worker(), filescan) == 'filescan'
+    assert calls == [MULTISCAN_PLUGIN, 'psscan', 'filescan']
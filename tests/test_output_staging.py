@@ -0,0 +1,76 @@
+import os
+import pytest
+from volatility_worker.core import output_staging
+from volatility_worker.core.output_staging import publish_dir, publish_log
+
+
+def make_dir(path, files):
+    path.mkdir(parents=True)
+    for name, content in files.items():
+        (path / name).write_text(content)
+    return path
+
+
+def test_publish_moves_folder(tmp_path):
+    src = make_dir(tmp_path / 'local' / 'pslist', {'pslist.txt': 'new'})
+    dest = tmp_path / 'case' / 'plugins_output' / 'image' / 'pslist'
+    assert publish_dir(src, dest) == dest
+    assert (dest / 'pslist.txt').read_text() == 'new'
+    assert not src.exists()
+    assert os.listdir(dest.parent) == ['pslist']
+
+
+def test_publish_keep_replaces_existing(tmp_path):
+    src = make_dir(tmp_path / 'local' / 'pslist', {'pslist.txt': 'new'})
+    dest = make_dir(tmp_path / 'case' / 'pslist', {'pslist.txt': 'old', 'stale.txt': 'old'})
+    publish_dir(src, dest, keep=True)
+    assert sorted(os.listdir(dest)) == ['pslist.txt']
+    assert (dest / 'pslist.txt').read_text() == 'new'
+    assert (src / 'pslist.txt').read_text() == 'new'
+    assert os.listdir(dest.parent) == ['pslist']
+
+
+def test_crash_between_renames_is_recovered(tmp_path, monkeypatch):
+    dest = make_dir(tmp_path / 'case' / 'pslist', {'pslist.txt': 'old'})
+    renames = []
+
+    def rename(src, dst):
+        # Stop after the existing folder was renamed away, before the new one is renamed into place
+        if len(renames) == 2:
+            raise KeyboardInterrupt
+        renames.append(dst)
+        os.replace(src, dst)
+
+    monkeypatch.setattr(output_staging.os, 'rename', rename)
+    with pytest.raises(KeyboardInterrupt):
+        publish_dir(make_dir(tmp_path / 'local' / 'pslist', {'pslist.txt': 'new'}), dest)
+    monkeypatch.undo()
+    assert not dest.exists()
+    assert (tmp_path / 'case' / '.pslist.replaced' / 'pslist.txt').read_text() == 'old'
+
+    # The next publish puts the previous folder back first, then replaces it
+    publish_dir(make_dir(tmp_path / 'local2' / 'pslist', {'pslist.txt': 'newer'}), dest)
+    assert (dest / 'pslist.txt').read_text() == 'newer'
+    assert os.listdir(dest.parent) == ['pslist']
+
+
+def test_recover_restores_previous_folder(tmp_path):
+    replaced = make_dir(tmp_path / '.pslist.replaced', {'pslist.txt': 'old'})
+    make_dir(tmp_path / '.pslist.publishing', {'pslist.txt': 'partial'})
+    dest = tmp_path / 'pslist'
+    output_staging._recover(dest, tmp_path / '.pslist.publishing', replaced)
+    assert (dest / 'pslist.txt').read_text() == 'old'
+    assert os.listdir(tmp_path) == ['pslist']
+
+
+def test_publish_log_appends(tmp_path):
+    src = tmp_path / 'local.log'
+    src.write_text('second\n')
+    dest = tmp_path / 'logs' / 'case.log'
+    dest.parent.mkdir()
+    dest.write_text('first\n')
+    publish_log(src, dest)
+    assert dest.read_text() == 'first\nsecond\n'
+    assert not src.exists()
+    publish_log(src, dest)
+    assert dest.read_text() == 'first\nsecond\n'
@@ -0,0 +1,84 @@
+import os
+import sys
+import pytest
+from configs.base_plugins import get_base_plugins
+from configs.base_plugins_configs import compile_plugins_config, PLUGINS_CONFIG
+from volatility_worker.core.exceptions import OverrideConfigFailure
+from volatility_worker.core.overrides import load_case_override
+
+
+def write_override(case_dir, text, bump=0):
+    override = case_dir / ("%s.py" % case_dir.name)
+    override.write_text(text)
+    if bump:
+        # Same size rewrites within the mtime resolution still count as changes
+        stat = override.stat()
+        os.utime(override, ns=(stat.st_atime_ns, stat.st_mtime_ns + bump))
+    return override
+
+
+@pytest.fixture
+def case_dir(tmp_path):
+    _case_dir = tmp_path / 'SIR000001'
+    _case_dir.mkdir()
+    return _case_dir
+
+
+def test_no_override(case_dir):
+    assert load_case_override(case_dir, 'SIR000001') is None
+
+
+def test_cached_until_changed(case_dir):
+    write_override(case_dir, "case_weight = 2\n")
+    first = load_case_override(case_dir, 'SIR000001')
+    assert first.case_weight == 2
+    assert load_case_override(case_dir, 'SIR000001') is first
+
+    write_override(case_dir, "case_weight = 3\n", bump=1000000000)
+    second = load_case_override(case_dir, 'SIR000001')
+    assert second is not first and second.case_weight == 3
+
+
+def test_loaded_without_import_side_effects(case_dir):
+    write_override(case_dir, "import os\nplugins = ['pslist']\n")
+    modules = set(sys.modules.keys())
+    path = list(sys.path)
+    assert load_case_override(case_dir, 'SIR000001').plugins == ['pslist']
+    assert set(sys.modules.keys()) == modules
+    assert sys.path == path
+    assert sorted(os.listdir(case_dir)) == ['SIR000001.py']
+
+
+def test_errors_are_cached_until_fixed(case_dir):
+    write_override(case_dir, "case_weight = \n")
+    with pytest.raises(SyntaxError) as first:
+        load_case_override(case_dir, 'SIR000001')
+    with pytest.raises(SyntaxError) as second:
+        load_case_override(case_dir, 'SIR000001')
+    assert second.value is first.value
+
+    write_override(case_dir, "case_weight = 1\n", bump=1000000000)
+    assert load_case_override(case_dir, 'SIR000001').case_weight == 1
+
+
+def test_invalid_plugins_configs(case_dir):
+    write_override(case_dir, "plugins_configs = {'pslist': {'extra_flag': '--verbose'}}\n")
+    with pytest.raises(OverrideConfigFailure):
+        load_case_override(case_dir, 'SIR000001')
+
+
+def test_compile_plugins_config():
+    assert compile_plugins_config({'pslist': {'splunk_output': False, 'timeout': 60}}) is not None
+    for config in ({'pslist': 'no options'}, {'pslist': {'unknown': 1}}, {'pslist': {'compression': 'zip'}},
+                   {'pslist': {'timeout': 0}}, {'pslist': {'timeout': True}},
+                   {'memdump': {'extra_flags': "--dump-dir {folder}"}}, ['pslist']):
+        with pytest.raises(ValueError):
+            compile_plugins_config(config)
+    # Case override options are used as-is, without path templates
+    assert compile_plugins_config({'memdump': {'extra_flags': "--dump-dir {folder}"}}, templates=False)
+    assert 'mactime' in PLUGINS_CONFIG
+
+
+def test_base_plugins_built_once():
+    assert get_base_plugins() is get_base_plugins()
+    assert 'pslist' in get_base_plugins().active_plugins
@@ -0,0 +1,87 @@
+import os
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from volatility_worker.core import pool_prescan
+from volatility_worker.core.pool_prescan import PoolTagIndex, prescan_image, get_pool_index, index_path, \
+    estimate_runtime, _find_re, _find_numpy
+from volatility_worker.core.utils import process_pool_context
+
+
+def make_image(path, size, tags):
+    data = bytearray(size)
+    for offset, tag in tags:
+        data[offset:offset + len(tag)] = tag
+    path.write_bytes(bytes(data))
+    return path
+
+
+@pytest.fixture
+def image(tmp_path):
+    # 'Proc' crosses the end of the first 64 KiB chunk
+    return make_image(tmp_path / 'image.raw', 3 * 65536, [(100, b'Pro\xe3'), (65534, b'Proc'), (70000, b'File'),
+                                                          (2 * 65536, b'TcpE')])
+
+
+def test_prescan_across_chunks(image):
+    index = prescan_image(image, workers=2, chunk_size=65536)
+    assert index.hits('psscan') == 2
+    assert index.hits('filescan') == 1
+    assert index.hits('netscan') == 1
+    assert index.hits('mutantscan') == 0
+    assert index.hits('pslist') is None
+    assert list(index.offsets(b'Proc')) == [65534]
+    assert index.total == 4
+
+
+@pytest.mark.skipif(pool_prescan.numpy is None, reason="numpy not installed")
+def test_numpy_matches_regular_expressions():
+    data = b'xxProcTcpEProcFil\xe5xx'
+    tags = pool_prescan.all_tags()
+    assert _find_numpy(data, len(data) - 2, tags) == _find_re(data, len(data) - 2, tags)
+
+
+def test_index_round_trip(image):
+    index = prescan_image(image, workers=1, chunk_size=65536)
+    index_file = index.write(index_path(image))
+    assert index_file.name == 'image.raw.pooltags'
+    loaded = PoolTagIndex.load(index_file)
+    assert loaded.counts == index.counts
+    assert list(loaded.offsets(b'TcpE')) == [2 * 65536]
+    assert list(loaded.offsets(b'Muta')) == []
+    assert loaded.is_current(image)
+
+    stat = image.stat()
+    os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    assert not loaded.is_current(image)
+
+
+def test_get_pool_index_reuses_current_index(image, monkeypatch):
+    first = get_pool_index(image, workers=1)
+    assert index_path(image).is_file()
+
+    def prescan(*args, **kwargs):
+        raise AssertionError("index is current")
+
+    monkeypatch.setattr(pool_prescan, 'prescan_image', prescan)
+    assert get_pool_index(image, workers=1).counts == first.counts
+
+
+def test_estimate_runtime(image):
+    index = prescan_image(image, workers=1)
+    assert estimate_runtime(index, 'psscan', scan_rate=65536, hit_seconds=0.5) == 3 + 2 * 0.5
+    assert estimate_runtime(index, 'pslist', scan_rate=65536, hit_seconds=0.5) is None
+
+
+def test_pools_do_not_fork_the_daemon():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        assert process_pool_context().get_start_method() == 'forkserver'
+    else:
+        assert process_pool_context().get_start_method() == 'spawn'
+
+
+def test_concurrent_prescans(image):
+    # Worker threads of the daemon prescan images concurrently, each with its own pool
+    with ThreadPoolExecutor(max_workers=2) as threads:
+        results = list(threads.map(lambda _: prescan_image(image, workers=2, chunk_size=65536).total, range(2)))
+    assert results == [4, 4]
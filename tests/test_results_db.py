@@ -0,0 +1,77 @@
+import sqlite3
+from volatility_worker.core import results_db
+from volatility_worker.core.results_db import ResultsDB, column_name
+from volatility_worker.core.utils import network_filesystem
+
+
+def test_column_name():
+    assert column_name('Offset(V)') == 'offset_v'
+    assert column_name('LocalAddr') == 'localaddr'
+    assert column_name('64bit') == 'c_64bit'
+    assert column_name('Image') == 'image_'
+
+
+def test_insert_replace_and_pivot(tmp_path):
+    db = ResultsDB(tmp_path / 'case.sqlite', pivot_columns=['pid', 'name'])
+    rows = [{'PID': 4, 'Name': 'System'}, {'PID': 1234, 'Name': 'powershell.exe', 'Threads': [1, 2]}]
+    assert db.insert_rows('a.raw', 'pslist', rows) == 2
+    assert db.insert_rows('b.raw', 'pslist', [{'PID': 99, 'Name': 'powershell.exe'}]) == 1
+    assert db.insert_rows('b.raw', 'netscan', [{'PID': 99, 'ForeignAddr': '10.1.2.3:443'}]) == 1
+
+    # Re-processing an image replaces its rows
+    assert db.insert_rows('a.raw', 'pslist', rows[1:]) == 1
+    assert db.query('SELECT image, pid, threads FROM pslist ORDER BY image') == [
+        {'image': 'a.raw', 'pid': 1234, 'threads': '[1, 2]'}, {'image': 'b.raw', 'pid': 99, 'threads': None}]
+
+    assert sorted((table, row['image']) for table, row in db.pivot('name', 'powershell.exe')) == [
+        ('pslist', 'a.raw'), ('pslist', 'b.raw')]
+    assert [(table, row['pid']) for table, row in db.pivot('foreignaddr', '10.1.2.', prefix=True)] == [('netscan', 99)]
+    assert sorted(db.tables('pid')) == ['netscan', 'pslist']
+
+    indexes = set(row['name'] for row in db.query("SELECT name FROM sqlite_master WHERE type = 'index'"))
+    assert {'ix_pslist_image', 'ix_pslist_pid', 'ix_pslist_name'}.issubset(indexes)
+    assert 'ix_netscan_foreignaddr' not in indexes
+
+
+def test_no_rows(tmp_path):
+    db = ResultsDB(tmp_path / 'case.sqlite')
+    assert db.insert_rows('a.raw', 'pslist', ['not a row']) == 0
+    assert db.tables() == []
+
+
+def journal_mode(path):
+    connection = sqlite3.connect(path.as_posix())
+    try:
+        return connection.execute('PRAGMA journal_mode').fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_wal_on_local_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(results_db, 'network_filesystem', lambda path: False)
+    db = ResultsDB(tmp_path / 'case.sqlite')
+    db.insert_rows('a.raw', 'pslist', [{'PID': 4}])
+    assert journal_mode(db.db_path) == 'wal'
+
+
+def test_rollback_journal_on_network_share(tmp_path, monkeypatch):
+    monkeypatch.setattr(results_db, 'network_filesystem', lambda path: True)
+    db = ResultsDB(tmp_path / 'case.sqlite')
+    db.insert_rows('a.raw', 'pslist', [{'PID': 4}])
+    assert journal_mode(db.db_path) == 'delete'
+    assert not (tmp_path / 'case.sqlite-wal').exists()
+
+
+def test_network_filesystem(tmp_path):
+    share = tmp_path / 'cases share'
+    (share / 'SIR001').mkdir(parents=True)
+    local = tmp_path / 'local'
+    local.mkdir()
+    mounts = tmp_path / 'mounts'
+    mounts.write_text("/dev/sda1 / ext4 rw 0 0\n"
+                      "server:/cases %s nfs4 rw 0 0\n"
+                      "tmpfs %s tmpfs rw 0 0\n" % (share.as_posix().replace(' ', '\\040'), local.as_posix()))
+    assert network_filesystem(share / 'SIR001' / 'not yet created.sqlite', mounts=mounts.as_posix())
+    assert not network_filesystem(local / 'case.sqlite', mounts=mounts.as_posix())
+    assert not network_filesystem(tmp_path, mounts=mounts.as_posix())
+    assert not network_filesystem(share, mounts=(tmp_path / 'missing').as_posix())
@@ -0,0 +1,25 @@
+import sys
+import pytest
+from volatility_worker.core.utils import run_command
+from volatility_worker.core.exceptions import ChildProcessKilled
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="resource limits are POSIX only")
+
+
+def test_cpu_limit_is_set_before_exec():
+    proc = run_command([sys.executable, '-c', "import resource; print(resource.getrlimit(resource.RLIMIT_CPU))"],
+                       cpu_limit=30)
+    assert proc.stdout.strip() == "(30, 40)"
+
+
+def test_cpu_limit_kills_child():
+    with pytest.raises(ChildProcessKilled) as killed:
+        run_command([sys.executable, '-c', "while True: pass"], cpu_limit=1, timeout=30)
+    assert killed.value.reason == 'cpu limit'
+
+
+def test_timeout_keeps_partial_output():
+    with pytest.raises(ChildProcessKilled) as killed:
+        run_command([sys.executable, '-u', '-c', "import time; print('partial'); time.sleep(30)"], timeout=2)
+    assert killed.value.reason == 'timeout'
+    assert killed.value.output == "partial\n"
@@ -0,0 +1,269 @@
+import logging
+import threading
+from pathlib import Path
+from volatility_worker.core.scheduler import Job, JobScheduler
+
+
+class Admission:
+    def try_admit(self, job_key, image_size, plugins=None, parallel=1):
+        return True
+
+    def track(self, job_key):
+        pass
+
+    def release(self, job_key):
+        pass
+
+
+def make_case(tmp_path, case_id, override=""):
+    case_dir = tmp_path / case_id
+    case_dir.mkdir()
+    (case_dir / ("%s.py" % case_id)).write_text(override)
+    return case_dir
+
+
+def make_job(case_dir, name, tier=0, priority=0):
+    image = case_dir / name
+    image.write_bytes(b'\0')
+    job = Job(image.as_posix(), priority=priority)
+    job.tier = tier
+    return job
+
+
+def finish(job):
+    job.finished = True
+    return 0
+
+
+def make_scheduler(pending, running=()):
+    scheduler = JobScheduler(Admission(), finish, logging.getLogger('test'))
+    scheduler._pending = list(pending)
+    for job in running:
+        scheduler._running[job.image_path] = (job, None)
+    return scheduler
+
+
+def test_lowest_tier_first(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001')
+    deep = make_job(case_a, 'a.raw', tier=1)
+    triage = make_job(case_a, 'b.raw', tier=0)
+    assert make_scheduler([deep, triage])._select() is triage
+
+
+def test_round_robin_across_cases(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001')
+    case_b = make_case(tmp_path, 'SIR000002')
+    jobs_a = [make_job(case_a, "a%d.raw" % i) for i in range(3)]
+    job_b = make_job(case_b, 'b.raw')
+    scheduler = make_scheduler(jobs_a + [job_b])
+    assert [job.case_id for job in scheduler.pending()[:2]] == ['SIR000001', 'SIR000002']
+
+
+def test_higher_priority_first(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001')
+    triage = make_job(case_a, 'a.raw', tier=0)
+    urgent = make_job(case_a, 'b.raw', tier=1, priority=10)
+    assert make_scheduler([triage, urgent])._select() is urgent
+
+
+def test_max_tier(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001')
+    deep = make_job(case_a, 'a.raw', tier=1)
+    assert make_scheduler([deep])._select(max_tier=0) is None
+
+
+def test_capped_case_does_not_block_other_tiers(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001', "case_max_concurrency = 1\n")
+    case_b = make_case(tmp_path, 'SIR000002')
+    running = make_job(case_a, 'running.raw')
+    queued_triage = make_job(case_a, 'a.raw', tier=0)
+    other_deep = make_job(case_b, 'b.raw', tier=1)
+    assert make_scheduler([queued_triage, other_deep], [running])._select() is other_deep
+
+
+def test_capped_case_does_not_block_other_priorities(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001', "case_max_concurrency = 1\n")
+    case_b = make_case(tmp_path, 'SIR000002')
+    running = make_job(case_a, 'running.raw')
+    urgent = make_job(case_a, 'a.raw', priority=10)
+    other = make_job(case_b, 'b.raw')
+    scheduler = make_scheduler([urgent, other], [running])
+    assert scheduler._select() is other
+    assert scheduler.dispatch() == 1
+
+
+def test_submit_rejects_duplicates(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001')
+    image = case_a / 'a.raw'
+    image.write_bytes(b'\0')
+    scheduler = make_scheduler([])
+    job = scheduler.submit(image.as_posix())
+    assert job is not None
+    assert scheduler.submit(image.as_posix()) is None
+    assert scheduler.find(job.job_id) is job
+
+
+class Tiers:
+    """
+    Runner of jobs with 'tiers' tiers, recording (image name, tier) in run order.
+    """
+    def __init__(self, tiers=2, fail=()):
+        self.tiers = tiers
+        self.fail = fail
+        self.runs = []
+
+    def __call__(self, job):
+        self.runs.append((Path(job.image_path).name, job.tier))
+        if Path(job.image_path).name in self.fail:
+            raise RuntimeError("worker crashed")
+        job.tier += 1
+        job.finished = job.tier >= self.tiers
+        return 0
+
+
+class Memory(Admission):
+    """
+    Admits 'slots' jobs at a time.
+    """
+    def __init__(self, slots):
+        self.slots = slots
+        self.admitted = set()
+
+    def try_admit(self, job_key, image_size, plugins=None, parallel=1):
+        if len(self.admitted) >= self.slots:
+            return False
+        self.admitted.add(job_key)
+        return True
+
+    def release(self, job_key):
+        self.admitted.discard(job_key)
+
+
+def run_all(scheduler):
+    """
+    Dispatch until the queue is empty, waiting for the started jobs each time.
+    """
+    for _ in range(100):
+        scheduler.dispatch()
+        wait_running(scheduler)
+        if len(scheduler) == 0 and len(scheduler.running()) == 0:
+            return
+    raise AssertionError("Jobs left: %s" % scheduler.pending())
+
+
+def wait_running(scheduler):
+    for _, thread in list(scheduler._running.values()):
+        thread.join(10)
+
+
+def test_every_image_runs_triage_before_deeper_tiers(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001')
+    runner = Tiers(tiers=3)
+    scheduler = JobScheduler(Memory(1), runner, logging.getLogger('test'))
+    for name in ('a.raw', 'b.raw', 'c.raw'):
+        (case_a / name).write_bytes(b'\0')
+        scheduler.submit((case_a / name).as_posix())
+    run_all(scheduler)
+    assert [tier for _, tier in runner.runs] == [0, 0, 0, 1, 1, 1, 2, 2, 2]
+    assert sorted(runner.runs) == [(name, tier) for name in ('a.raw', 'b.raw', 'c.raw') for tier in range(3)]
+
+
+def test_deeper_tier_waits_for_triage_denied_memory(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001')
+    scheduler = make_scheduler([make_job(case_a, 'a.raw', tier=0), make_job(case_a, 'b.raw', tier=1)])
+    scheduler.admission = Memory(0)
+    assert scheduler.dispatch() == 0
+    assert [job.tier for job in scheduler.pending()] == [0, 1]
+
+
+def test_failed_job_is_not_queued_again(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001')
+    runner = Tiers(tiers=2, fail=('a.raw',))
+    scheduler = JobScheduler(Admission(), runner, logging.getLogger('test'))
+    for name in ('a.raw', 'b.raw'):
+        (case_a / name).write_bytes(b'\0')
+        scheduler.submit((case_a / name).as_posix())
+    run_all(scheduler)
+    assert sorted(runner.runs) == [('a.raw', 0), ('b.raw', 0), ('b.raw', 1)]
+
+
+def test_deleted_image_is_dropped(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001')
+    job = make_job(case_a, 'a.raw')
+    scheduler = make_scheduler([job])
+    (case_a / 'a.raw').unlink()
+    assert scheduler.dispatch() == 0
+    assert len(scheduler) == 0
+
+
+def test_remove_queued_job(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001')
+    job = make_job(case_a, 'a.raw')
+    scheduler = make_scheduler([job])
+    assert scheduler.remove(job.image_path)
+    assert not scheduler.remove(job.image_path)
+    assert not scheduler.contains(job.image_path)
+
+
+def test_case_weight(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001', "case_weight = 2\n")
+    case_b = make_case(tmp_path, 'SIR000002')
+    jobs = [make_job(case_a, "a%d.raw" % i) for i in range(6)] + [make_job(case_b, "b%d.raw" % i) for i in range(6)]
+    order = [job.case_id[-1] for job in make_scheduler(jobs).pending()]
+    assert order[:9] == ['1', '1', '2', '1', '1', '2', '1', '1', '2']
+    assert order[9:] == ['2', '2', '2']
+
+
+def test_invalid_case_weight_counts_as_one(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001', "case_weight = 'high'\n")
+    case_b = make_case(tmp_path, 'SIR000002')
+    jobs = [make_job(case_a, "a%d.raw" % i) for i in range(2)] + [make_job(case_b, "b%d.raw" % i) for i in range(2)]
+    assert [job.case_id[-1] for job in make_scheduler(jobs).pending()] == ['1', '2', '1', '2']
+
+
+def test_job_denied_memory_keeps_the_round_robin_turn(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001')
+    case_b = make_case(tmp_path, 'SIR000002')
+    gate = threading.Event()
+
+    def runner(job):
+        gate.wait(10)
+        return finish(job)
+
+    scheduler = JobScheduler(Memory(1), runner, logging.getLogger('test'))
+    for i in range(4):
+        scheduler.submit(make_job(case_a, "a%d.raw" % i).image_path)
+    # a0 starts; a1 is picked next but denied memory
+    assert scheduler.dispatch() == 1
+    scheduler.submit(make_job(case_b, 'b.raw').image_path)
+    gate.set()
+    wait_running(scheduler)
+    gate.clear()
+
+    # The denied pick of a1 did not use up the credit of case A: case B has its turn now
+    assert scheduler.dispatch() == 1
+    assert [Path(job.image_path).name for job in scheduler.running()] == ['b.raw']
+    gate.set()
+    run_all(scheduler)
+
+
+def test_case_max_concurrency(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001', "case_max_concurrency = 2\n")
+    running = [make_job(case_a, "r%d.raw" % i) for i in range(2)]
+    queued = make_job(case_a, 'a.raw')
+    scheduler = make_scheduler([queued], running[:1])
+    assert scheduler.pending() == [queued]
+    scheduler = make_scheduler([queued], running)
+    assert scheduler.pending() == []
+    assert scheduler.dispatch() == 0
+
+
+def test_broken_override_reported_once(tmp_path):
+    case_a = make_case(tmp_path, 'SIR000001', "case_weight = \n")
+    jobs = [make_job(case_a, "a%d.raw" % i) for i in range(3)]
+    scheduler = make_scheduler(jobs)
+    warnings = []
+    scheduler.logger = type('Logger', (), {'warning': lambda self, record: warnings.append(record)})()
+    assert scheduler.pending() == jobs
+    scheduler.pending()
+    assert len(warnings) == 1
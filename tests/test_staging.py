@@ -0,0 +1,78 @@
+import os
+import pytest
+from volatility_worker.core import staging
+from volatility_worker.core.image_cache import ImageCache
+from volatility_worker.core.staging import sparse_copy, stage_image, staging_key
+
+
+def make_image(path, size, blocks):
+    """
+    Sparse image with (offset, bytes) written in place.
+    """
+    with open(path, 'wb') as f:
+        for offset, value in blocks:
+            f.seek(offset)
+            f.write(value)
+        f.truncate(size)
+    return path
+
+
+@pytest.fixture
+def staging_cache(tmp_path, monkeypatch):
+    cache = ImageCache(tmp_path / 'scratch', 1024 ** 2, name="image staging area")
+    monkeypatch.setattr(staging, 'image_staging', True)
+    monkeypatch.setattr(staging, '_staging_cache', cache)
+    return cache
+
+
+def test_sparse_copy(tmp_path):
+    source = make_image(tmp_path / 'image.raw', 64 * 1024, [(0, b'MZ'), (40960, b'\x01' * 4096)])
+    destination = tmp_path / 'copy.raw'
+    # Only the blocks holding data are written
+    assert sparse_copy(source, destination, block_size=4096) == 2 * 4096
+    assert destination.read_bytes() == source.read_bytes()
+
+
+def test_sparse_copy_trailing_hole(tmp_path):
+    source = make_image(tmp_path / 'image.raw', 10000, [(0, b'data')])
+    destination = tmp_path / 'copy.raw'
+    sparse_copy(source, destination, block_size=4096)
+    assert destination.stat().st_size == 10000
+    assert destination.read_bytes() == source.read_bytes()
+
+
+def test_staging_key_changes_with_image(tmp_path):
+    cache = ImageCache(tmp_path / 'scratch', 1024 ** 2)
+    image = make_image(tmp_path / 'image.raw', 8192, [(0, b'MZ')])
+    key = staging_key(image, cache)
+    assert staging_key(image, cache) == key
+    os.utime(image, ns=(0, image.stat().st_mtime_ns + 10 ** 9))
+    assert staging_key(image, cache) != key
+
+
+def test_staging_disabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(staging, 'image_staging', False)
+    image = make_image(tmp_path / 'image.raw', 8192, [(0, b'MZ')])
+    assert stage_image(image) == (None, image)
+
+
+def test_stage_image_once_and_pin(tmp_path, staging_cache):
+    image = make_image(tmp_path / 'image.raw', 64 * 1024, [(0, b'MZ')])
+    key, staged = stage_image(image)
+    assert staged.parent == tmp_path / 'scratch' and staged.suffix == '.raw'
+    assert staged.read_bytes() == image.read_bytes()
+
+    # Staged once; each job pins the copy
+    assert stage_image(image) == (key, staged)
+    staging_cache.release(key)
+    staging_cache.evict(reserve=staging_cache.max_bytes)
+    assert staged.exists()
+    staging_cache.release(key)
+    assert staging_cache.evict(reserve=staging_cache.max_bytes) == [key]
+    assert not staged.exists()
+
+
+def test_image_larger_than_staging_area(tmp_path, staging_cache):
+    image = make_image(tmp_path / 'image.raw', 2 * 1024 ** 2, [(0, b'MZ')])
+    assert stage_image(image) == (None, image)
+    assert list((tmp_path / 'scratch').glob('*.raw')) == []
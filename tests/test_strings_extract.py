@@ -0,0 +1,91 @@
+import gzip
+import logging
+from types import SimpleNamespace
+import pytest
+from volatility_worker.core import native_plugins, strings_extract
+from volatility_worker.core.strings_extract import extract_strings, _strings_numpy, _strings_re
+
+
+def make_image(path, size, strings):
+    """
+    Zero-filled image with (offset, bytes) written in place.
+    """
+    data = bytearray(size)
+    for offset, value in strings:
+        data[offset:offset + len(value)] = value
+    path.write_bytes(bytes(data))
+    return path
+
+
+def read_lines(path):
+    return [line.split(':', 1) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_ascii_and_utf16(tmp_path):
+    image = make_image(tmp_path / 'image.raw', 4096, [(100, b'hello world'), (501, 'secret'.encode('utf-16-le')),
+                                                      (900, b'abc')])
+    output = tmp_path / 'strings.txt'
+    assert extract_strings(image, output, min_length=4, workers=1) == 2
+    assert read_lines(output) == [['100', 'hello world'], ['501', 'secret']]
+
+
+@pytest.mark.skipif(strings_extract.numpy is None, reason="numpy not installed")
+def test_numpy_matches_regular_expressions():
+    data = b'\x00\x01tab\there\x00\xffx' + 'wide string'.encode('utf-16-le') + b'\x00plain text\x7f'
+    assert sorted(_strings_numpy(data, 4)) == sorted(_strings_re(data, 4))
+
+
+def test_strings_crossing_chunks(tmp_path):
+    chunk = 4096
+    # Starts 3 bytes before the chunk end; must be reported once, by the first chunk
+    image = make_image(tmp_path / 'image.raw', 3 * chunk, [(chunk - 3, b'boundary string'), (2 * chunk, b'next')])
+    output = tmp_path / 'strings.txt'
+    assert extract_strings(image, output, workers=2, chunk_size=chunk) == 2
+    assert read_lines(output) == [[str(chunk - 3), 'boundary string'], [str(2 * chunk), 'next']]
+    assert list(tmp_path.glob('*.part*')) == []
+
+
+def test_truncated_and_compressed(tmp_path):
+    image = make_image(tmp_path / 'image.raw', 8192, [(10, b'A' * 100)])
+    output = tmp_path / 'strings.txt'
+    assert extract_strings(image, output, max_length=16, workers=1, compression='gzip') == 1
+    assert not output.exists()
+    with gzip.open(tmp_path / 'strings.txt.gz', 'rt') as f:
+        assert f.read() == "10:%s\n" % ('A' * 16)
+
+
+def _worker(image):
+    return SimpleNamespace(memory_dump=SimpleNamespace(memory_path=image), logger=logging.getLogger('test'))
+
+
+def _plugin(tmp_path):
+    return SimpleNamespace(name='strings', timeout=60, compression='gzip',
+                           options={'output': (tmp_path / 'out' / 'strings_offsets.txt').as_posix()})
+
+
+def test_run_strings_maps_raw_images(tmp_path, monkeypatch):
+    calls = []
+
+    def execute(memory_dump, plugin_name, logger, extra_flags=None, timeout=None):
+        # Volatility reads the plain file
+        assert (tmp_path / 'out' / 'strings_offsets.txt').is_file()
+        calls.append((plugin_name, timeout))
+        return 'mapped'
+
+    monkeypatch.setattr(native_plugins, 'execute_volatility_command', execute)
+    image = make_image(tmp_path / 'image.raw', 4096, [(0, b'mapped string')])
+    assert native_plugins.run_strings(_worker(image), _plugin(tmp_path)) == 'mapped'
+    assert calls == [('strings', 60)]
+    assert not (tmp_path / 'out' / 'strings_offsets.txt').exists()
+    assert (tmp_path / 'out' / 'strings_offsets.txt.gz').is_file()
+
+
+def test_run_strings_skips_mapping_for_crash_dumps(tmp_path, monkeypatch):
+    def execute(*args, **kwargs):
+        raise AssertionError("file offsets of a crash dump are not physical addresses")
+
+    monkeypatch.setattr(native_plugins, 'execute_volatility_command', execute)
+    image = make_image(tmp_path / 'image.dmp', 4096, [(0, b'PAGEDUMP'), (64, b'not mapped')])
+    assert native_plugins.run_strings(_worker(image), _plugin(tmp_path)) == ''
+    with gzip.open(tmp_path / 'out' / 'strings_offsets.txt.gz', 'rt') as f:
+        assert f.read() == "0:PAGEDUMP\n64:not mapped\n"
@@ -0,0 +1,63 @@
+from volatility_worker.core.text_tables import parse_table_output
+
+PSLIST = """\
+Offset(V)          Name                    PID   PPID   Thds     Hnds   Sess  Wow64 Start                          Exit
+------------------ -------------------- ------ ------ ------ -------- ------ ------ ------------------------------ ------------------------------
+0xfffffa8000c9f740 System                    4      0     84      511 ------      0 2019-01-01 10:00:00 UTC+0000
+0xfffffa8001e1b060 averyveryverylongprocessname.exe    312      4      2       29 ------      0 2019-01-01 10:00:01 UTC+0000
+"""
+
+
+def test_parse_fixed_width_rows():
+    rows = parse_table_output(PSLIST)
+    assert len(rows) == 2
+    assert rows[0]['Name'] == 'System'
+    assert rows[0]['PID'] == 4
+    assert rows[0]['Sess'] is None
+    assert rows[0]['Start'] == '2019-01-01 10:00:00 UTC+0000'
+    assert rows[0]['Exit'] is None
+
+
+def test_parse_overflowing_value_shifts_columns():
+    rows = parse_table_output(PSLIST)
+    assert rows[1]['Name'] == 'averyveryverylongprocessname.exe'
+    assert rows[1]['PID'] == 312
+    assert rows[1]['PPID'] == 4
+
+
+def test_parse_several_tables():
+    text = ("Pid      Handle\n" "-------- ------\n" "4        0x4\n" "\n"
+            "Pid      Handle\n" "-------- ------\n" "8        0x8\n")
+    assert parse_table_output(text) == [{'Pid': 4, 'Handle': '0x4'}, {'Pid': 8, 'Handle': '0x8'}]
+
+
+def test_parse_not_tabular():
+    assert parse_table_output("Volatility Foundation Volatility Framework 2.6\nno table here\n") is None
+    assert parse_table_output("") is None
+
+
+def test_parse_strict_keeps_mixed_output_as_text():
+    text = "Pid      Handle\n-------- ------\n4        0x4\n\n*** free text between tables\n"
+    assert parse_table_output(text) is None
+    assert parse_table_output(text, strict=False) == [{'Pid': 4, 'Handle': '0x4'}]
+
+
+def test_parse_typed_values():
+    text = ("Offset     Value  Hex        Name\n"
+            "---------- ------ ---------- ----------\n"
+            "0x81234567 -12    0x00000010 a b c\n"
+            "0x81234568 ----   0x00000020\n")
+    assert parse_table_output(text) == [
+        {'Offset': '0x81234567', 'Value': -12, 'Hex': '0x00000010', 'Name': 'a b c'},
+        {'Offset': '0x81234568', 'Value': None, 'Hex': '0x00000020', 'Name': None}]
+
+
+def test_parse_several_overflows_in_a_row():
+    text = ("A    B    C\n"
+            "---- ---- ----\n"
+            "aaaaaa bbbbbb c\n")
+    assert parse_table_output(text) == [{'A': 'aaaaaa', 'B': 'bbbbbb', 'C': 'c'}]
+
+
+def test_parse_header_without_rows():
+    assert parse_table_output("Pid      Handle\n-------- ------\n") is None
@@ -0,0 +1,85 @@
+import logging
+from types import SimpleNamespace
+from volatility_worker.core import native_plugins
+from volatility_worker.core.compressed_output import open_result
+from volatility_worker.core.timeline import parse_time, parse_date_range, body_events, sorted_events, \
+    write_timeline, TIMELINE_HEADER
+
+# 2019-01-01 00:00:00 UTC
+DAY = 1546300800
+
+
+def body_line(name, atime=0, mtime=0, ctime=0, crtime=0, inode='42-128-1'):
+    return "0|%s|%s|r/rrwxrwxrwx|0|0|1024|%d|%d|%d|%d\n" % (name, inode, atime, mtime, ctime, crtime)
+
+
+def write_body(path, lines):
+    path.write_text(''.join(lines), encoding='utf-8')
+    return path
+
+
+def test_parse_time():
+    assert parse_time('2019-01-01') == DAY
+    assert parse_time('2019-01-01', end=True) == DAY + 86399
+    assert parse_time('2019-01-01T10:30', end=True) == DAY + 10 * 3600 + 30 * 60 + 59
+    assert parse_time('2019-01-01T10:30:15') == DAY + 10 * 3600 + 30 * 60 + 15
+    assert parse_time('') is None
+    assert parse_date_range('2019-01-01..') == (DAY, None)
+    assert parse_date_range('..2019-01-01') == (None, DAY + 86399)
+    assert parse_date_range(None) == (None, None)
+
+
+def test_body_events(tmp_path):
+    body = write_body(tmp_path / 'body.txt', [
+        body_line('[MFT FILE_NAME] a.txt', atime=DAY + 5, mtime=DAY, ctime=DAY, crtime=DAY),
+        body_line('[MFT] pipe|name.txt', mtime=DAY + 1),
+        'not a body line\n',
+        body_line('bad.txt', mtime=0).replace('|0|0|1024|0|', '|0|0|1024|x|'),
+    ])
+    assert list(body_events(body)) == [
+        (DAY, '[MFT FILE_NAME] a.txt', '1024', 'm.cb', 'r/rrwxrwxrwx', '0', '0', '42-128-1'),
+        (DAY + 5, '[MFT FILE_NAME] a.txt', '1024', '.a..', 'r/rrwxrwxrwx', '0', '0', '42-128-1'),
+        (DAY + 1, '[MFT] pipe|name.txt', '1024', 'm...', 'r/rrwxrwxrwx', '0', '0', '42-128-1')]
+    assert [event[0] for event in body_events(body, start=DAY + 1, end=DAY + 4)] == [DAY + 1]
+
+
+def test_sorted_events_spill_to_disk(tmp_path):
+    bodies = [write_body(tmp_path / ("body%d.txt" % i),
+                         [body_line("f%d_%d" % (i, j), mtime=DAY + (j * 7 + i * 3) % 50) for j in range(20)])
+              for i in range(3)]
+    in_memory = list(sorted_events(bodies + [tmp_path / 'missing.txt']))
+    assert len(in_memory) == 60
+    assert in_memory == sorted(in_memory)
+    assert list(sorted_events(bodies, chunk_size=7)) == in_memory
+
+
+def test_write_timeline_compressed(tmp_path):
+    body = write_body(tmp_path / 'body.txt', [body_line('late', mtime=DAY + 86400),
+                                              body_line('early', mtime=DAY + 60)])
+    output = tmp_path / 'mactime.csv.gz'
+    assert write_timeline([body], output, date_range='2019-01-01..2019-01-01', compression='gzip') == 1
+    with open_result(output) as f:
+        assert f.read().splitlines() == [
+            ','.join(TIMELINE_HEADER),
+            'Tue Jan 01 2019 00:01:00,1024,m...,r/rrwxrwxrwx,0,0,42-128-1,early']
+
+
+def run_timeline(tmp_path, lines, date_range=None):
+    body = write_body(tmp_path / 'body.txt', lines)
+    plugin = SimpleNamespace(compression='gzip', options={
+        'bodies': [body.as_posix(), (tmp_path / 'missing.txt').as_posix()],
+        'output': (tmp_path / 'mactime' / 'mactime.csv').as_posix(), 'date_range': date_range})
+    worker = SimpleNamespace(logger=logging.getLogger('test'))
+    return native_plugins.run_timeline(worker, plugin)
+
+
+def test_run_timeline_summary(tmp_path, monkeypatch):
+    monkeypatch.setattr(native_plugins, 'timeline_index', False)
+    assert run_timeline(tmp_path, [body_line('a', mtime=DAY), body_line('b', mtime=DAY + 1)]) == [
+        {'Timeline': 'mactime.csv.gz', 'Index': None, 'Events': 2, 'DateRange': None}]
+    assert (tmp_path / 'mactime' / 'mactime.csv.gz').is_file()
+
+
+def test_run_timeline_without_events(tmp_path, monkeypatch):
+    monkeypatch.setattr(native_plugins, 'timeline_index', False)
+    assert run_timeline(tmp_path, [body_line('a', mtime=DAY)], date_range='2020-01-01..') == ''
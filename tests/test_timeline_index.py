@@ -0,0 +1,85 @@
+import logging
+from types import SimpleNamespace
+import pytest
+from volatility_worker.core import native_plugins
+from volatility_worker.core.timeline_index import TimelineIndexWriter, TimelineIndex, index_file_for, main
+
+DAY = 1546300800
+
+
+def event(stamp, name):
+    return stamp, name, '1024', 'm...', 'r/rrwxrwxrwx', '0', '0', '42-128-1'
+
+
+EVENTS = [event(DAY + offset, name) for offset, name in [
+    (0, '[MFT FILE_NAME] Windows\\System32\\cmd.exe'), (30, '[MFT STD_INFO] Users\\bob\\evil.exe'),
+    (59, '[SHELLBAGS] Users\\bob\\Desktop'), (61, '[MFT FILE_NAME] Windows\\Temp\\x.tmp'),
+    (61, '[MFT FILE_NAME] Windows\\Temp\\y.tmp'), (3600, '[TIMELINER] Users\\Bob\\ntuser.dat')]]
+
+
+@pytest.fixture
+def index(tmp_path):
+    with TimelineIndexWriter(tmp_path / 'mactime.bin', bucket_seconds=60) as writer:
+        for _event in EVENTS:
+            writer.add(_event)
+    return TimelineIndex(tmp_path / 'mactime.bin')
+
+
+def test_buckets(index):
+    # Non-empty buckets only
+    assert len(index) == 3
+    assert index_file_for(index.record_file).name == 'mactime.idx'
+
+
+def test_query_time_window(index):
+    assert list(index.query()) == EVENTS
+    assert list(index.query(start=DAY + 30, end=DAY + 61)) == EVENTS[1:5]
+    assert list(index.query(start=DAY + 62, end=DAY + 3599)) == []
+    assert list(index.query(start=DAY + 3600)) == EVENTS[5:]
+    assert list(index.query(end=DAY - 1)) == []
+
+
+def test_query_path_prefix(index):
+    # The source tag is ignored, the prefix is case-insensitive
+    assert [name for _, name, *_ in index.query(path_prefix='users\\bob\\')] == [
+        '[MFT STD_INFO] Users\\bob\\evil.exe', '[SHELLBAGS] Users\\bob\\Desktop', '[TIMELINER] Users\\Bob\\ntuser.dat']
+    assert [name for _, name, *_ in index.query(start=DAY + 60, path_prefix='Windows\\Temp')] == [
+        '[MFT FILE_NAME] Windows\\Temp\\x.tmp', '[MFT FILE_NAME] Windows\\Temp\\y.tmp']
+
+
+def test_events_out_of_order(tmp_path):
+    with pytest.raises(ValueError):
+        with TimelineIndexWriter(tmp_path / 'mactime.bin') as writer:
+            writer.add(event(DAY + 1, 'b'))
+            writer.add(event(DAY, 'a'))
+    # Nothing published, no temporary files left
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_not_an_index(tmp_path):
+    (tmp_path / 'mactime.bin').write_bytes(b'')
+    (tmp_path / 'mactime.idx').write_bytes(b'\0' * 32)
+    with pytest.raises(ValueError):
+        TimelineIndex(tmp_path / 'mactime.bin')
+
+
+def test_command_line(index, capsys):
+    assert main([index.record_file.as_posix(), '--start', '2019-01-01T00:01', '--end', '2019-01-01T00:01',
+                 '--path', 'windows\\temp']) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith('Date,')
+    assert [line.rsplit(',', 1)[1] for line in lines[1:]] == [
+        '[MFT FILE_NAME] Windows\\Temp\\x.tmp', '[MFT FILE_NAME] Windows\\Temp\\y.tmp']
+
+
+def test_run_timeline_writes_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(native_plugins, 'timeline_index', True)
+    body = tmp_path / 'body.txt'
+    body.write_text("0|[MFT] a.txt|42|r/r|0|0|1024|0|%d|0|0\n0|[MFT] b.txt|43|r/r|0|0|1024|0|%d|0|0\n"
+                    % (DAY + 90, DAY))
+    plugin = SimpleNamespace(compression=None, options={'bodies': [body.as_posix()],
+                                                        'output': (tmp_path / 'mactime' / 'mactime.csv').as_posix()})
+    summary = native_plugins.run_timeline(SimpleNamespace(logger=logging.getLogger('test')), plugin)
+    assert summary == [{'Timeline': 'mactime.csv', 'Index': 'mactime.idx', 'Events': 2, 'DateRange': None}]
+    index = TimelineIndex(tmp_path / 'mactime' / 'mactime.bin')
+    assert [name for _, name, *_ in index.query(start=DAY + 60)] == ['[MFT] a.txt']
@@ -0,0 +1,293 @@
+import json
+import logging
+import threading
+from pathlib import Path
+from configs.defaults import admission_control, memory_headroom_bytes, default_memory_ratio, min_job_memory_bytes, \
+    max_concurrent_jobs, child_memory_limit_factor, admission_history_file, memory_pressure_kill_bytes
+from .utils import whoami
+
+
+def read_meminfo(field='MemAvailable', meminfo='/proc/meminfo'):
+    """
+    Read a field from /proc/meminfo
+    :param field: meminfo field name
+    :param meminfo: path to meminfo file
+    :return: (int) bytes or None if unavailable (i.e. non-Linux)
+    """
+    try:
+        with open(meminfo, 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def read_proc_status(pid, fields=('VmRSS', 'VmHWM')):
+    """
+    Current and peak resident memory of a process
+    :param pid: process id
+    :param fields: /proc/<pid>/status fields to read
+    :return: dict of field: bytes
+    """
+    usage = dict()
+    try:
+        with open('/proc/%d/status' % pid, 'r') as f:
+            for line in f:
+                name = line.split(':', 1)[0]
+                if name in fields:
+                    usage[name] = int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return usage
+
+
+class ChildMonitor:
+    """
+    Samples the memory usage of a Volatility child process while it runs.  Current usage is reported to the
+    admission controller and the peak is recorded as plugin history on exit.
+    """
+    def __init__(self, controller, job_key, plugin, image_size, interval=1):
+        self.controller = controller
+        self.job_key = job_key
+        self.plugin = plugin
+        self.image_size = image_size
+        self.interval = interval
+        # Address space limit (RLIMIT_AS) set by run_command() in the child before it executes, None for none
+        self.memory_limit = controller.child_memory_limit(plugin, image_size)
+        self.pid = None
+        self.peak = 0
+        self.rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, pid):
+        self.pid = pid
+        self._thread = threading.Thread(target=self._sample_loop, name="memmon-%d" % pid, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.controller.update_usage(self.job_key, self.pid, None)
+        if self.peak > 0:
+            self.controller.record_peak(self.plugin, self.image_size, self.peak)
+
+    def pressure(self):
+        """
+        :return: True if available memory is below the controller's kill threshold and this process uses more than
+        its estimated footprint
+        """
+        if not self.controller.pressure_bytes or self.pid is None:
+            return False
+        available = read_meminfo()
+        return available is not None and available < self.controller.pressure_bytes \
+            and self.rss > self.controller.estimate(self.image_size, [self.plugin])
+
+    def _sample_loop(self):
+        while True:
+            usage = read_proc_status(self.pid)
+            # VmHWM is a high-water mark; the last sample before exit is the peak
+            self.peak = max(self.peak, usage.get('VmHWM', 0))
+            self.rss = usage.get('VmRSS', 0)
+            self.controller.update_usage(self.job_key, self.pid, self.rss)
+            if self._stop.wait(self.interval):
+                break
+
+
+class AdmissionController:
+    """
+    Admits image processing jobs only while their estimated memory footprint fits in available memory.
+    Footprints are estimated from the image size and the peak memory previously observed for each plugin.
+    """
+    def __init__(self, history_file, headroom_bytes, default_ratio, min_bytes, max_jobs, limit_factor,
+                 memory_checks=True, pressure_bytes=None, logger=None):
+        """
+        :param history_file: (Path) JSON file persisting per-plugin memory history
+        :param headroom_bytes: (int) memory kept free for the OS and other services
+        :param default_ratio: (float) estimated bytes per image byte for plugins without history
+        :param min_bytes: (int) baseline footprint of a Volatility process, regardless of image size
+        :param max_jobs: (int) hard limit on concurrent jobs
+        :param limit_factor: (float) RLIMIT_AS guard as a multiple of the estimate.  None to disable.
+        :param memory_checks: if False, only 'max_jobs' is enforced
+        :param pressure_bytes: (int) available memory below which processes over their estimate are killed.  None
+        to disable.
+        :param logger: logger instance
+        """
+        self.history_file = Path(history_file)
+        self.headroom_bytes = headroom_bytes
+        self.default_ratio = default_ratio
+        self.min_bytes = min_bytes
+        self.max_jobs = max_jobs
+        self.limit_factor = limit_factor
+        self.memory_checks = memory_checks
+        self.pressure_bytes = pressure_bytes
+        self.logger = logger if logger is not None else logging.getLogger('root')
+
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        # job key -> reserved bytes
+        self._reserved = dict()
+        # job key -> {child pid: current rss}
+        self._usage = dict()
+        self._history = self._load_history()
+
+    def estimate(self, image_size, plugins=None, parallel=1):
+        """
+        Estimated peak memory of a job.  With 'parallel' plugins running at a time, the job footprint is the sum of
+        the largest 'parallel' plugins.
+        :param image_size: (int) memory image size in bytes
+        :param plugins: plugin names.  Default: all plugins with history.
+        :param parallel: plugins running concurrently
+        :return: (int) bytes
+        """
+        with self._lock:
+            if plugins is None:
+                plugins = list(self._history.keys())
+            ratios = [self._history.get(plugin, {}).get('ratio', self.default_ratio) for plugin in plugins]
+        ratios = sorted(ratios, reverse=True)[:max(1, parallel)] if ratios else [self.default_ratio]
+        return len(ratios) * self.min_bytes + int(sum(ratios) * image_size)
+
+    def child_memory_limit(self, plugin, image_size):
+        if not self.limit_factor:
+            return None
+        return int(self.estimate(image_size, [plugin]) * self.limit_factor)
+
+    def try_admit(self, job_key, image_size, plugins=None, parallel=1):
+        """
+        Reserve memory for a job if it fits.
+        :param job_key: unique job name, i.e. memory image path
+        :param image_size: (int) memory image size in bytes
+        :param plugins: plugin names expected to run
+        :param parallel: plugins running concurrently
+        :return: True if the job was admitted
+        """
+        footprint = self.estimate(image_size, plugins, parallel)
+        with self._lock:
+            if len(self._reserved) >= self.max_jobs:
+                return False
+
+            available = read_meminfo() if self.memory_checks else None
+            if available is not None and len(self._reserved) > 0:
+                # MemAvailable already accounts for memory in use; only count reservations not yet consumed.
+                outstanding = sum(max(0, reserved - sum(self._usage.get(key, {}).values()))
+                                  for key, reserved in self._reserved.items())
+                if footprint + outstanding + self.headroom_bytes > available:
+                    self.logger.debug({'_action': whoami(),
+                                       'message': "Insufficient memory to admit job.",
+                                       'details': {'job': job_key, 'footprint': footprint,
+                                                   'outstanding': outstanding, 'available': available}
+                                       })
+                    return False
+
+            # An idle host always admits one job so the queue makes progress.
+            self._reserved[job_key] = footprint
+            self._usage[job_key] = dict()
+        self.logger.info({'_action': whoami(),
+                          'message': "Admitted job.",
+                          'details': {'job': job_key, 'footprint': footprint, 'running': len(self._reserved)}
+                          })
+        return True
+
+    def release(self, job_key):
+        with self._lock:
+            self._reserved.pop(job_key, None)
+            self._usage.pop(job_key, None)
+
+    def running(self):
+        with self._lock:
+            return len(self._reserved)
+
+    def track(self, job_key):
+        """
+        Associate the calling (worker) thread with an admitted job, so its Volatility processes are monitored.
+        :param job_key: admitted job name
+        :return: None
+        """
+        self._local.job_key = job_key
+
+    def current_job(self):
+        """
+        :return: job key tracked by the calling thread, or None
+        """
+        return getattr(self._local, 'job_key', None)
+
+    def child_monitor(self, plugin, image_size):
+        """
+        Monitor for a Volatility process about to be started by the calling thread.
+        :param plugin: plugin name
+        :param image_size: (int) memory image size in bytes
+        :return: ChildMonitor
+        """
+        return ChildMonitor(self, self.current_job(), plugin, image_size)
+
+    def update_usage(self, job_key, pid, rss):
+        with self._lock:
+            if job_key not in self._usage:
+                return
+            if rss is None:
+                self._usage[job_key].pop(pid, None)
+            else:
+                self._usage[job_key][pid] = rss
+
+    def record_peak(self, plugin, image_size, peak_bytes, weight=0.3):
+        """
+        Update plugin history with the observed peak memory (exponentially weighted).
+        :param plugin: plugin name
+        :param image_size: (int) memory image size in bytes
+        :param peak_bytes: (int) observed peak resident memory
+        :param weight: weight of the new observation
+        :return: None
+        """
+        if image_size <= 0:
+            return
+        # Memory above the fixed per-process baseline scales with the image size
+        ratio = max(0, peak_bytes - self.min_bytes) / image_size
+        with self._lock:
+            entry = self._history.setdefault(plugin, {'ratio': ratio, 'samples': 0})
+            # Never under-estimate a plugin; memory use is only partially determined by image size
+            entry['ratio'] = max(ratio, (1 - weight) * entry['ratio'] + weight * ratio)
+            entry['samples'] += 1
+            self._save_history()
+
+    def _load_history(self):
+        try:
+            with self.history_file.open('r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return dict()
+
+    def _save_history(self):
+        try:
+            _tmp = self.history_file.with_name(self.history_file.name + '.tmp')
+            with _tmp.open('w') as f:
+                json.dump(self._history, f)
+            _tmp.replace(self.history_file)
+        except OSError as _err:
+            self.logger.warning({'_action': whoami(),
+                                 'message': "Failed to save memory history.",
+                                 'errors': [str(_err)]})
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """
+    Process-wide admission controller, created on first use from 'configs/defaults.py'.  Without admission control,
+    images are processed one at a time: concurrency is only safe with the memory checks.
+    :return: AdmissionController
+    """
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController(admission_history_file, memory_headroom_bytes, default_memory_ratio,
+                                              min_job_memory_bytes,
+                                              max_concurrent_jobs if admission_control else 1,
+                                              child_memory_limit_factor,
+                                              memory_checks=admission_control,
+                                              pressure_bytes=memory_pressure_kill_bytes)
+    return _controller
@@ -0,0 +1,398 @@
+import os
+import json
+import hmac
+import fnmatch
+import logging
+import threading
+from time import time, sleep
+from pathlib import Path
+from datetime import datetime
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from configs.defaults import api_host, api_port, api_token, api_job_history, case_processed_flag, \
+    MEM_DUMP_FILE_PATTERN, MONITORED_FOLDERS, case_output_dir
+from .utils import whoami
+from .vol_worker import get_case_id
+
+# Local HTTP API of the daemon.  All bodies are JSON.
+#   POST   /jobs                {"image_path": ..., "case_id": ..., "priority": 0, "plugins": [...], "force": false}
+#   GET    /jobs                queued, running and recently finished jobs
+#   GET    /jobs/<id>           job status, per-plugin progress and result locations
+#   GET    /jobs/<id>/events    progress events (text/event-stream) until the job finishes
+#   DELETE /jobs/<id>           drop a queued job
+#   GET    /health              queue and running job counts
+# i.e. curl -s -X POST localhost:8765/jobs -d '{"image_path": "/evidence/SIR001234/host.raw", "priority": 10}'
+
+# Seconds between job state checks of an event stream
+EVENT_POLL_INTERVAL = 0.5
+# Seconds between keep-alive comments of an idle event stream
+EVENT_KEEPALIVE = 15
+# Largest request body accepted
+MAX_BODY_BYTES = 1024 * 1024
+FINAL_STATES = ('done', 'skipped', 'failed', 'cancelled')
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, **details):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.details = details
+
+
+def _timestamp(epoch):
+    return datetime.fromtimestamp(epoch).isoformat(timespec='seconds') if epoch is not None else None
+
+
+def job_state(job, scheduler):
+    """
+    :param job: scheduler Job
+    :param scheduler: JobScheduler
+    :return: 'queued', 'running', 'waiting' (for its next tier), 'done', 'skipped' (previously processed or claimed
+    by another node), 'failed' or 'cancelled' (removed from the queue)
+    """
+    if job.finished:
+        if job.exit_code == 0:
+            return 'done' if job.worker is not None else 'skipped'
+        return 'failed'
+    if any(_job is job for _job in scheduler.running()):
+        return 'running'
+    if scheduler.find(job.job_id) is job:
+        return 'queued' if job.worker is None else 'waiting'
+    return 'cancelled'
+
+
+def job_status(job, scheduler):
+    """
+    :param job: scheduler Job
+    :param scheduler: JobScheduler
+    :return: dict of the job status, per-plugin progress and result locations
+    """
+    state = job_state(job, scheduler)
+    status = {'job_id': job.job_id,
+              'image_path': job.image_path,
+              'case_id': job.case_id,
+              'priority': job.priority,
+              'requested_plugins': job.plugins,
+              'submitted': _timestamp(job.submitted),
+              'state': state,
+              'exit_code': job.exit_code}
+    if state in ('queued', 'waiting'):
+        status['queue_position'] = next((i for i, _job in enumerate(scheduler.pending()) if _job is job), None)
+
+    worker = job.worker
+    if worker is None:
+        status['tier'] = None
+        status['progress'] = None
+        status['results'] = None
+        return status
+
+    tiers = worker.plugin_tiers
+    tier_of = {name: tier_name for tier_name, names in tiers for name in names}
+    plugin_status = dict(worker.plugin_status)
+    runtime_stats = dict(worker.runtime_stats)
+    plugins = OrderedDict()
+    for name in worker.plugins.keys():
+        _status = plugin_status.get(name, 'pending')
+        plugins[name] = {'status': _status,
+                         'tier': tier_of.get(name, None),
+                         'seconds': runtime_stats.get(name, None) if _status not in ('pending', 'running') else None}
+    status['tier'] = {'index': min(job.tier, len(tiers) - 1) if len(tiers) > 0 else None,
+                      'name': tiers[min(job.tier, len(tiers) - 1)][0] if len(tiers) > 0 else None,
+                      'count': len(tiers)}
+    status['progress'] = {'total': len(plugins),
+                          'completed': sum(1 for plugin in plugins.values()
+                                           if plugin['status'] not in ('pending', 'running')),
+                          'plugins': plugins}
+
+    output_dir = worker.published_output_dir
+    status['results'] = {'output_dir': output_dir.as_posix(),
+                         'plugins': {name: Path.joinpath(output_dir, name).as_posix() for name in plugins.keys()
+                                     if Path.joinpath(output_dir, name).is_dir()},
+                         'log_file': worker.log_file.as_posix(),
+                         'trace_file': worker.trace_file.as_posix() if worker.trace_file.exists() else None,
+                         'processed': Path.joinpath(worker.case_dir, "{}{}".format(worker.image_name,
+                                                                                   case_processed_flag)).exists()}
+    return status
+
+
+def status_events(previous, current):
+    """
+    Progress events between two job status snapshots.
+    :param previous: job_status() dict, or None for the first snapshot
+    :param current: job_status() dict
+    :return: list of (event name, data)
+    """
+    if previous is None:
+        return [('status', current)]
+    events = []
+    if current['state'] != previous['state'] or current['tier'] != previous['tier']:
+        events.append(('state', {'job_id': current['job_id'], 'state': current['state'], 'tier': current['tier']}))
+    before = (previous['progress'] or {}).get('plugins', dict())
+    progress = current['progress'] or {}
+    for name, plugin in progress.get('plugins', dict()).items():
+        if before.get(name, {}).get('status') != plugin['status']:
+            events.append(('plugin', dict(plugin, job_id=current['job_id'], plugin=name,
+                                          completed=progress['completed'], total=progress['total'])))
+    return events
+
+
+class ApiRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'volatility_worker'
+
+    @property
+    def api(self):
+        return self.server.api
+
+    def log_message(self, format, *args):
+        self.api.logger.debug({'_action': whoami(),
+                               'message': format % args,
+                               'details': {'client': self.client_address[0]}})
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _route(self, method):
+        try:
+            if self.api.token is not None and not hmac.compare_digest(self.headers.get('Authorization', ''),
+                                                                      "Bearer %s" % self.api.token):
+                raise ApiError(401, "Missing or invalid API token.")
+            parts = [part for part in self.path.split('?', 1)[0].split('/') if part != '']
+            if method == 'GET' and parts == ['health']:
+                return self._send_json(200, self.api.health())
+            if parts[:1] != ['jobs'] or len(parts) > 3:
+                raise ApiError(404, "Not found.")
+            if len(parts) == 1:
+                if method == 'GET':
+                    return self._send_json(200, {'jobs': self.api.list_jobs()})
+                if method == 'POST':
+                    job = self.api.submit(self._read_json())
+                    return self._send_json(201, {'job_id': job.job_id,
+                                                 'state': job_state(job, self.api.scheduler),
+                                                 'links': {'status': "/jobs/%s" % job.job_id,
+                                                           'events': "/jobs/%s/events" % job.job_id}})
+                raise ApiError(405, "Method not allowed.")
+            job = self.api.get_job(parts[1])
+            if len(parts) == 3:
+                if parts[2] != 'events' or method != 'GET':
+                    raise ApiError(404, "Not found.")
+                return self._stream_events(job)
+            if method == 'GET':
+                return self._send_json(200, job_status(job, self.api.scheduler))
+            if method == 'DELETE':
+                self.api.cancel(job)
+                return self._send_json(200, job_status(job, self.api.scheduler))
+            raise ApiError(405, "Method not allowed.")
+        except ApiError as _err:
+            self._send_json(_err.status, dict(_err.details, error=_err.message))
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away, i.e. stopped following an event stream
+            pass
+        except Exception as _err:
+            self.api.logger.error({'_action': whoami(),
+                                   'message': "API request failed.",
+                                   'details': {'method': method, 'path': self.path},
+                                   'errors': [str(_err)]})
+            self._send_json(500, {'error': str(_err)})
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            raise ApiError(400, "Invalid Content-Length.")
+        if length > MAX_BODY_BYTES:
+            raise ApiError(413, "Request body too large.")
+        try:
+            body = json.loads(self.rfile.read(length).decode('utf-8') or 'null')
+        except ValueError as _err:
+            raise ApiError(400, "Request body is not JSON: %s" % _err)
+        if not isinstance(body, dict):
+            raise ApiError(400, "Request body must be a JSON object.")
+        return body
+
+    def _stream_events(self, job):
+        """
+        Server-sent events: a 'status' snapshot, then 'state' and 'plugin' events as the job progresses, and a final
+        'end' event with the complete status once the job is finished.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        previous = None
+        last_write = time()
+        while True:
+            current = job_status(job, self.api.scheduler)
+            for event, data in status_events(previous, current):
+                self.wfile.write(("event: %s\ndata: %s\n\n" % (event, json.dumps(data, default=str))).encode('utf-8'))
+                last_write = time()
+            if current['state'] in FINAL_STATES:
+                self.wfile.write(("event: end\ndata: %s\n\n" % json.dumps(current, default=str)).encode('utf-8'))
+                self.wfile.flush()
+                return
+            if time() - last_write >= EVENT_KEEPALIVE:
+                self.wfile.write(b": keep-alive\n\n")
+                last_write = time()
+            self.wfile.flush()
+            previous = current
+            sleep(EVENT_POLL_INTERVAL)
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_DELETE(self):
+        self._route('DELETE')
+
+
+class ApiServer:
+    """
+    HTTP API submitting jobs straight into the scheduler, next to the directory watchdog.  Requests are served on
+    threads of a ThreadingHTTPServer, itself running on a background thread.
+    """
+    def __init__(self, scheduler, logger=None, host=api_host, port=api_port, token=api_token,
+                 history=api_job_history, folders=MONITORED_FOLDERS, patterns=MEM_DUMP_FILE_PATTERN):
+        """
+        :param scheduler: JobScheduler
+        :param logger: logger instance
+        :param host: address to listen on
+        :param port: port to listen on; 0 picks a free port
+        :param token: bearer token required from clients, None for none
+        :param history: finished jobs kept for status queries
+        :param folders: images must be under one of these folders, as for the watchdog
+        :param patterns: image file name patterns, as for the watchdog
+        """
+        self.scheduler = scheduler
+        self.folders = [Path(folder).resolve() for folder in folders]
+        self.patterns = list(patterns)
+        self.logger = logger if logger is not None else logging.getLogger('root')
+        self.host = host
+        self.port = port
+        self.token = token
+        self.history = history
+        self._lock = threading.Lock()
+        # job ID -> Job submitted through the API
+        self._jobs = OrderedDict()
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), ApiRequestHandler)
+        self._server.daemon_threads = True
+        self._server.api = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="api", daemon=True)
+        self._thread.start()
+        self.logger.info({'_action': whoami(),
+                          'message': "HTTP API listening on %s:%d." % (self.host, self.port)})
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def health(self):
+        return {'queued': len(self.scheduler), 'running': len(self.scheduler.running())}
+
+    def submit(self, request):
+        """
+        Queue an image already on disk, with no file transfer wait.
+        :param request: dict with 'image_path' and optional 'case_id', 'priority', 'plugins' and 'force'
+        :return: Job
+        """
+        image_path = request.get('image_path', None)
+        if not isinstance(image_path, str) or image_path == '':
+            raise ApiError(400, "'image_path' is required.")
+        _path = Path(image_path)
+        if not _path.is_absolute():
+            raise ApiError(400, "'image_path' must be an absolute path.")
+        # '..' and symlinks cannot leave the monitored folders
+        _path = Path(os.path.normpath(_path.as_posix()))
+        _real = _path.resolve()
+        if not any(folder in _real.parents for folder in self.folders):
+            raise ApiError(400, "Image is not in a monitored folder.", image_path=image_path)
+        if not any(fnmatch.fnmatch(_path.name.lower(), pattern.lower()) for pattern in self.patterns) \
+                or case_output_dir in _path.parts:
+            raise ApiError(400, "Not a memory image file name.", image_path=image_path, patterns=self.patterns)
+        if not _path.is_file():
+            raise ApiError(404, "Image not found.", image_path=image_path)
+
+        case_id, case_dir = get_case_id(_path)
+        if case_id == "":
+            raise ApiError(400, "Image is not in a case folder.", image_path=image_path)
+        if request.get('case_id', None) is not None and str(request['case_id']).upper() != case_id:
+            raise ApiError(400, "'case_id' does not match the case folder of the image.", case_id=case_id)
+
+        priority = request.get('priority', 0)
+        if not isinstance(priority, int) or isinstance(priority, bool):
+            raise ApiError(400, "'priority' must be an integer.")
+        plugins = request.get('plugins', None)
+        if plugins is not None and (not isinstance(plugins, list) or len(plugins) == 0
+                                    or not all(isinstance(plugin, str) and plugin != '' for plugin in plugins)):
+            raise ApiError(400, "'plugins' must be a non-empty list of plugin names.")
+
+        force = bool(request.get('force', False))
+        if Path.joinpath(case_dir, "{}{}".format(_path.stem, case_processed_flag)).exists() and not force:
+            raise ApiError(409, "Image already processed.  Submit with 'force' to re-process.", image_path=image_path)
+
+        # The processed flag of a forced job is removed when it starts (see Job.clear_processed_flag())
+        job = self.scheduler.submit(_path.as_posix(), priority=priority, plugins=plugins, force=force)
+        if job is None:
+            existing = next((_job for _job in self.scheduler.pending() + self.scheduler.running()
+                             if _job.image_path == _path.as_posix()), None)
+            raise ApiError(409, "Image already queued or running.",
+                           job_id=existing.job_id if existing is not None else None)
+
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._trim()
+        self.logger.info({'_action': whoami(),
+                          'message': "Job submitted through the API.",
+                          'details': {'job_id': job.job_id, 'path': job.image_path, 'priority': priority,
+                                      'plugins': plugins}})
+        # Start it now rather than on the next watchdog loop
+        self.scheduler.dispatch()
+        return job
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    def get_job(self, job_id):
+        """
+        :param job_id: Job.job_id
+        :return: Job submitted through the API, or queued / running by the watchdog
+        """
+        with self._lock:
+            job = self._jobs.get(job_id, None)
+        if job is None:
+            job = self.scheduler.find(job_id)
+        if job is None:
+            raise ApiError(404, "Unknown job.", job_id=job_id)
+        return job
+
+    def cancel(self, job):
+        if job_state(job, self.scheduler) != 'queued' or not self.scheduler.remove(job.image_path):
+            raise ApiError(409, "Only queued jobs can be cancelled.", job_id=job.job_id)
+        self.logger.info({'_action': whoami(),
+                          'message': "Job cancelled through the API.",
+                          'details': {'job_id': job.job_id, 'path': job.image_path}})
+
+    def list_jobs(self):
+        with self._lock:
+            jobs = OrderedDict(self._jobs)
+        for job in self.scheduler.pending() + self.scheduler.running():
+            jobs.setdefault(job.job_id, job)
+        return [{'job_id': job.job_id, 'image_path': job.image_path, 'case_id': job.case_id,
+                 'priority': job.priority, 'submitted': _timestamp(job.submitted),
+                 'state': job_state(job, self.scheduler)} for job in jobs.values()]
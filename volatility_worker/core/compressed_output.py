@@ -0,0 +1,168 @@
+import io
+import sys
+import gzip
+import json
+import lzma
+import shutil
+import argparse
+from pathlib import Path
+
+# Compression name -> file name suffix.  None writes plain files.
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'lzma': '.xz'}
+
+_MAGIC = ((b'\x1f\x8b', 'gzip'), (b'\xfd7zXZ\x00', 'lzma'))
+
+
+def compressed_path(path, compression=None):
+    """
+    :param path: (Path) plain output file, i.e. <plugin>/<plugin>.txt
+    :param compression: 'gzip', 'lzma' or None
+    :return: (Path) file actually written, i.e. <plugin>/<plugin>.txt.gz
+    """
+    path = Path(path)
+    if compression is None:
+        return path
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError("Unknown compression '%s'." % compression)
+    return path.with_name(path.name + COMPRESSION_SUFFIXES[compression])
+
+
+def resolve_output(path):
+    """
+    Find an output file written with any compression.
+    :param path: (Path) plain output file name, or an actual (compressed) file
+    :return: (Path) existing file, or None
+    """
+    path = Path(path)
+    for candidate in [path] + [path.with_name(path.name + suffix) for suffix in COMPRESSION_SUFFIXES.values()]:
+        if candidate.is_file():
+            return candidate
+    return None
+
+
+def open_output(path, compression=None, newline=None):
+    """
+    Open an output file for streaming text writes through the compressor.
+    :param path: (Path) file to write; see compressed_path()
+    :param compression: 'gzip', 'lzma' or None
+    :param newline: as for open(), i.e. '' for csv writers
+    :return: text file object
+    """
+    path = Path(path)
+    if compression == 'gzip':
+        return gzip.open(path.as_posix(), 'wt', encoding='utf-8', newline=newline, compresslevel=6)
+    if compression == 'lzma':
+        return lzma.open(path.as_posix(), 'wt', encoding='utf-8', newline=newline)
+    if compression is None:
+        return path.open('w', encoding='utf-8', newline=newline)
+    raise ValueError("Unknown compression '%s'." % compression)
+
+
+def open_binary_output(path, compression=None):
+    """
+    Open an output file for streaming binary writes through the compressor.
+    :param path: (Path) file to write; see compressed_path()
+    :param compression: 'gzip', 'lzma' or None
+    :return: binary file object
+    """
+    path = Path(path)
+    if compression == 'gzip':
+        return gzip.open(path.as_posix(), 'wb', compresslevel=6)
+    if compression == 'lzma':
+        return lzma.open(path.as_posix(), 'wb')
+    if compression is None:
+        return path.open('wb')
+    raise ValueError("Unknown compression '%s'." % compression)
+
+
+def compress_file(path, compression=None):
+    """
+    Compress a plain output file in place, i.e. for files another program (Volatility) needed uncompressed.
+    :param path: (Path) plain file, removed once compressed
+    :param compression: 'gzip', 'lzma' or None (the file is left as-is)
+    :return: (Path) compressed file; see compressed_path()
+    """
+    path = Path(path)
+    target = compressed_path(path, compression)
+    if target == path:
+        return path
+    with path.open('rb') as f, open_binary_output(target, compression) as out:
+        shutil.copyfileobj(f, out, 1024 * 1024)
+    path.unlink()
+    return target
+
+
+def detect_compression(path):
+    """
+    :param path: (Path) file
+    :return: 'gzip', 'lzma' or None, from the file header
+    """
+    with Path(path).open('rb') as f:
+        header = f.read(6)
+    return next((name for magic, name in _MAGIC if header.startswith(magic)), None)
+
+
+def open_result(path, errors='replace'):
+    """
+    Open a plugin output for streaming text reads, decompressing on the fly.  'path' may be the plain output file
+    name (i.e. <plugin>.txt) when the file was written compressed.
+    :param path: (Path) output file
+    :param errors: decoding error handler
+    :return: text file object
+    """
+    _path = resolve_output(path)
+    if _path is None:
+        raise FileNotFoundError("No output file '%s'." % Path(path).as_posix())
+    compression = detect_compression(_path)
+    if compression == 'gzip':
+        return gzip.open(_path.as_posix(), 'rt', encoding='utf-8', errors=errors)
+    if compression == 'lzma':
+        return lzma.open(_path.as_posix(), 'rt', encoding='utf-8', errors=errors)
+    return _path.open('r', encoding='utf-8', errors=errors)
+
+
+def load_json(path):
+    """
+    :param path: (Path) JSON output file, compressed or not
+    :return: decoded JSON
+    """
+    with open_result(path) as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print plugin output files, decompressing gzip / lzma outputs.")
+    parser.add_argument('files', nargs='+', help="output files; the plain name (i.e. pslist.txt) finds compressed "
+                                                 "copies")
+    parser.add_argument('--head', type=int, default=None, help="print the first N lines of each file")
+    args = parser.parse_args(argv)
+
+    out = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace', write_through=False)
+    try:
+        for path in args.files:
+            with open_result(path) as f:
+                if args.head is None:
+                    shutil.copyfileobj(f, out, 1024 * 1024)
+                else:
+                    for i, line in enumerate(f):
+                        if i >= args.head:
+                            break
+                        out.write(line)
+        out.flush()
+    except BrokenPipeError:
+        # i.e. piped into 'head'
+        return 0
+    except FileNotFoundError as _err:
+        sys.stderr.write("%s\n" % _err)
+        return 1
+    finally:
+        # Otherwise sys.stdout is closed with the wrapper
+        try:
+            out.detach()
+        except OSError:
+            pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
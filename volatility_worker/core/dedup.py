@@ -0,0 +1,152 @@
+import os
+import re
+import json
+import errno
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from .utils import whoami
+
+# Volatility dump file names embed the process ID and object offsets, i.e. module.1234.0x3f2a0b30.77a10000.dll,
+# executable.1234.exe, driver.fffff88001234000.sys, file.None.0xfffffa8002f7c2a0.dat
+_PID_RE = re.compile(r'^(?:module|executable|process)\.(?P<pid>\d+)\.')
+_OFFSET_RE = re.compile(r'(?:^|\.)(?:0x)?(?P<offset>[0-9a-fA-F]{6,16})(?=\.)')
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def hash_file(file_path, block_size=1024 * 1024):
+    """
+    SHA-256 of a file.  hashlib releases the GIL on large updates, so this scales across threads.
+    :param file_path: (Path) file to hash
+    :param block_size: read size
+    :return: (str) hex digest
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def describe_dump(file_name):
+    """
+    Extract process ID and object offset from a Volatility dump file name.
+    :param file_name: (str) dump file name
+    :return: dict with 'pid' and 'offset' (either may be None)
+    """
+    pid = _PID_RE.match(file_name)
+    offset = _OFFSET_RE.search(file_name, pid.end() - 1 if pid else 0)
+    return {'pid': int(pid.group('pid')) if pid else None,
+            'offset': "0x%s" % offset.group('offset').lower() if offset else None}
+
+
+class DedupStore:
+    """
+    Content-addressed store for artifacts extracted by '--dump-dir' plugins (dlldump, procdump, dumpfiles etc.).
+    Each unique artifact is kept once, under its SHA-256, and the per-image copies are replaced with hardlinks.
+    The store must be on the same file system as the case folders for hardlinks to work.
+    """
+    def __init__(self, store_dir, workers=4, logger=None):
+        """
+        :param store_dir: (Path) root of the content-addressed store
+        :param workers: (int) hashing threads
+        :param logger: logger instance
+        """
+        self.store_dir = Path(store_dir)
+        self.workers = workers
+        self.logger = logger if logger is not None else logging.getLogger('root')
+        self._cross_device_warned = False
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+
+    def object_path(self, digest):
+        return Path.joinpath(self.store_dir, digest[0:2], digest[2:4], digest)
+
+    def ingest_dir(self, plugin_dir, plugin_name, exclude=()):
+        """
+        Hash every artifact in a plugin output folder, move unique content into the store and hardlink the
+        originals to it.  A manifest mapping hash to original names and offsets is written to the folder.
+        :param plugin_dir: (Path) plugin output folder
+        :param plugin_name: plugin name
+        :param exclude: file names to leave alone (i.e. plugin text output)
+        :return: dict of stats
+        """
+        _dir = Path(plugin_dir)
+        files = [entry for entry in os.scandir(_dir.as_posix())
+                 if entry.is_file(follow_symlinks=False) and entry.name != MANIFEST_FILE
+                 and entry.name not in exclude]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            digests = list(executor.map(lambda entry: hash_file(entry.path), files))
+
+        manifest = dict()
+        stats = {'files': len(files), 'unique': 0, 'deduplicated': 0, 'bytes_saved': 0}
+        for entry, digest in zip(files, digests):
+            size = entry.stat(follow_symlinks=False).st_size
+            record = {'name': entry.name, 'size': size}
+            record.update(describe_dump(entry.name))
+            manifest.setdefault(digest, []).append(record)
+
+            if self._link(Path(entry.path), digest):
+                stats['deduplicated'] += 1
+                stats['bytes_saved'] += size
+            else:
+                stats['unique'] += 1
+
+        manifest_file = Path.joinpath(_dir, MANIFEST_FILE)
+        with manifest_file.open('w') as f:
+            json.dump({'plugin': plugin_name, 'algorithm': 'sha256', 'artifacts': manifest}, f, indent=1)
+
+        self.logger.info({'_action': whoami(),
+                          'message': "Deduplicated '%s' artifacts." % plugin_name,
+                          'details': dict(stats, manifest=manifest_file.as_posix())
+                          })
+        return stats
+
+    def _link(self, file_path, digest):
+        """
+        Replace file_path with a hardlink to the stored object, storing it first if it is new.
+        :return: True if the content was already in the store
+        """
+        obj = self.object_path(digest)
+        if obj.exists():
+            if os.path.samefile(obj.as_posix(), file_path.as_posix()):
+                return True
+            _tmp = file_path.with_name(file_path.name + '.dedup')
+            try:
+                os.link(obj.as_posix(), _tmp.as_posix())
+            except OSError as _err:
+                if _err.errno != errno.EXDEV:
+                    raise
+                self._warn_cross_device()
+                return False
+            os.replace(_tmp.as_posix(), file_path.as_posix())
+            return True
+
+        obj.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(file_path.as_posix(), obj.as_posix())
+        except FileExistsError:
+            # Stored concurrently by another worker
+            return self._link(file_path, digest)
+        except OSError as _err:
+            if _err.errno != errno.EXDEV:
+                raise
+            # Different file system; keep a copy in the store so hashes are still shared
+            _tmp = obj.with_name(obj.name + '.tmp')
+            shutil.copyfile(file_path.as_posix(), _tmp.as_posix())
+            os.replace(_tmp.as_posix(), obj.as_posix())
+            self._warn_cross_device()
+        return False
+
+    def _warn_cross_device(self):
+        if self._cross_device_warned:
+            return
+        self._cross_device_warned = True
+        self.logger.warning({'_action': whoami(),
+                             'message': "Dedup store is not on the same file system as the case folder.  "
+                                        "Artifacts cannot be hardlinked.",
+                             'details': {'store_dir': self.store_dir.as_posix()}
+                             })
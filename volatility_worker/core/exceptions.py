@@ -36,3 +36,15 @@ class OverrideConfigFailure(Exception):
             message = "Failed to process override configuration file."
         super().__init__(message)
         self.errors = errors
+
+
+class ChildProcessKilled(Exception):
+    def __init__(self, message=None, errors=None, reason=None, output=None, stderr=None):
+        if message is None:
+            message = "Volatility process killed (%s)." % reason
+        super().__init__(message)
+        self.errors = errors
+        self.reason = reason
+        # Output printed before the process was killed
+        self.output = output
+        self.stderr = stderr
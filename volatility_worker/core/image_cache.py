@@ -0,0 +1,225 @@
+import os
+import json
+import logging
+import tempfile
+import hashlib
+import threading
+from pathlib import Path
+from collections import Counter
+from time import time
+from configs.defaults import converted_image_cache, converted_image_cache_dir, converted_image_cache_max_bytes
+from .utils import whoami
+from .pool_prescan import index_path
+
+
+class ImageCache:
+    """
+    Disk-budgeted LRU store for converted memory images (i.e. *.vol files extracted from hpak).
+    Entries are keyed by a fingerprint of the source image, so re-processing the same image (or re-running a single
+    plugin) re-uses the previous conversion.  When the cache grows beyond 'max_bytes', the least recently used
+    entries are evicted.  Entries in use by an active job are pinned and never evicted.
+    """
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, cache_dir, max_bytes, logger=None, name="converted image cache"):
+        """
+        :param cache_dir: (Path) folder holding cached images and the cache index
+        :param max_bytes: (int) disk budget for cached images
+        :param logger: logger instance
+        :param name: cache name used in log messages
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.name = name
+        # Defaults to the daemon logger; the cache outlives individual workers
+        self.logger = logger if logger is not None else logging.getLogger('root')
+        self._lock = threading.RLock()
+        self._pins = Counter()
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._index = self._load_index()
+
+    @staticmethod
+    def fingerprint(image_path, sample_size=1024 * 1024):
+        """
+        Cheap fingerprint of a (potentially very large) memory image.  Samples from the start, middle and end of the
+        file are hashed instead of the whole image; as same-sized images often share those samples (i.e. zero-filled
+        tails), the file identity is hashed too: resolved path, device, inode, size and modification time.  The same
+        file re-processed hits the cache; another image, or an image re-acquired to the same path, does not.
+        :param image_path: path to source memory image
+        :param sample_size: bytes read per sample
+        :return: (str) hex digest
+        """
+        _path = Path(image_path)
+        stat = _path.stat()
+        size = stat.st_size
+        digest = hashlib.sha1(repr((_path.resolve().as_posix(), stat.st_dev, stat.st_ino, size,
+                                    stat.st_mtime_ns)).encode())
+        with _path.open('rb') as f:
+            for offset in (0, max(0, size // 2 - sample_size // 2), max(0, size - sample_size)):
+                f.seek(offset)
+                digest.update(f.read(sample_size))
+        return digest.hexdigest()
+
+    def entry_path(self, key, suffix):
+        return Path.joinpath(self.cache_dir, "%s.%s" % (key, suffix))
+
+    def get(self, key):
+        """
+        Look up a cached image.  A hit pins the entry until release() is called.
+        :param key: image fingerprint
+        :return: (Path) cached image or None
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+
+            _path = Path.joinpath(self.cache_dir, entry['file'])
+            if not _path.exists():
+                # Removed behind our back
+                del self._index[key]
+                self._save_index()
+                return None
+
+            entry['last_used'] = time()
+            self._pins[key] += 1
+            self._save_index()
+            return _path
+
+    def add(self, key, producer, suffix, source=None):
+        """
+        Create a cache entry using 'producer' and pin it.
+        :param key: image fingerprint
+        :param producer: callable accepting the (Path) output file to create
+        :param suffix: cached file extension
+        :param source: (str) source image path, informational only
+        :return: (Path) cached image
+        """
+        _path = self.entry_path(key, suffix)
+        # Unique per producer: concurrent misses for the same key must not write the same file
+        fd, _tmp = tempfile.mkstemp(dir=self.cache_dir.as_posix(), prefix=_path.name + '.', suffix='.partial')
+        os.close(fd)
+        _tmp = Path(_tmp)
+        try:
+            producer(_tmp)
+            _tmp.replace(_path)
+        except Exception:
+            if _tmp.exists():
+                _tmp.unlink()
+            raise
+
+        with self._lock:
+            self._index[key] = {'file': _path.name,
+                                'size': self.disk_size(_path),
+                                'last_used': time(),
+                                'source': source}
+            self._pins[key] += 1
+            self.evict()
+            self._save_index()
+        return _path
+
+    def release(self, key):
+        """
+        Unpin an entry once the job using it is finished.
+        :param key: image fingerprint
+        :return: None
+        """
+        with self._lock:
+            if self._pins[key] > 0:
+                self._pins[key] -= 1
+            if self._pins[key] == 0:
+                del self._pins[key]
+            self.evict()
+            self._save_index()
+
+    def total_bytes(self):
+        return sum(entry['size'] for entry in self._index.values())
+
+    @staticmethod
+    def disk_size(path):
+        """
+        :param path: (Path) cached file
+        :return: bytes allocated on disk, which is less than the file size for sparse files
+        """
+        stat = Path(path).stat()
+        if hasattr(stat, 'st_blocks'):
+            return min(stat.st_size, stat.st_blocks * 512)
+        return stat.st_size
+
+    def evict(self, reserve=0):
+        """
+        Remove least recently used, unpinned entries until the cache fits the byte budget.
+        :param reserve: bytes to make room for, i.e. before adding an entry
+        :return: list of evicted keys
+        """
+        evicted = []
+        with self._lock:
+            total = self.total_bytes()
+            for key, entry in sorted(self._index.items(), key=lambda item: item[1]['last_used']):
+                if total + reserve <= self.max_bytes:
+                    break
+                if self._pins[key] > 0:
+                    continue
+                _file = Path.joinpath(self.cache_dir, entry['file'])
+                # Pool tag index built beside the cached image, see pool_prescan.py
+                for _path in (_file, index_path(_file)):
+                    try:
+                        _path.unlink()
+                    except FileNotFoundError:
+                        pass
+                total -= entry['size']
+                evicted.append(key)
+
+            for key in evicted:
+                self.logger.info({'_action': whoami(),
+                                  'message': "Evicted %s from %s." % (self._index[key]['file'], self.name),
+                                  'details': {'source': self._index[key]['source'],
+                                              'size': self._index[key]['size']}
+                                  })
+                del self._index[key]
+
+            if total + reserve > self.max_bytes:
+                self.logger.warning({'_action': whoami(),
+                                     'message': "%s is over budget; remaining entries are in use."
+                                                % self.name.capitalize(),
+                                     'details': {'total_bytes': total, 'max_bytes': self.max_bytes}
+                                     })
+        return evicted
+
+    def _load_index(self):
+        index_file = Path.joinpath(self.cache_dir, self.INDEX_FILE)
+        try:
+            with index_file.open('r') as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            index = dict()
+
+        # Drop entries whose files are gone
+        return {k: v for k, v in index.items() if Path.joinpath(self.cache_dir, v['file']).exists()}
+
+    def _save_index(self):
+        index_file = Path.joinpath(self.cache_dir, self.INDEX_FILE)
+        _tmp = index_file.with_name(index_file.name + '.tmp')
+        with _tmp.open('w') as f:
+            json.dump(self._index, f)
+        _tmp.replace(index_file)
+
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """
+    Process-wide converted image cache, created on first use from 'configs/defaults.py'.
+    :return: ImageCache or None if the cache is disabled
+    """
+    global _image_cache
+    if not converted_image_cache:
+        return None
+
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache(converted_image_cache_dir, converted_image_cache_max_bytes)
+    return _image_cache
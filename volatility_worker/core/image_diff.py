@@ -0,0 +1,159 @@
+import sys
+import json
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from configs.defaults import diff_plugins
+from .utils import whoami
+from .compressed_output import load_json, resolve_output
+
+DIFF_DIR = 'diffs'
+
+
+def row_hash(row, columns):
+    """
+    Normalised fingerprint of a row: the values of 'columns' (in order), JSON encoded and hashed.
+    :param row: row dict
+    :param columns: column names to include
+    :return: (bytes) 16 byte digest
+    """
+    # repr() of a tuple of JSON values is deterministic and much cheaper than json.dumps()
+    return hashlib.blake2b(repr(tuple(map(row.get, columns))).encode('utf-8'), digest_size=16).digest()
+
+
+def load_rows(results_file):
+    """
+    :param results_file: (Path) <plugin>.json with a list of row dicts, compressed or not
+    :return: list of row dicts, or None if missing / not structured
+    """
+    try:
+        rows = load_json(results_file)
+    except (OSError, EOFError, ValueError):
+        return None
+    return rows if isinstance(rows, list) else None
+
+
+def diff_rows(base_rows, target_rows, key=(), ignore=()):
+    """
+    Added, removed and changed rows between two images, using set operations.  Rows are matched by their 'key'
+    columns and compared by a hash of all columns (minus 'ignore', i.e. kernel offsets which differ between acquisitions).
+    :param base_rows: rows of the earlier image
+    :param target_rows: rows of the later image
+    :param key: columns identifying a row (i.e. PID, Name, Start).  Default: the whole row, so nothing is 'changed'.
+    :param ignore: columns excluded from comparison
+    :return: dict with 'added', 'removed' and 'changed' (list of {'before', 'after'})
+    """
+    columns = []
+    seen = set(ignore)
+    for rows in (base_rows, target_rows):
+        for row in rows:
+            if not seen.issuperset(row.keys()):
+                for column in row.keys():
+                    if column not in seen:
+                        seen.add(column)
+                        columns.append(column)
+    key = [column for column in key if column in columns] or columns
+
+    def _index(rows):
+        index = dict()
+        # key -> rows seen with it so far
+        occurrences = dict()
+        for row in rows:
+            _key = tuple(map(row.get, key))
+            try:
+                hash(_key)
+            except TypeError:
+                # Nested (list / dict) values
+                _key = repr(_key)
+            # Duplicate keys (i.e. identical rows) are kept apart by their position among equals
+            position = occurrences.get(_key, 0)
+            occurrences[_key] = position + 1
+            index[(_key, position)] = (row_hash(row, columns) if key is not columns else None, row)
+        return index
+
+    base = _index(base_rows)
+    target = _index(target_rows)
+    base_keys = set(base.keys())
+    target_keys = set(target.keys())
+
+    return {'added': [target[_key][1] for _key in target_keys - base_keys],
+            'removed': [base[_key][1] for _key in base_keys - target_keys],
+            'changed': [{'before': base[_key][1], 'after': target[_key][1]}
+                        for _key in base_keys & target_keys if base[_key][0] != target[_key][0]]}
+
+
+def previous_image(case_output_dir, image_name, plugin):
+    """
+    Most recently processed other image in the case with structured results for 'plugin'.
+    :param case_output_dir: (Path) case plugins output folder
+    :param image_name: image to exclude
+    :param plugin: plugin name
+    :return: image name or None
+    """
+    candidates = []
+    for image_dir in Path(case_output_dir).iterdir():
+        if not image_dir.is_dir() or image_dir.name in (image_name, DIFF_DIR):
+            continue
+        results_file = Path.joinpath(image_dir, plugin, "%s.json" % plugin)
+        results_file = resolve_output(results_file)
+        if results_file is not None:
+            candidates.append((results_file.stat().st_mtime, image_dir.name))
+    return max(candidates)[1] if len(candidates) > 0 else None
+
+
+def write_diff_report(case_output_dir, base_image, target_image, plugin, key=(), ignore=(), logger=None):
+    """
+    Diff the structured results of a plugin between two images of a case and write the report to
+    <case output dir>/diffs/<base image>__<target image>/<plugin>.json
+    :param case_output_dir: (Path) case plugins output folder
+    :param base_image: earlier image name
+    :param target_image: later image name
+    :param plugin: plugin name
+    :param key: row identity columns, see diff_rows()
+    :param ignore: columns excluded from comparison
+    :param logger: logger instance
+    :return: (Path) report file, or None if either image has no structured results
+    """
+    logger = logger if logger is not None else logging.getLogger('root')
+    case_output_dir = Path(case_output_dir)
+    base_rows = load_rows(Path.joinpath(case_output_dir, base_image, plugin, "%s.json" % plugin))
+    target_rows = load_rows(Path.joinpath(case_output_dir, target_image, plugin, "%s.json" % plugin))
+    if base_rows is None or target_rows is None:
+        return None
+
+    diff = diff_rows(base_rows, target_rows, key, ignore)
+    counts = {name: len(rows) for name, rows in diff.items()}
+
+    report_file = Path.joinpath(case_output_dir, DIFF_DIR, "%s__%s" % (base_image, target_image), "%s.json" % plugin)
+    report_file.parent.mkdir(parents=True, exist_ok=True)
+    with report_file.open('w') as f:
+        json.dump(dict({'plugin': plugin, 'base': base_image, 'target': target_image, 'counts': counts}, **diff), f)
+
+    logger.info({'_action': whoami(),
+                 'message': "Plugin '%s' differences between '%s' and '%s'." % (plugin, base_image, target_image),
+                 'details': {'plugin': plugin, 'base': base_image, 'target': target_image,
+                             'counts': counts, 'report_file': report_file.as_posix()}
+                 })
+    return report_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Diff structured plugin results between two images of a case.")
+    parser.add_argument('case_output_dir', help="case plugins output folder")
+    parser.add_argument('base_image', help="earlier image name")
+    parser.add_argument('target_image', help="later image name")
+    parser.add_argument('plugins', nargs='+', help="plugin names")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for plugin in args.plugins:
+        options = diff_plugins.get(plugin, dict())
+        report_file = write_diff_report(args.case_output_dir, args.base_image, args.target_image, plugin,
+                                        options.get('key', ()), options.get('ignore', ()))
+        print("%s: %s" % (plugin, report_file.as_posix() if report_file is not None else "no structured results"))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
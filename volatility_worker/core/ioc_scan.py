@@ -0,0 +1,239 @@
+import re
+import mmap
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from configs.defaults import AUTO_EXTRACT_SUFFIX
+from .utils import whoami, process_pool_context
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Pattern file lines: 'hex:<hex bytes>' for byte patterns, 'utf16:<text>' for UTF-16LE only, anything else is a
+# string matched as ASCII and UTF-16LE.  Blank lines and lines starting with '#' are ignored.
+_HEX_PREFIX = 'hex:'
+_UTF16_PREFIX = 'utf16:'
+# Image formats whose file offsets are physical addresses (raw images, including those converted to '.vol').  Crash
+# dumps ('.dmp', '.dump') and other formats have headers and gaps, so their hits only carry the file offset.
+RAW_IMAGE_SUFFIXES = ('.raw', '.img', '.mem', '.vmem', '.bin', '.' + AUTO_EXTRACT_SUFFIX.lower())
+
+
+def load_patterns(pattern_files):
+    """
+    :param pattern_files: IOC list files
+    :return: dict of pattern bytes: (name, type)
+    """
+    patterns = dict()
+    for pattern_file in pattern_files:
+        with open(pattern_file, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                line = line.strip()
+                if line == '' or line.startswith('#'):
+                    continue
+                if line.lower().startswith(_HEX_PREFIX):
+                    value = line[len(_HEX_PREFIX):].strip()
+                    patterns[bytes.fromhex(value)] = (value, 'hex')
+                elif line.lower().startswith(_UTF16_PREFIX):
+                    value = line[len(_UTF16_PREFIX):]
+                    patterns[value.encode('utf-16-le')] = (value, 'utf16')
+                else:
+                    patterns[line.encode('utf-8')] = (line, 'ascii')
+                    patterns[line.encode('utf-16-le')] = (line, 'utf16')
+    patterns.pop(b'', None)
+    return patterns
+
+
+def _trie_regex(patterns):
+    """
+    Regular expression matching any of the patterns, factored into a trie (common prefixes shared) so the regex
+    engine branches on each byte instead of trying every alternative.
+    :param patterns: iterable of pattern bytes
+    :return: (bytes) regular expression
+    """
+    trie = dict()
+    for pattern in patterns:
+        node = trie
+        for byte in pattern:
+            node = node.setdefault(byte, dict())
+        node[None] = True
+
+    def _render(node):
+        terminal = None in node
+        branches = [re.escape(bytes([byte])) + _render(child) for byte, child in sorted(
+            (k, v) for k, v in node.items() if k is not None)]
+        if len(branches) == 0:
+            return b''
+        regex = branches[0] if len(branches) == 1 else b'(?:' + b'|'.join(branches) + b')'
+        # Prefer the longest match; a shorter pattern matches if the longer one does not
+        return b'(?:' + regex + b')?' if terminal else regex
+
+    return _render(trie)
+
+
+class PatternSet:
+    """
+    Patterns compiled into one multi-pattern matcher: an Aho-Corasick automaton if 'pyahocorasick' is installed,
+    otherwise a trie-shaped regular expression (which reports non-overlapping matches only).
+    """
+    def __init__(self, patterns):
+        """
+        :param patterns: dict of pattern bytes: (name, type)
+        """
+        self.count = len(patterns)
+        self.max_length = max(len(pattern) for pattern in patterns.keys()) if self.count > 0 else 0
+        self.automaton = ahocorasick is not None
+        if self.automaton:
+            # Bytes are mapped 1:1 to code points (latin-1) so the str automaton matches raw memory
+            self.matcher = ahocorasick.Automaton()
+            for pattern, (name, _type) in patterns.items():
+                self.matcher.add_word(pattern.decode('latin-1'), (len(pattern), name, _type))
+            self.matcher.make_automaton()
+        else:
+            self.matcher = re.compile(_trie_regex(patterns.keys()), re.DOTALL)
+            self.names = patterns
+
+    def scan(self, data, base_offset=0):
+        """
+        :param data: bytes-like buffer
+        :param base_offset: offset of data in the image
+        :return: generator of (offset, name, type)
+        """
+        if self.count == 0:
+            return
+        if self.automaton:
+            for end, (length, name, _type) in self.matcher.iter(bytes(data).decode('latin-1')):
+                yield base_offset + end - length + 1, name, _type
+        else:
+            for match in self.matcher.finditer(data):
+                name, _type = self.names[match.group(0)]
+                yield base_offset + match.start(), name, _type
+
+
+# Set in pool processes by _init_pool()
+_pool_patterns = None
+
+
+def _init_pool(pattern_set):
+    global _pool_patterns
+    _pool_patterns = pattern_set
+
+
+def _scan_chunk(image_path, start, length, overlap, max_hits):
+    """
+    Scan image[start:start + length + overlap] in a pool process.  Only matches starting before start + length are
+    reported; the overlap catches patterns spanning the chunk boundary.
+    :return: list of (offset, name, type)
+    """
+    hits = []
+    counts = dict()
+    with open(image_path, 'rb') as f:
+        size = min(length + overlap, Path(image_path).stat().st_size - start)
+        if size <= 0:
+            return hits
+        with mmap.mmap(f.fileno(), size, offset=start, access=mmap.ACCESS_READ) as data:
+            for offset, name, _type in _pool_patterns.scan(data, start):
+                if offset >= start + length:
+                    continue
+                counts[name] = counts.get(name, 0) + 1
+                if max_hits is None or counts[name] <= max_hits:
+                    hits.append((offset, name, _type))
+    return hits
+
+
+_cache_lock = threading.Lock()
+# pattern files version -> PatternSet
+_pattern_sets = dict()
+# (pattern files version, workers) -> ProcessPoolExecutor with the compiled patterns loaded
+_pools = dict()
+
+
+def _version(pattern_files):
+    return tuple((Path(pattern_file).as_posix(), Path(pattern_file).stat().st_mtime_ns)
+                 for pattern_file in pattern_files)
+
+
+def get_pattern_set(pattern_files):
+    """
+    Compiled patterns, cached between images until a pattern file changes.
+    :param pattern_files: IOC list files
+    :return: (version, PatternSet)
+    """
+    version = _version(pattern_files)
+    with _cache_lock:
+        if version not in _pattern_sets:
+            # Drop sets (and their pools) compiled from older versions of the files
+            for stale in [key for key in _pattern_sets.keys()
+                          if set(path for path, _ in key) == set(path for path, _ in version)]:
+                del _pattern_sets[stale]
+                for pool_key in [key for key in _pools.keys() if key[0] == stale]:
+                    _pools.pop(pool_key).shutdown(wait=False)
+            _pattern_sets[version] = PatternSet(load_patterns(pattern_files))
+        return version, _pattern_sets[version]
+
+
+def _get_pool(version, pattern_set, workers):
+    with _cache_lock:
+        if (version, workers) not in _pools:
+            _pools[(version, workers)] = ProcessPoolExecutor(max_workers=workers, mp_context=process_pool_context(),
+                                                             initializer=_init_pool, initargs=(pattern_set,))
+        return _pools[(version, workers)]
+
+
+def shutdown_pools(wait=True):
+    """
+    Stop the cached pool processes, i.e. when the daemon exits.  Pools are started again by the next scan.
+    :param wait: wait for running scans and the pool processes to exit
+    :return: None
+    """
+    with _cache_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=wait)
+
+
+def scan_image(image_path, pattern_files, workers=4, chunk_size=64 * 1024 ** 2, max_hits=1000, logger=None):
+    """
+    Scan a memory image for all patterns in one pass.  The image is memory-mapped in overlapping chunks scanned by
+    a process pool.  Hits carry their file offset ('Offset(File)'), and for raw images (RAW_IMAGE_SUFFIXES) the same
+    value as physical address ('Offset(P)').
+    :param image_path: (Path) memory image
+    :param pattern_files: IOC list files
+    :param workers: pool processes
+    :param chunk_size: bytes per chunk; rounded to the mmap allocation granularity
+    :param max_hits: hits reported per pattern and chunk, None for all
+    :param logger: logger instance
+    :return: list of row dicts sorted by offset
+    """
+    logger = logger if logger is not None else logging.getLogger('root')
+    version, pattern_set = get_pattern_set(pattern_files)
+    if pattern_set.count == 0:
+        return []
+    if ahocorasick is None:
+        logger.warning({'_action': whoami(),
+                        'message': "'pyahocorasick' not installed.  Falling back to regular expressions; "
+                                   "overlapping matches are not reported."})
+
+    chunk_size = max(mmap.ALLOCATIONGRANULARITY, chunk_size - chunk_size % mmap.ALLOCATIONGRANULARITY)
+    image_size = Path(image_path).stat().st_size
+    overlap = pattern_set.max_length - 1
+    pool = _get_pool(version, pattern_set, workers)
+    futures = [pool.submit(_scan_chunk, Path(image_path).as_posix(), start, chunk_size, overlap, max_hits)
+               for start in range(0, image_size, chunk_size)]
+
+    hits = []
+    for future in futures:
+        hits.extend(future.result())
+    hits.sort()
+    logger.info({'_action': whoami(),
+                 'message': "IOC scan complete.",
+                 'details': {'path': Path(image_path).as_posix(), 'patterns': pattern_set.count,
+                             'chunks': len(futures), 'hits': len(hits)}
+                 })
+    if Path(image_path).suffix.lower() in RAW_IMAGE_SUFFIXES:
+        return [{'Offset(File)': "0x%x" % offset, 'Offset(P)': "0x%x" % offset, 'Pattern': name, 'Type': _type}
+                for offset, name, _type in hits]
+    return [{'Offset(File)': "0x%x" % offset, 'Pattern': name, 'Type': _type} for offset, name, _type in hits]
@@ -0,0 +1,211 @@
+import os
+import json
+import uuid
+import socket
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from time import time
+from .utils import whoami
+
+
+class LeaseManager:
+    """
+    Coordinates image processing across nodes sharing the same monitored folders.
+    A node claims an image by atomically creating a lease file (O_CREAT | O_EXCL) in a shared lease folder.
+    Held leases are renewed by a heartbeat thread; leases which are not renewed within 'ttl' seconds belong to a dead
+    node and can be reclaimed by any other node.
+    """
+    LEASE_SUFFIX = '.lease'
+
+    def __init__(self, lease_dir, ttl=300, heartbeat_interval=60, node_id=None, logger=None):
+        """
+        :param lease_dir: (Path) shared folder holding lease files
+        :param ttl: (int) seconds a lease stays valid without a heartbeat
+        :param heartbeat_interval: (int) seconds between lease renewals
+        :param node_id: (str) unique node name.  Default: hostname:pid
+        :param logger: logger instance
+        """
+        self.lease_dir = Path(lease_dir)
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.node_id = node_id if node_id is not None else "%s:%d" % (socket.gethostname(), os.getpid())
+        self.logger = logger if logger is not None else logging.getLogger('root')
+
+        # image path -> lease token
+        self._held = dict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+        self.lease_dir.mkdir(parents=True, exist_ok=True)
+
+    def lease_path(self, image_path):
+        digest = hashlib.sha1(Path(image_path).as_posix().encode()).hexdigest()
+        return Path.joinpath(self.lease_dir, digest + self.LEASE_SUFFIX)
+
+    def claim(self, image_path):
+        """
+        Try to claim an image for this node.  Expired leases of dead nodes are taken over.
+        :param image_path: path to memory image
+        :return: True if this node now holds the lease
+        """
+        _path = self.lease_path(image_path)
+        token = uuid.uuid4().hex
+
+        if self._create(_path, image_path, token):
+            return True
+
+        lease = self._read(_path)
+        if lease is None:
+            # Unreadable lease may still be being written by its owner
+            try:
+                if time() - _path.stat().st_mtime < self.ttl:
+                    return False
+            except FileNotFoundError:
+                return self._create(_path, image_path, token)
+        elif lease.get('expires', 0) >= time():
+            self.logger.info({'_action': whoami(),
+                              'message': "Image is claimed by another node.",
+                              'details': {'path': Path(image_path).as_posix(), 'node': lease.get('node')}
+                              })
+            return False
+
+        # Expired (or unreadable) lease.  Move it aside; only one node can win the rename.
+        stale = _path.with_name("%s.%s.stale" % (_path.name, token))
+        try:
+            os.rename(_path.as_posix(), stale.as_posix())
+        except FileNotFoundError:
+            return self._create(_path, image_path, token)
+
+        # Between reading and renaming, another node may have reclaimed the lease.  Put a live lease back.
+        moved = self._read(stale)
+        if moved is not None and lease is not None and moved.get('token') != lease.get('token'):
+            try:
+                os.link(stale.as_posix(), _path.as_posix())
+            except FileExistsError:
+                pass
+            stale.unlink()
+            return False
+
+        stale.unlink()
+        self.logger.warning({'_action': whoami(),
+                             'message': "Reclaiming expired lease.",
+                             'details': {'path': Path(image_path).as_posix(),
+                                         'node': lease.get('node') if lease is not None else None}
+                             })
+        return self._create(_path, image_path, token)
+
+    def release(self, image_path):
+        """
+        Give up a lease held by this node.
+        :param image_path: path to memory image
+        :return: None
+        """
+        _key = Path(image_path).as_posix()
+        with self._lock:
+            token = self._held.pop(_key, None)
+        if token is None:
+            return
+
+        _path = self.lease_path(image_path)
+        lease = self._read(_path)
+        if lease is not None and lease.get('token') == token:
+            try:
+                _path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def renew(self):
+        """
+        Extend all leases held by this node.  Leases taken over by another node are dropped.
+        :return: None
+        """
+        with self._lock:
+            held = list(self._held.items())
+
+        for image_path, token in held:
+            _path = self.lease_path(image_path)
+            lease = self._read(_path)
+            if lease is None or lease.get('token') != token:
+                with self._lock:
+                    self._held.pop(image_path, None)
+                self.logger.error({'_action': whoami(),
+                                   'message': "Lease lost to another node.",
+                                   'details': {'path': image_path,
+                                               'node': lease.get('node') if lease is not None else None}
+                                   })
+                continue
+            _tmp = _path.with_name("%s.%s.tmp" % (_path.name, token))
+            with _tmp.open('w') as f:
+                json.dump(self._lease(image_path, token), f)
+            os.replace(_tmp.as_posix(), _path.as_posix())
+
+    def reclaimable(self):
+        """
+        Images whose leases have expired, i.e. the owning node died mid-processing.
+        :return: list of image paths (str)
+        """
+        images = []
+        now = time()
+        for _path in self.lease_dir.glob("*%s" % self.LEASE_SUFFIX):
+            lease = self._read(_path)
+            if lease is None or lease.get('expires', 0) >= now:
+                continue
+            if Path(lease['path']).exists():
+                images.append(lease['path'])
+        return images
+
+    def start_heartbeat(self):
+        if self._heartbeat is not None:
+            return
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="lease-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def stop_heartbeat(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.renew()
+            except Exception as _err:
+                self.logger.warning({'_action': whoami(),
+                                     'message': "Lease heartbeat failed.",
+                                     'errors': [str(_err)]})
+
+    def _lease(self, image_path, token):
+        now = time()
+        return {'node': self.node_id,
+                'token': token,
+                'path': Path(image_path).as_posix(),
+                'heartbeat': now,
+                'expires': now + self.ttl}
+
+    def _create(self, lease_path, image_path, token):
+        try:
+            fd = os.open(lease_path.as_posix(), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._lease(image_path, token), f)
+        with self._lock:
+            self._held[Path(image_path).as_posix()] = token
+        self.logger.info({'_action': whoami(),
+                          'message': "Lease acquired.",
+                          'details': {'path': Path(image_path).as_posix(), 'node': self.node_id}
+                          })
+        return True
+
+    @staticmethod
+    def _read(lease_path):
+        try:
+            with lease_path.open('r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
@@ -10,12 +10,22 @@ import re
 from configs.vol_config import VOLATILITY_PATH, volatility_default_timeout
 from configs.defaults import AUTO_EXTRACT_SUFFIX, vol_profile_file
 from .utils import whoami, run_command
+from .image_cache import get_image_cache
+from .staging import stage_image, get_staging_cache
+from .admission import get_admission_controller
+from .tracing import span, process_span
+from time import time
 
 
 class MemoryDump:
     def __init__(self, dump_path, logger):
         self.logger = logger
         self.profile = None
+        self.source_path = Path(dump_path)
+        # Set when memory_path is served from the converted image cache
+        self.cache_key = None
+        # Set when memory_path is a copy in the local staging area
+        self.staging_key = None
         self.logger.info({'_action': whoami(),
                           'message': 'Start processing {}'.format(dump_path)
                           })
@@ -24,6 +34,18 @@ class MemoryDump:
             self.memory_path = self.extract_hpak(dump_path)
         else:
             self.memory_path = Path(dump_path)
+        # Image to process (i.e. the extracted *.vol), wherever memory_path is read from
+        self.image_path = self.memory_path
+        # Converted images in the cache are local already
+        if self.cache_key is None and get_staging_cache() is not None:
+            try:
+                with span('stage image', 'io'):
+                    self.staging_key, self.memory_path = stage_image(self.image_path, self.logger)
+            except OSError as _err:
+                self.logger.warning({'_action': whoami(),
+                                     'message': "Failed to stage image.  Processing it in place.",
+                                     'details': {'path': self.image_path.as_posix()},
+                                     'errors': [str(_err)]})
         self.logger.info({'_action': whoami(),
                           'message': 'Loaded memory dump: {}'.format(self.memory_path.name)
                           })
@@ -35,7 +57,8 @@ class MemoryDump:
         """
         self.logger.info({'_action': whoami(),
                           'message': "Starting profile identification for {}.".format(self.memory_path.name)})
-        profile_hint = Path.joinpath(self.memory_path.parent, "{}{}".format(self.memory_path.stem, vol_profile_file))
+        # Profile hint lives beside the source image, even when the converted image is cached elsewhere
+        profile_hint = Path.joinpath(self.source_path.parent, "{}{}".format(self.source_path.stem, vol_profile_file))
 
         # Determine profile using .profile override file
         if profile_hint.exists() and profile_hint.is_file():
@@ -55,8 +78,10 @@ class MemoryDump:
         self.profile = None
         command = '{0} -f "{1}" imageinfo'.format(VOLATILITY_PATH.as_posix(), self.memory_path.as_posix())
         args = shlex.split(command)
+        monitor = get_admission_controller().child_monitor('imageinfo', self.memory_path.stat().st_size)
+        s_time = time()
         try:
-           proc = run_command(args, timeout=volatility_default_timeout)
+            proc = run_command(args, timeout=volatility_default_timeout, monitor=monitor)
         except Exception:
             raise
         else:
@@ -78,6 +103,8 @@ class MemoryDump:
                 # Save the profile for re-runs
                 with profile_hint.open('w') as pf:
                     pf.write(self.profile)
+        finally:
+            process_span('imageinfo', s_time, time(), monitor.pid)
 
         return
 
@@ -94,6 +121,11 @@ class MemoryDump:
                           'message': "Extracting 'hpak' file using Volatility 'hpakextract'."
                           })
         _dump_path = Path(dump_path)
+
+        image_cache = get_image_cache()
+        if image_cache is not None:
+            return self._extract_hpak_cached(_dump_path, image_cache)
+
         output_folder = _dump_path.parent
         output_file = Path.joinpath(output_folder, "%s.%s" % (_dump_path.stem, AUTO_EXTRACT_SUFFIX))
 
@@ -103,20 +135,76 @@ class MemoryDump:
                                  })
             return output_file
 
+        self._run_hpakextract(_dump_path, output_file)
+        self.logger.info({'_action': whoami(),
+                          'message': "HPAK extraction successful.  "
+                                     "Continuing processing using '{}' image.".format(output_file.name)
+                          })
+        return output_file
+
+    def _extract_hpak_cached(self, dump_path, image_cache):
+        """
+        Serve the extracted image from the converted image cache, extracting into the cache on a miss.
+        The cache entry stays pinned until release_cached_image() is called.
+        :param dump_path: (Path) path to .hpak file
+        :param image_cache: ImageCache instance
+        :return: Path object to cached extracted file
+        """
+        key = image_cache.fingerprint(dump_path)
+        cached_file = image_cache.get(key)
+        if cached_file is not None:
+            self.logger.info({'_action': whoami(),
+                              'message': "Converted image cache hit.  Skipping hpak extraction.",
+                              'details': {'path': dump_path.as_posix(), 'cached_file': cached_file.as_posix()}
+                              })
+        else:
+            cached_file = image_cache.add(key, lambda output_file: self._run_hpakextract(dump_path, output_file),
+                                          AUTO_EXTRACT_SUFFIX, source=dump_path.as_posix())
+            self.logger.info({'_action': whoami(),
+                              'message': "HPAK extraction successful.  "
+                                         "Continuing processing using cached '{}' image.".format(cached_file.name)
+                              })
+        self.cache_key = key
+        return cached_file
+
+    def release_cached_image(self):
+        """
+        Unpin the converted image cache entry, making it eligible for eviction.
+        :return: None
+        """
+        if self.cache_key is not None:
+            get_image_cache().release(self.cache_key)
+            self.cache_key = None
+
+    def release_staged_image(self):
+        """
+        Unpin the staged copy of the image, making it eligible for eviction.
+        :return: None
+        """
+        if self.staging_key is not None:
+            get_staging_cache().release(self.staging_key)
+            self.staging_key = None
+
+    def release(self):
+        """
+        Unpin both the converted image cache entry and the staged copy, i.e. when the image fails to process.
+        :return: None
+        """
+        self.release_staged_image()
+        self.release_cached_image()
+
+    @staticmethod
+    def _run_hpakextract(dump_path, output_file):
         command = '{0} -f "{1}" hpakextract --output-file "{2}"'.format(VOLATILITY_PATH.as_posix(),
-                                                                        _dump_path.as_posix(),
+                                                                        dump_path.as_posix(),
                                                                         output_file.as_posix())
         args = shlex.split(command)
+        monitor = get_admission_controller().child_monitor('hpakextract', dump_path.stat().st_size)
+        s_time = time()
         try:
-            proc = run_command(args, timeout=volatility_default_timeout)
-        except Exception:
-            raise
-        else:
-            if output_file.exists():
-                self.logger.info({'_action': whoami(),
-                                  'message': "HPAK extraction successful.  "
-                                             "Continuing processing using '{}' image.".format(output_file.name)
-                                  })
-                return output_file
-            else:
-                raise IOError("Failed to extract HPAK file %s" % _dump_path.as_posix())
+            with span('hpakextract', 'io'):
+                run_command(args, timeout=volatility_default_timeout, monitor=monitor)
+        finally:
+            process_span('hpakextract', s_time, time(), monitor.pid)
+        if not output_file.exists():
+            raise IOError("Failed to extract HPAK file %s" % dump_path.as_posix())
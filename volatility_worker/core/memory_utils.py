@@ -5,10 +5,14 @@ import json
 import subprocess
 import shlex
 from .utils import whoami, run_command
+from .admission import get_admission_controller
+from .tracing import process_span
+from time import time
 
 import re
 
 from configs.vol_config import VOLATILITY_PATH, VOLATILITY_CONTRIB_PLUGINS, volatility_default_timeout
+from configs.defaults import child_cpu_limit_seconds
 
 
 def execute_volatility_command(memory_instance, plugin_name, logger, **kwargs):
@@ -53,8 +57,11 @@ def execute_volatility_command(memory_instance, plugin_name, logger, **kwargs):
                   })
 
     args = shlex.split(command)
+    s_time = time()
+    monitor = get_admission_controller().child_monitor(plugin_name, memory_path.stat().st_size)
     try:
-        proc = run_command(args, timeout=kwargs.get('timeout', volatility_default_timeout))
+        proc = run_command(args, timeout=kwargs.get('timeout', volatility_default_timeout), monitor=monitor,
+                           cpu_limit=child_cpu_limit_seconds)
     except Exception:
         raise
     else:
@@ -63,6 +70,8 @@ def execute_volatility_command(memory_instance, plugin_name, logger, **kwargs):
         logger.debug({'_action': whoami(),
                       'message': errs
                       })
+    finally:
+        process_span(plugin_name, s_time, time(), monitor.pid, {'peak_rss': monitor.peak})
 
     final_output = []
     if json_output:
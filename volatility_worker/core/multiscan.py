@@ -0,0 +1,106 @@
+import re
+import threading
+from pathlib import Path
+from configs.vol_config import VOLATILITY_CONTRIB_PLUGINS
+from .utils import whoami
+from .memory_utils import execute_volatility_command
+
+# Pool scanners the 'multiscan' Volatility plugin (vol_plugins/multiscan.py) can run in a single pass
+MULTISCAN_PLUGIN = 'multiscan'
+MULTISCAN_SCANNERS = ('psscan', 'thrdscan', 'filescan', 'mutantscan', 'driverscan', 'symlinkscan', 'modscan',
+                      'sockscan', 'connscan')
+# Section marker printed by the plugin before the output of each scanner; keep in line with vol_plugins/multiscan.py
+_MARKER = re.compile(r'^### multiscan: (\w+)\r?$', re.M)
+
+
+def split_output(output):
+    """
+    :param output: 'multiscan' plugin output
+    :return: dict of scanner plugin name: output, as if the scanner had run alone
+    """
+    sections = dict()
+    markers = list(_MARKER.finditer(output))
+    for i, marker in enumerate(markers):
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(output)
+        sections[marker.group(1)] = output[marker.end() + 1:end]
+    return sections
+
+
+def multiscan_groups(plugin_tiers, plugins):
+    """
+    Pool scanners run together, per tier so a tier never waits for the scanners of a later tier.  Scanners with
+    JSON output or an in-process implementation run alone.
+    :param plugin_tiers: list of (tier name, plugin names)
+    :param plugins: dict of plugin name: VolPlugin
+    :return: dict of plugin name: MultiscanGroup
+    """
+    groups = dict()
+    if len(VOLATILITY_CONTRIB_PLUGINS) == 0 \
+            or not Path.joinpath(Path(VOLATILITY_CONTRIB_PLUGINS), "multiscan.py").is_file():
+        # The 'multiscan' plugin ships in the contrib plugins folder
+        return groups
+    for _, tier_plugins in plugin_tiers:
+        scanners = [name for name in tier_plugins if name in MULTISCAN_SCANNERS and plugins[name].native is None
+                    and not plugins[name].json_output]
+        if len(scanners) < 2:
+            continue
+        group = MultiscanGroup([plugins[name] for name in scanners])
+        for name in scanners:
+            groups[name] = group
+    return groups
+
+
+class MultiscanGroup:
+    """
+    Pool scanners of a tier, run by a single 'multiscan' Volatility process.  The first scanner of the group to run
+    starts it; the others (i.e. on other plugin worker threads) wait for it and take their section of the output.
+    """
+    def __init__(self, plugins):
+        """
+        :param plugins: list of VolPlugin
+        """
+        self.plugins = plugins
+        self._lock = threading.Lock()
+        # plugin name -> output; None until the scan has run
+        self._outputs = None
+
+    def _run(self, worker):
+        flags = ["--scanners=%s" % ",".join(plugin.name for plugin in self.plugins)]
+        # Scanner options are shared by the single Volatility run
+        for plugin in self.plugins:
+            if plugin.extra_flags and plugin.extra_flags not in flags:
+                flags.append(plugin.extra_flags)
+        timeouts = [plugin.timeout for plugin in self.plugins]
+        timeout = None if None in timeouts else sum(timeouts)
+        try:
+            output = execute_volatility_command(worker.memory_dump, MULTISCAN_PLUGIN, worker.logger,
+                                                extra_flags=" ".join(flags), timeout=timeout)
+        except Exception as _err:
+            worker.logger.warning({'_action': whoami(),
+                                   'message': "Combined pool scan failed.  Running the scanners one by one.",
+                                   'details': {'plugins': [plugin.name for plugin in self.plugins]},
+                                   'errors': [str(_err)]})
+            return dict()
+
+        outputs = split_output(output)
+        worker.logger.info({'_action': whoami(),
+                            'message': "Combined pool scan completed.",
+                            'details': {'plugins': [plugin.name for plugin in self.plugins],
+                                        'sections': sorted(outputs.keys())}})
+        return outputs
+
+    def output(self, worker, plugin):
+        """
+        Output of one scanner of the group.  Scanners missing from the combined output (failed, or not supported by
+        the profile) are run alone.
+        :param worker: VolWorker
+        :param plugin: VolPlugin
+        :return: plugin output
+        """
+        with self._lock:
+            if self._outputs is None:
+                self._outputs = self._run(worker)
+            output = self._outputs.pop(plugin.name, None)
+        if output is None:
+            return execute_volatility_command(worker.memory_dump, plugin.name, worker.logger, **vars(plugin))
+        return output
@@ -0,0 +1,116 @@
+from pathlib import Path
+from configs.defaults import timeline_sort_chunk, timeline_index, timeline_index_bucket, ioc_scan_workers, \
+    ioc_scan_chunk_size, ioc_scan_max_hits, strings_min_length, strings_max_length, strings_workers, \
+    strings_chunk_size
+from .utils import whoami
+from .compressed_output import compressed_path, compress_file
+from .timeline import write_timeline
+from .timeline_index import TimelineIndexWriter
+from .ioc_scan import scan_image, RAW_IMAGE_SUFFIXES
+from .strings_extract import extract_strings
+from .memory_utils import execute_volatility_command
+
+
+def run_timeline(worker, plugin):
+    """
+    Native 'mactime': merge mftparser, shellbags and timeliner body files into a sorted CSV timeline, plus an
+    indexed binary copy ('mactime.bin' / 'mactime.idx') when 'timeline_index' is set.  The CSV is compressed as
+    set by plugin.compression.
+    plugin.options: 'bodies' (body file paths), 'output' (CSV path), 'date_range' (optional)
+    :param worker: VolWorker
+    :param plugin: VolPlugin
+    :return: summary row (timeline file names and event count), or '' if the bodies held no events in range
+    """
+    options = plugin.options
+    output_file = Path(options['output'])
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    csv_file = compressed_path(output_file, plugin.compression)
+    if timeline_index:
+        # Sorted binary records and bucket index for fast range queries, see timeline_index.py
+        with TimelineIndexWriter(output_file.with_suffix('.bin'), bucket_seconds=timeline_index_bucket) as index:
+            count = write_timeline(options['bodies'], csv_file, date_range=options.get('date_range', None),
+                                   chunk_size=timeline_sort_chunk, logger=worker.logger, index_writer=index,
+                                   compression=plugin.compression)
+    else:
+        count = write_timeline(options['bodies'], csv_file, date_range=options.get('date_range', None),
+                               chunk_size=timeline_sort_chunk, logger=worker.logger, compression=plugin.compression)
+    worker.logger.info({'_action': whoami(),
+                        'message': "Timeline generated.",
+                        'details': {'output': csv_file.as_posix(),
+                                    'events': count,
+                                    'date_range': options.get('date_range', None)}
+                        })
+    if count == 0:
+        return ''
+    # File names only: outputs may be written to local scratch and published to the case folder later
+    return [{'Timeline': csv_file.name,
+             'Index': output_file.with_suffix('.idx').name if timeline_index else None,
+             'Events': count,
+             'DateRange': options.get('date_range', None)}]
+
+
+def run_ioc_scan(worker, plugin):
+    """
+    Scan the memory image for all IOC patterns in one pass (see ioc_scan.py).
+    plugin.options: 'patterns' (IOC list files)
+    :param worker: VolWorker
+    :param plugin: VolPlugin
+    :return: list of hit rows (file offset, physical offset for raw images, pattern, type)
+    """
+    return scan_image(worker.memory_dump.memory_path, plugin.options['patterns'], workers=ioc_scan_workers,
+                      chunk_size=ioc_scan_chunk_size, max_hits=ioc_scan_max_hits, logger=worker.logger)
+
+
+def run_strings(worker, plugin):
+    """
+    Native 'strings': extract ASCII and UTF-16LE strings as 'offset:string' lines, then map them to processes and
+    kernel memory with Volatility's 'strings' plugin.  The offsets are file offsets, which Volatility reads as
+    physical addresses: the mapping only runs for raw images (RAW_IMAGE_SUFFIXES).  The strings file is compressed
+    as set by plugin.compression, once Volatility has read it.
+    plugin.options: 'output' (strings file), 'volatility' (run the Volatility mapping, default True)
+    :param worker: VolWorker
+    :param plugin: VolPlugin
+    :return: Volatility 'strings' output, or '' without the mapping
+    """
+    strings_file = Path(plugin.options['output'])
+    strings_file.parent.mkdir(parents=True, exist_ok=True)
+    memory_path = Path(worker.memory_dump.memory_path)
+    mapping = plugin.options.get('volatility', True)
+    if mapping and memory_path.suffix.lower() not in RAW_IMAGE_SUFFIXES:
+        worker.logger.info({'_action': whoami(),
+                            'message': "Not a raw image, strings are not mapped to processes.",
+                            'details': {'path': memory_path.as_posix()}
+                            })
+        mapping = False
+
+    extract_strings(memory_path, strings_file, min_length=strings_min_length, max_length=strings_max_length,
+                    workers=strings_workers, chunk_size=strings_chunk_size, logger=worker.logger,
+                    compression=None if mapping else plugin.compression)
+    if not mapping:
+        return ''
+    try:
+        return execute_volatility_command(worker.memory_dump, plugin.name, worker.logger,
+                                          extra_flags='--string-file="%s"' % strings_file.as_posix(),
+                                          timeout=plugin.timeout)
+    finally:
+        compress_file(strings_file, plugin.compression)
+
+
+# VolPlugin.native -> runner(worker, plugin) returning the plugin output, like execute_volatility_command
+NATIVE_PLUGINS = {'timeline': run_timeline,
+                  'ioc_scan': run_ioc_scan,
+                  'strings': run_strings}
+
+
+def execute_native_plugin(worker, plugin):
+    """
+    Run a plugin implemented natively (in-process) instead of as a Volatility sub-process.
+    :param worker: VolWorker
+    :param plugin: VolPlugin with 'native' set
+    :return: plugin output
+    """
+    worker.logger.info({'_action': whoami(),
+                        'message': "Executing native '{}' plugin on '{}' image.".format(
+                            plugin.name, worker.memory_dump.memory_path.name)
+                        })
+    return NATIVE_PLUGINS[plugin.native](worker, plugin)
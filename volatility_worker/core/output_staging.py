@@ -0,0 +1,97 @@
+import os
+import errno
+import shutil
+from pathlib import Path
+from configs.defaults import output_staging_dir, case_log_dir
+
+# Temporary names used while publishing, beside the destination (same file system, so the final rename is atomic)
+_PUBLISHING_SUFFIX = '.publishing'
+_REPLACED_SUFFIX = '.replaced'
+
+
+def local_output_dir(case_id, image_name):
+    """
+    :param case_id: case ID
+    :param image_name: memory image name (stem)
+    :return: (Path) local plugins output folder of an image
+    """
+    return Path.joinpath(Path(output_staging_dir), case_id, image_name)
+
+
+def local_log_file(case_id, log_name):
+    """
+    :param case_id: case ID
+    :param log_name: log file name, i.e. <CASE_ID>-<image>.log
+    :return: (Path) local log file, appended to the case log folder when the worker closes its loggers
+    """
+    return Path.joinpath(Path(output_staging_dir), case_id, case_log_dir, log_name)
+
+
+def _recover(dest_dir, _tmp, _old):
+    """
+    Undo an interrupted publish_dir(): a folder left as '_old' without 'dest_dir' is the previous publication,
+    renamed away just before the process stopped; it is put back.  Leftover temporary folders are removed.
+    """
+    if _old.exists() and not dest_dir.exists():
+        os.rename(_old.as_posix(), dest_dir.as_posix())
+    for _stale in (_tmp, _old):
+        if _stale.exists():
+            shutil.rmtree(_stale.as_posix())
+
+
+def publish_dir(src_dir, dest_dir, keep=False):
+    """
+    Publish a folder: it is moved (same file system) or copied next to 'dest_dir' under a temporary name, then
+    renamed into place, so readers never see a partially written folder.  An existing 'dest_dir' is replaced with
+    two renames (a folder cannot be renamed over another one): between them 'dest_dir' is briefly missing.  If the
+    process stops in that window, the previous folder is left as '.<name>.replaced' and put back by the next
+    publish_dir() to the same destination.
+    :param src_dir: (Path) local folder
+    :param dest_dir: (Path) published folder, i.e. <case>/plugins_output/<image>/<plugin>
+    :param keep: keep 'src_dir' (i.e. later plugins read it); otherwise it is moved or removed
+    :return: (Path) dest_dir
+    """
+    src_dir = Path(src_dir)
+    dest_dir = Path(dest_dir)
+    dest_dir.parent.mkdir(parents=True, exist_ok=True)
+    _tmp = dest_dir.with_name('.' + dest_dir.name + _PUBLISHING_SUFFIX)
+    _old = dest_dir.with_name('.' + dest_dir.name + _REPLACED_SUFFIX)
+    _recover(dest_dir, _tmp, _old)
+
+    moved = False
+    if not keep:
+        try:
+            os.rename(src_dir.as_posix(), _tmp.as_posix())
+            moved = True
+        except OSError as _err:
+            if _err.errno != errno.EXDEV:
+                raise
+    if not moved:
+        # One sequential pass of large writes instead of the many small appends of the plugins
+        shutil.copytree(src_dir.as_posix(), _tmp.as_posix())
+
+    if dest_dir.exists():
+        os.rename(dest_dir.as_posix(), _old.as_posix())
+    os.rename(_tmp.as_posix(), dest_dir.as_posix())
+    if _old.exists():
+        shutil.rmtree(_old.as_posix(), ignore_errors=True)
+    if not keep and not moved:
+        shutil.rmtree(src_dir.as_posix(), ignore_errors=True)
+    return dest_dir
+
+
+def publish_log(src_file, dest_file):
+    """
+    Append a local log file to the case log, then remove it.
+    :param src_file: (Path) local log file
+    :param dest_file: (Path) case log file
+    :return: None
+    """
+    src_file = Path(src_file)
+    if not src_file.exists():
+        return
+    dest_file = Path(dest_file)
+    dest_file.parent.mkdir(parents=True, exist_ok=True)
+    with src_file.open('rb') as src, dest_file.open('ab') as dest:
+        shutil.copyfileobj(src, dest, 1024 * 1024)
+    src_file.unlink()
@@ -0,0 +1,56 @@
+import types
+import threading
+from pathlib import Path
+from configs.base_plugins_configs import compile_plugins_config
+from .exceptions import OverrideConfigFailure
+
+# override file path -> ((mtime, size), module or exception)
+_overrides = dict()
+_overrides_lock = threading.Lock()
+
+
+def case_override_path(case_dir, case_id):
+    # override config must be named as upper-case CASE_ID.py
+    return Path.joinpath(Path(case_dir), "%s.py" % case_id)
+
+
+def load_case_override(case_dir, case_id):
+    """
+    Load a case override configuration file.  The file is executed as a module without touching sys.path or
+    sys.modules (and without writing bytecode into the case folder), and re-loaded only when it changes.
+    :param case_dir: (Path) case ID folder
+    :param case_id: case ID
+    :return: module, or None if the case has no override file
+    :raises: exception raised while executing the override file, or OverrideConfigFailure for invalid
+    'plugins_configs' (cached until the file changes)
+    """
+    override_config = case_override_path(case_dir, case_id)
+    try:
+        stat = override_config.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    version = (stat.st_mtime_ns, stat.st_size)
+    key = override_config.as_posix()
+
+    with _overrides_lock:
+        cached = _overrides.get(key)
+    if cached is None or cached[0] != version:
+        module = types.ModuleType("case_override_%s" % case_id)
+        module.__file__ = key
+        try:
+            with override_config.open('rb') as f:
+                exec(compile(f.read(), key, 'exec'), module.__dict__)
+            if hasattr(module, 'plugins_configs'):
+                try:
+                    compile_plugins_config(module.plugins_configs, templates=False)
+                except ValueError as _err:
+                    raise OverrideConfigFailure("Invalid 'plugins_configs' in %s: %s" % (key, _err), errors=_err)
+        except Exception as _err:
+            module = _err
+        cached = (version, module)
+        with _overrides_lock:
+            _overrides[key] = cached
+
+    if isinstance(cached[1], Exception):
+        raise cached[1]
+    return cached[1]
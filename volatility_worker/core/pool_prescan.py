@@ -0,0 +1,307 @@
+import os
+import re
+import sys
+import mmap
+import struct
+import logging
+import argparse
+from array import array
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from .utils import whoami, process_pool_context
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Pool tags searched by Volatility's pool scanners.  Tags of Windows 8 and later lack the protected bit (0x80) set in
+# the last character by earlier versions.
+POOL_TAGS = {'psscan': [b'Pro\xe3', b'Proc'],
+             'thrdscan': [b'Thr\xe5', b'Thre'],
+             'filescan': [b'Fil\xe5', b'File'],
+             'mutantscan': [b'Mut\xe1', b'Muta'],
+             'driverscan': [b'Dri\xf6', b'Driv'],
+             'symlinkscan': [b'Sym\xe2', b'Symb'],
+             'modscan': [b'MmLd'],
+             'sockscan': [b'TCPA'],
+             'connscan': [b'TCPT'],
+             'netscan': [b'TcpE', b'TcpL', b'UdpA']}
+
+# Index file ('<image>.pooltags'), written beside the scanned image: header (image size and modification time, to
+# detect a changed image), then a (tag, count) entry per tag, then the physical offsets of each tag ('<Q') in entry
+# order.  Offsets are counted at any alignment, so a count is an upper bound of what the scanner reports.
+INDEX_MAGIC = b'VWPTIDX1'
+INDEX_SUFFIX = '.pooltags'
+_INDEX_HEADER = struct.Struct('<8sQQI')
+_INDEX_ENTRY = struct.Struct('<4sQ')
+_OFFSET = struct.Struct('<Q')
+
+
+def index_path(image_path):
+    """
+    :param image_path: (Path) scanned memory image
+    :return: (Path) its pool tag index
+    """
+    image_path = Path(image_path)
+    return image_path.with_name(image_path.name + INDEX_SUFFIX)
+
+
+def all_tags():
+    return sorted(set(tag for tags in POOL_TAGS.values() for tag in tags))
+
+
+def _find_numpy(data, limit, tags):
+    """
+    Offsets of the tags starting in data[:limit], by vectorised first byte lookup and 4 byte comparison.
+    :return: dict of tag: offsets
+    """
+    raw = numpy.frombuffer(data, dtype=numpy.uint8)
+    first = numpy.zeros(256, dtype=bool)
+    first[[tag[0] for tag in tags]] = True
+    candidates = numpy.flatnonzero(first[raw[:limit]])
+    candidates = candidates[candidates + 4 <= len(raw)]
+    values = (raw[candidates].astype(numpy.uint32) | (raw[candidates + 1].astype(numpy.uint32) << 8)
+              | (raw[candidates + 2].astype(numpy.uint32) << 16) | (raw[candidates + 3].astype(numpy.uint32) << 24))
+    return {tag: candidates[values == struct.unpack('<I', tag)[0]].tolist() for tag in tags}
+
+
+def _find_re(data, limit, tags):
+    """
+    Regular expression fallback for _find_numpy()
+    """
+    found = {tag: [] for tag in tags}
+    for match in re.finditer(b'|'.join(re.escape(tag) for tag in tags), data):
+        if match.start() >= limit:
+            break
+        found[match.group(0)].append(match.start())
+    return found
+
+
+def _scan_chunk(image_path, start, length, tags):
+    """
+    Offsets of the tags starting in image[start:start + length].  The window is widened by 3 bytes so tags crossing
+    the chunk end are found.
+    :return: dict of tag: array('Q') of image offsets
+    """
+    image_size = Path(image_path).stat().st_size
+    window_end = min(image_size, start + length + 3)
+    map_start = start - start % mmap.ALLOCATIONGRANULARITY
+    if window_end <= start:
+        return {tag: array('Q') for tag in tags}
+
+    with open(image_path, 'rb') as f, mmap.mmap(f.fileno(), window_end - map_start, offset=map_start,
+                                                  access=mmap.ACCESS_READ) as mapped:
+        data = memoryview(mapped)[start - map_start:]
+        try:
+            if numpy is not None:
+                found = _find_numpy(data, min(length, len(data)), tags)
+            else:
+                found = _find_re(data, min(length, len(data)), tags)
+        finally:
+            # The map cannot be closed while views into it exist
+            data.release()
+    return {tag: array('Q', (start + offset for offset in offsets)) for tag, offsets in found.items()}
+
+
+class PoolTagIndex:
+    """
+    Pool tag counts and offsets of a memory image.
+    """
+    def __init__(self, image_size, image_mtime, offsets, index_file=None):
+        """
+        :param image_size: bytes of the scanned image
+        :param image_mtime: (int) modification time of the scanned image, in nanoseconds
+        :param offsets: dict of tag: array('Q') of offsets, or of tag: count when loaded from an index file
+        :param index_file: (Path) index file the offsets are read from on demand
+        """
+        self.image_size = image_size
+        self.image_mtime = image_mtime
+        self._offsets = {tag: value for tag, value in offsets.items() if not isinstance(value, int)}
+        self.counts = {tag: value if isinstance(value, int) else len(value) for tag, value in offsets.items()}
+        self.index_file = Path(index_file) if index_file is not None else None
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def hits(self, plugin):
+        """
+        :param plugin: scanner plugin name, see POOL_TAGS
+        :return: tag occurrences the scanner could report, None if the plugin is not a pool scanner
+        """
+        if plugin not in POOL_TAGS:
+            return None
+        return sum(self.counts.get(tag, 0) for tag in POOL_TAGS[plugin])
+
+    def offsets(self, tag):
+        """
+        :param tag: (bytes) pool tag
+        :return: array('Q') of image offsets
+        """
+        if tag in self._offsets:
+            return self._offsets[tag]
+        offsets = array('Q')
+        if self.index_file is None or self.counts.get(tag, 0) == 0:
+            return offsets
+        position = _INDEX_HEADER.size + _INDEX_ENTRY.size * len(self.counts)
+        for _tag in self.counts.keys():
+            if _tag == tag:
+                break
+            position += _OFFSET.size * self.counts[_tag]
+        with self.index_file.open('rb') as f:
+            f.seek(position)
+            offsets.frombytes(f.read(_OFFSET.size * self.counts[tag]))
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        return offsets
+
+    def is_current(self, image_path):
+        """
+        :param image_path: (Path) memory image
+        :return: True if the index was built from this version of the image
+        """
+        stat = Path(image_path).stat()
+        return stat.st_size == self.image_size and stat.st_mtime_ns == self.image_mtime
+
+    def write(self, index_file):
+        """
+        Write the index to a temporary name and move it in place, so readers never see a partial index.
+        :param index_file: (Path) index file
+        :return: (Path) index_file
+        """
+        index_file = Path(index_file)
+        _tmp = index_file.with_name(index_file.name + '.tmp')
+        tags = list(self.counts.keys())
+        with _tmp.open('wb') as f:
+            f.write(_INDEX_HEADER.pack(INDEX_MAGIC, self.image_size, self.image_mtime, len(tags)))
+            for tag in tags:
+                f.write(_INDEX_ENTRY.pack(tag, self.counts[tag]))
+            for tag in tags:
+                offsets = self.offsets(tag)
+                if sys.byteorder != 'little':
+                    offsets = array('Q', offsets)
+                    offsets.byteswap()
+                offsets.tofile(f)
+        os.replace(_tmp.as_posix(), index_file.as_posix())
+        self.index_file = index_file
+        return index_file
+
+    @classmethod
+    def load(cls, index_file):
+        """
+        :param index_file: (Path) index file
+        :return: PoolTagIndex; offsets are read when asked for
+        """
+        index_file = Path(index_file)
+        with index_file.open('rb') as f:
+            magic, image_size, image_mtime, count = _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))
+            if magic != INDEX_MAGIC:
+                raise ValueError("'%s' is not a pool tag index." % index_file.as_posix())
+            counts = dict()
+            for _ in range(count):
+                tag, hits = _INDEX_ENTRY.unpack(f.read(_INDEX_ENTRY.size))
+                counts[tag] = hits
+        return cls(image_size, image_mtime, counts, index_file)
+
+
+def prescan_image(image_path, tags=None, workers=4, chunk_size=64 * 1024 ** 2, logger=None):
+    """
+    Find pool tags in one pass over a memory image.  The image is memory-mapped in chunks scanned in parallel.
+    :param image_path: (Path) memory image
+    :param tags: pool tags (bytes).  Default: tags of all scanners in POOL_TAGS
+    :param workers: pool processes
+    :param chunk_size: bytes per chunk
+    :param logger: logger instance
+    :return: PoolTagIndex
+    """
+    logger = logger if logger is not None else logging.getLogger('root')
+    if numpy is None:
+        logger.warning({'_action': whoami(),
+                        'message': "'numpy' not installed.  Falling back to regular expressions for the pool tag "
+                                   "prescan."})
+    tags = sorted(tags) if tags is not None else all_tags()
+    stat = Path(image_path).stat()
+    starts = list(range(0, stat.st_size, chunk_size))
+    offsets = {tag: array('Q') for tag in tags}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=process_pool_context()) as pool:
+        for found in pool.map(_scan_chunk, [Path(image_path).as_posix()] * len(starts), starts,
+                              [chunk_size] * len(starts), [tags] * len(starts)):
+            for tag, _offsets in found.items():
+                offsets[tag].extend(_offsets)
+    index = PoolTagIndex(stat.st_size, stat.st_mtime_ns, offsets)
+
+    logger.info({'_action': whoami(),
+                 'message': "Pool tag prescan completed.",
+                 'details': {'path': Path(image_path).as_posix(), 'chunks': len(starts),
+                             'hits': {plugin: index.hits(plugin) for plugin in POOL_TAGS.keys()}}
+                 })
+    return index
+
+
+def get_pool_index(image_path, workers=4, chunk_size=64 * 1024 ** 2, logger=None):
+    """
+    Pool tag index of an image: loaded from beside the image if it is current, otherwise built and saved there.
+    The index is still returned if it cannot be saved (i.e. read-only evidence folder).
+    :param image_path: (Path) memory image
+    :param workers: pool processes
+    :param chunk_size: bytes per chunk
+    :param logger: logger instance
+    :return: PoolTagIndex
+    """
+    logger = logger if logger is not None else logging.getLogger('root')
+    index_file = index_path(image_path)
+    try:
+        index = PoolTagIndex.load(index_file)
+    except (OSError, ValueError, struct.error):
+        index = None
+    if index is not None and index.is_current(image_path) and set(index.counts.keys()) == set(all_tags()):
+        return index
+
+    index = prescan_image(image_path, workers=workers, chunk_size=chunk_size, logger=logger)
+    try:
+        index.write(index_file)
+    except OSError as _err:
+        logger.warning({'_action': whoami(),
+                        'message': "Failed to save pool tag index.",
+                        'details': {'path': index_file.as_posix()},
+                        'errors': [str(_err)]})
+    return index
+
+
+def estimate_runtime(index, plugin, scan_rate, hit_seconds):
+    """
+    Rough runtime of a pool scanner: one pass over the image plus the validation of each tag hit.
+    :param index: PoolTagIndex
+    :param plugin: scanner plugin name
+    :param scan_rate: bytes scanned per second
+    :param hit_seconds: seconds per tag hit
+    :return: seconds, None if the plugin is not a pool scanner
+    """
+    hits = index.hits(plugin)
+    if hits is None:
+        return None
+    return index.image_size / scan_rate + hits * hit_seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count the pool tags of Volatility's pool scanners in a memory "
+                                                 "image, using or building its '%s' index." % INDEX_SUFFIX)
+    parser.add_argument('image', help="memory image")
+    parser.add_argument('--workers', type=int, default=4, help="scan processes.  Default: %(default)s")
+    parser.add_argument('--offsets', metavar='TAG', action='append',
+                        help="print the offsets of a tag (i.e. 'Proc', or 'Pro\\xe3'); repeatable")
+    args = parser.parse_args(argv)
+
+    index = get_pool_index(args.image, workers=args.workers)
+    for plugin, tags in POOL_TAGS.items():
+        print("%-12s %12d  %s" % (plugin, index.hits(plugin),
+                                  ", ".join("%r: %d" % (tag, index.counts.get(tag, 0)) for tag in tags)))
+    for tag in args.offsets or []:
+        for offset in index.offsets(tag.encode('latin-1').decode('unicode_escape').encode('latin-1')):
+            print("%s\t0x%x" % (tag, offset))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,247 @@
+import io
+import time
+import pstats
+import signal
+import cProfile
+import logging
+import importlib
+import functools
+import threading
+import tracemalloc
+from pathlib import Path
+from datetime import datetime
+from configs.defaults import profiling, profiling_interval, profiling_top, profiling_dir
+from .utils import whoami
+
+# Hot paths wrapped while profiling: (module name or object, attribute path).  Functions imported by name into other
+# modules are patched in each of them.
+PROFILE_TARGETS = [('volatility_worker.core.vol_worker', 'VolWorker.run'),
+                   ('volatility_worker.core.vol_worker', 'VolWorker.run_tier'),
+                   ('volatility_worker.core.vol_worker', 'VolWorker.store_result'),
+                   ('volatility_worker.core.memory_utils', 'execute_volatility_command'),
+                   ('volatility_worker.core.vol_worker', 'execute_volatility_command'),
+                   ('volatility_worker.core.native_plugins', 'execute_volatility_command'),
+                   ('volatility_worker.core.multiscan', 'execute_volatility_command')]
+
+
+class Profiler:
+    """
+    Opt-in profiler for the daemon.  While enabled, the target functions are replaced with wrappers that run the
+    outermost call of each thread under cProfile (nested target calls are only timed) and merge the results; memory
+    allocations are traced with tracemalloc.  A background thread writes snapshots to 'output_dir'.
+    Disabled, the original functions are restored, so profiling costs nothing.
+    """
+    def __init__(self, output_dir, interval=300, top=30, targets=(), logger=None):
+        """
+        :param output_dir: (Path) snapshot folder
+        :param interval: seconds between snapshots
+        :param top: functions and allocation sites per snapshot
+        :param targets: (module name or object, attribute path) to wrap
+        :param logger: logger instance
+        """
+        self.output_dir = Path(output_dir)
+        self.interval = interval
+        self.top = top
+        self.targets = list(targets)
+        self.logger = logger if logger is not None else logging.getLogger('root')
+        self.enabled = False
+        self._started = None
+
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        # (owner, attribute name) -> original
+        self._originals = dict()
+        self._stats = None
+        # label -> [calls, total seconds, max seconds]
+        self._timings = dict()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_targets(self, targets):
+        """
+        Wrap more functions, i.e. the watchdog Handler callbacks.  Applied immediately if profiling is enabled.
+        :param targets: (module name or object, attribute path)
+        :return: None
+        """
+        with self._lock:
+            self.targets.extend(targets)
+            if self.enabled:
+                self._patch(targets)
+
+    def enable(self):
+        with self._lock:
+            if self.enabled:
+                return
+            self.enabled = True
+            self._stats = None
+            self._timings = dict()
+            self._started = time.time()
+            tracemalloc.start(10)
+            self._patch(self.targets)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._snapshot_loop, name="profiler", daemon=True)
+            self._thread.start()
+        self.logger.warning({'_action': whoami(),
+                             'message': "Profiling enabled.",
+                             'details': {'output_dir': self.output_dir.as_posix(), 'interval': self.interval}})
+
+    def disable(self):
+        with self._lock:
+            if not self.enabled:
+                return
+            for (owner, name), original in self._originals.items():
+                setattr(owner, name, original)
+            self._originals = dict()
+            self.enabled = False
+            self._stop.set()
+        self._thread.join()
+        snapshot_file = self.snapshot()
+        tracemalloc.stop()
+        self.logger.warning({'_action': whoami(),
+                             'message': "Profiling disabled.",
+                             'details': {'snapshot': snapshot_file.as_posix() if snapshot_file else None}})
+
+    def toggle(self):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def _patch(self, targets):
+        for owner, path in targets:
+            if isinstance(owner, str):
+                try:
+                    owner = importlib.import_module(owner)
+                except ImportError:
+                    continue
+            *parents, name = path.split('.')
+            for parent in parents:
+                owner = getattr(owner, parent)
+            if (owner, name) in self._originals or not hasattr(owner, name):
+                continue
+            original = getattr(owner, name)
+            self._originals[(owner, name)] = original
+            setattr(owner, name, self._wrap(original, "%s.%s" % (owner.__name__, name) if isinstance(owner, type)
+                                            else path))
+
+    def _wrap(self, func, label):
+        profiler = self
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            outermost = not getattr(profiler._local, 'active', False)
+            profile = None
+            if outermost:
+                profiler._local.active = True
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:
+                    # Another profiler (i.e. a debugger) owns this thread
+                    profile = None
+            s_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - s_time
+                if profile is not None:
+                    profile.disable()
+                if outermost:
+                    profiler._local.active = False
+                profiler._record(label, elapsed, profile)
+
+        return wrapper
+
+    def _record(self, label, elapsed, profile):
+        with self._lock:
+            timing = self._timings.setdefault(label, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += elapsed
+            timing[2] = max(timing[2], elapsed)
+            if profile is not None:
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+
+    def _snapshot_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.snapshot()
+            except Exception as _err:
+                self.logger.error({'_action': whoami(),
+                                   'message': "Failed to write profiling snapshot.",
+                                   'errors': [str(_err)]})
+
+    def snapshot(self):
+        """
+        Write the hot path timings, the top functions (cumulative time) and the top allocation sites to
+        profile-<timestamp>.txt, and the raw statistics to profile-<timestamp>.pstats (i.e. for snakeviz).
+        :return: (Path) snapshot file, or None if nothing was recorded
+        """
+        with self._lock:
+            timings = {label: list(values) for label, values in self._timings.items()}
+            stats_text = io.StringIO()
+            stamp = datetime.now().strftime("%Y-%m-%dT%H-%M-%S")
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            if self._stats is not None:
+                self._stats.stream = stats_text
+                self._stats.sort_stats('cumulative').print_stats(self.top)
+                self._stats.dump_stats(Path.joinpath(self.output_dir, "profile-%s.pstats" % stamp).as_posix())
+        if len(timings) == 0 and not tracemalloc.is_tracing():
+            return None
+
+        snapshot_file = Path.joinpath(self.output_dir, "profile-%s.txt" % stamp)
+        with snapshot_file.open('w', encoding='utf-8') as f:
+            f.write("Profiling since %s\n\n" % datetime.fromtimestamp(self._started).isoformat(timespec='seconds'))
+            f.write("%-50s %10s %14s %12s\n" % ('Hot path', 'Calls', 'Total (s)', 'Max (s)'))
+            for label, (calls, total, longest) in sorted(timings.items(), key=lambda item: -item[1][1]):
+                f.write("%-50s %10d %14.3f %12.3f\n" % (label, calls, total, longest))
+            f.write("\nTop functions (cumulative time)\n")
+            f.write(stats_text.getvalue() or "None recorded\n")
+            if tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                f.write("\nTop allocation sites (traced: %d bytes, peak: %d bytes)\n" % (current, peak))
+                for statistic in tracemalloc.take_snapshot().statistics('lineno')[:self.top]:
+                    f.write("%s\n" % statistic)
+
+        self.logger.info({'_action': whoami(),
+                          'message': "Profiling snapshot written.",
+                          'details': {'path': snapshot_file.as_posix(), 'hot_paths': len(timings)}})
+        return snapshot_file
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler(logger=None):
+    """
+    Process-wide profiler, created on first use from 'configs/defaults.py'.
+    :param logger: logger instance
+    :return: Profiler
+    """
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = Profiler(profiling_dir, profiling_interval, profiling_top, PROFILE_TARGETS, logger)
+    return _profiler
+
+
+def install_profiling(logger=None, targets=()):
+    """
+    Set up the profiler: SIGUSR1 toggles it (where available) and it starts right away if 'profiling' is set.
+    Must be called from the main thread.
+    :param logger: logger instance
+    :param targets: more functions to wrap, see Profiler.add_targets()
+    :return: Profiler
+    """
+    profiler = get_profiler(logger)
+    profiler.add_targets(targets)
+    if hasattr(signal, 'SIGUSR1'):
+        # Toggled from a thread; the signal handler itself must not block on the profiler lock
+        signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(target=profiler.toggle,
+                                                                            name="profiler-toggle").start())
+    if profiling:
+        profiler.enable()
+    return profiler
@@ -0,0 +1,177 @@
+import re
+import json
+import sqlite3
+import logging
+from pathlib import Path
+from .utils import whoami, network_filesystem
+
+IMAGE_COLUMN = 'image'
+
+
+def column_name(name):
+    """
+    SQL friendly column name for a Volatility column, i.e. 'Offset(V)' -> 'offset_v', 'LocalAddr' -> 'localaddr'
+    :param name: Volatility column name
+    :return: (str) column name
+    """
+    _name = re.sub(r'\W+', '_', str(name)).strip('_').lower()
+    if _name == '' or _name[0].isdigit():
+        _name = 'c_' + _name
+    return IMAGE_COLUMN + '_' if _name == IMAGE_COLUMN else _name
+
+
+def table_name(plugin_name):
+    return re.sub(r'\W+', '_', plugin_name).lower()
+
+
+def _quote(identifier):
+    return '"%s"' % identifier.replace('"', '""')
+
+
+def _value(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+class ResultsDB:
+    """
+    Per-case SQLite store of structured plugin results: one table per plugin, one row per result row, with an
+    'image' column and indexes on common pivot columns (PID, process name, addresses, paths).  Runs in WAL mode so
+    analysts can query while images are still being processed, except on network file systems (case folders on
+    NFS / SMB shares): WAL needs shared memory between all readers and writers on one host, so the default rollback
+    journal is used there.
+    """
+    def __init__(self, db_path, pivot_columns=(), batch_size=5000, logger=None, journal_mode=None):
+        """
+        :param db_path: (Path) SQLite database file
+        :param pivot_columns: column names (see column_name()) to index wherever they appear
+        :param batch_size: rows per executemany() call
+        :param logger: logger instance
+        :param journal_mode: SQLite journal mode, default: 'DELETE' on network file systems, 'WAL' otherwise
+        """
+        self.db_path = Path(db_path)
+        self.pivot_columns = set(pivot_columns)
+        self.batch_size = batch_size
+        self.logger = logger if logger is not None else logging.getLogger('root')
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        if journal_mode is None:
+            journal_mode = 'DELETE' if network_filesystem(self.db_path.parent) else 'WAL'
+        self.journal_mode = journal_mode
+
+    def connect(self):
+        connection = sqlite3.connect(self.db_path.as_posix(), timeout=120)
+        connection.execute('PRAGMA journal_mode=%s' % self.journal_mode)
+        if self.journal_mode.upper() == 'WAL':
+            connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def insert_rows(self, image, plugin_name, rows):
+        """
+        Replace the rows of an image in the plugin table.
+        :param image: memory image name
+        :param plugin_name: plugin name
+        :param rows: list of dicts (column: value), as returned for JSON output plugins
+        :return: (int) number of rows stored
+        """
+        rows = [row for row in rows if isinstance(row, dict)]
+        columns = []
+        for row in rows:
+            for name in row.keys():
+                if column_name(name) not in columns:
+                    columns.append(column_name(name))
+        if len(columns) == 0:
+            return 0
+
+        table = table_name(plugin_name)
+        connection = self.connect()
+        try:
+            with connection:
+                self._prepare_table(connection, table, columns)
+                connection.execute('DELETE FROM %s WHERE %s = ?' % (_quote(table), IMAGE_COLUMN), (image,))
+
+                sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+                    _quote(table), ', '.join(_quote(column) for column in [IMAGE_COLUMN] + columns),
+                    ', '.join('?' * (len(columns) + 1)))
+                for start in range(0, len(rows), self.batch_size):
+                    batch = []
+                    for row in rows[start:start + self.batch_size]:
+                        values = {column_name(name): _value(value) for name, value in row.items()}
+                        batch.append([image] + [values.get(column, None) for column in columns])
+                    connection.executemany(sql, batch)
+        finally:
+            connection.close()
+
+        self.logger.debug({'_action': whoami(),
+                           'message': "Stored '%s' results in case database." % plugin_name,
+                           'details': {'database': self.db_path.as_posix(), 'image': image, 'rows': len(rows)}
+                           })
+        return len(rows)
+
+    def _prepare_table(self, connection, table, columns):
+        """
+        Create the plugin table, add columns not seen before and index pivot columns.
+        """
+        connection.execute('CREATE TABLE IF NOT EXISTS %s (%s)' % (_quote(table), _quote(IMAGE_COLUMN)))
+        existing = set(row[1] for row in connection.execute('PRAGMA table_info(%s)' % _quote(table)))
+        for column in columns:
+            if column not in existing:
+                connection.execute('ALTER TABLE %s ADD COLUMN %s' % (_quote(table), _quote(column)))
+
+        for column in [IMAGE_COLUMN] + [column for column in columns if column in self.pivot_columns]:
+            connection.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (
+                _quote("ix_%s_%s" % (table, column)), _quote(table), _quote(column)))
+
+    def tables(self, column=None):
+        """
+        :param column: only tables having this column
+        :return: list of table names
+        """
+        connection = self.connect()
+        try:
+            tables = [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            if column is not None:
+                tables = [table for table in tables
+                          if column in [row[1] for row in connection.execute('PRAGMA table_info(%s)' % _quote(table))]]
+        finally:
+            connection.close()
+        return tables
+
+    def pivot(self, column, value, prefix=False):
+        """
+        Find a value in every plugin table having the column, across all images of the case.
+        i.e. pivot('name', 'powershell.exe') or pivot('foreignaddr', '10.1.2.3:', prefix=True)
+        :param column: column name (see column_name())
+        :param value: value to look for
+        :param prefix: match string values starting with 'value' (uses the index)
+        :return: list of (table, row dict)
+        """
+        results = []
+        connection = self.connect()
+        connection.row_factory = sqlite3.Row
+        try:
+            for table in self.tables(column):
+                if prefix:
+                    sql = 'SELECT * FROM %s WHERE %s >= ? AND %s < ?' % (_quote(table), _quote(column), _quote(column))
+                    params = (value, value + '\uffff')
+                else:
+                    sql = 'SELECT * FROM %s WHERE %s = ?' % (_quote(table), _quote(column))
+                    params = (value,)
+                results.extend((table, dict(row)) for row in connection.execute(sql, params))
+        finally:
+            connection.close()
+        return results
+
+    def query(self, sql, params=()):
+        """
+        Run a read-only query, i.e. "SELECT image, name FROM pslist WHERE pid = ?"
+        :return: list of row dicts
+        """
+        connection = self.connect()
+        connection.row_factory = sqlite3.Row
+        try:
+            return [dict(row) for row in connection.execute(sql, params)]
+        finally:
+            connection.close()
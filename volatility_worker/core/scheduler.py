@@ -0,0 +1,434 @@
+import uuid
+import logging
+import threading
+from pathlib import Path
+from itertools import count
+from collections import OrderedDict
+from time import time
+from configs.defaults import case_processed_flag, plugin_workers
+from .utils import whoami
+from .exceptions import *
+from .vol_worker import VolWorker, get_case_id
+from .overrides import load_case_override, case_override_path
+from .tracing import get_trace, pop_trace
+
+
+class Job:
+    """
+    A memory image moving through the plugin tiers.  The VolWorker is created when the job is first dispatched and
+    is kept between tiers.
+    """
+    _sequence = count()
+
+    def __init__(self, image_path, priority=0, plugins=None, force=False):
+        """
+        :param image_path: path to memory image
+        :param priority: jobs of a higher priority run all their tiers ahead of lower priority jobs
+        :param plugins: plugin names to run instead of the default (or case override) plugin set
+        :param force: re-process an image already processed; its processed flag is removed when the job starts
+        """
+        self.image_path = Path(image_path).as_posix()
+        self.job_id = uuid.uuid4().hex
+        self.case_id, self.case_dir = get_case_id(image_path)
+        self.priority = priority
+        self.plugins = list(plugins) if plugins is not None else None
+        self.force = force
+        self.submitted = time()
+        # Last time the job was queued (submitted or re-queued for its next tier)
+        self.queued = self.submitted
+        self.sequence = next(self._sequence)
+        # Index of the next plugin tier to run
+        self.tier = 0
+        self.worker = None
+        # Set by the runner once all tiers ran, or the job failed
+        self.finished = False
+        # Exit code of the last tier run
+        self.exit_code = None
+
+    def clear_processed_flag(self):
+        """
+        Remove the processed flag of a forced job, when it starts.  Not on submission: a submission refused as already
+        queued or running leaves the flag in place.
+        """
+        if not self.force or self.case_id == "":
+            return
+        try:
+            Path.joinpath(self.case_dir, "{}{}".format(Path(self.image_path).stem, case_processed_flag)).unlink()
+        except FileNotFoundError:
+            pass
+
+    def tier_plugins(self):
+        """
+        :return: plugin names of the next tier, or None if unknown (worker not initialised yet)
+        """
+        if self.worker is None:
+            return None
+        return self.worker.plugin_tiers[self.tier][1]
+
+
+class JobScheduler:
+    """
+    Runs queued images tier by tier: every queued image runs its first (triage) tier before any image starts a later
+    tier, except that higher priority jobs (i.e. submitted through the HTTP API) go first.  Within a tier, jobs are
+    shared fairly across case IDs using deficit round-robin, so a case dropping dozens of images cannot starve other
+    cases.  Case override files may set 'case_weight' (share of dispatches, default 1) and 'case_max_concurrency'
+    (running jobs limit, default unlimited).
+    Jobs are started in worker threads while the admission controller finds memory for them.
+    """
+    def __init__(self, admission, runner, logger=None, plugin_workers=plugin_workers):
+        """
+        :param admission: AdmissionController
+        :param runner: callable(job) running the next tier of a job and returning an exit code.  The runner sets
+        job.finished once the job is complete; unfinished jobs are re-queued for their next tier.
+        :param logger: logger instance
+        :param plugin_workers: plugins the runner runs concurrently per image, for memory estimates
+        """
+        self.admission = admission
+        self.runner = runner
+        self.plugin_workers = plugin_workers
+        self.logger = logger if logger is not None else logging.getLogger('root')
+        self._lock = threading.RLock()
+        # dispatch() is called from the main loop and the HTTP API
+        self._dispatch_lock = threading.Lock()
+        self._pending = list()
+        # image path -> (Job, Thread)
+        self._running = dict()
+
+        # Deficit round-robin state: case ID order, position and deficit per case
+        self._cases = list()
+        self._position = 0
+        self._deficit = dict()
+        # case ID -> error reported for its override file
+        self._settings_errors = dict()
+
+    def submit(self, image_path, priority=0, plugins=None, force=False):
+        """
+        Queue a memory image.
+        :param image_path: path to memory image
+        :param priority: see Job
+        :param plugins: see Job
+        :param force: see Job
+        :return: Job, or None if the image is already queued or running
+        """
+        job = Job(image_path, priority, plugins, force)
+        with self._lock:
+            if self.contains(job.image_path):
+                return None
+            self._pending.append(job)
+        return job
+
+    def contains(self, image_path):
+        _path = Path(image_path).as_posix()
+        with self._lock:
+            return _path in self._running or any(job.image_path == _path for job in self._pending)
+
+    def is_running(self, image_path):
+        with self._lock:
+            return Path(image_path).as_posix() in self._running
+
+    def remove(self, image_path):
+        """
+        Drop a queued (not running) image.
+        :param image_path: path to memory image
+        :return: True if a job was removed
+        """
+        _path = Path(image_path).as_posix()
+        with self._lock:
+            _len = len(self._pending)
+            self._pending = [job for job in self._pending if job.image_path != _path]
+            return len(self._pending) != _len
+
+    def pending(self):
+        """
+        Queued jobs in dispatch order: lowest tier first, then round-robin across case IDs.  The order is a preview;
+        dispatch() advances the round-robin state only for jobs it actually starts.
+        :return: list of Job
+        """
+        with self._lock:
+            state = self._drr_state()
+            ordered = []
+            while True:
+                job = self._select(exclude=ordered)
+                if job is None:
+                    break
+                ordered.append(job)
+                self._charge(job)
+            self._restore_drr_state(state)
+        return ordered
+
+    def running(self):
+        with self._lock:
+            return [job for job, _ in self._running.values()]
+
+    def find(self, job_id):
+        """
+        :param job_id: Job.job_id
+        :return: queued or running Job, or None
+        """
+        with self._lock:
+            return next((job for job in self._pending + self.running() if job.job_id == job_id), None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def dispatch(self):
+        """
+        Start queued jobs for as long as the admission controller finds memory for them.  A later tier is never
+        started ahead of an earlier tier job that is still waiting for memory.
+        :return: (int) number of jobs started
+        """
+        with self._dispatch_lock:
+            return self._dispatch()
+
+    def _dispatch(self):
+        started = 0
+        skipped = []
+        max_tier = None
+        while True:
+            with self._lock:
+                state = self._drr_state()
+                job = self._select(exclude=skipped, max_tier=max_tier)
+            if job is None:
+                break
+
+            try:
+                image_size = Path(job.image_path).stat().st_size
+            except OSError:
+                self.remove(job.image_path)
+                continue
+
+            if not self.admission.try_admit(job.image_path, image_size, job.tier_plugins(), self.plugin_workers):
+                # A job waiting for memory keeps its case's turn and credit for the next dispatch
+                with self._lock:
+                    self._restore_drr_state(state)
+                skipped.append(job)
+                max_tier = job.tier
+                continue
+
+            with self._lock:
+                self._charge(job)
+                self._pending.remove(job)
+                t = threading.Thread(target=self._run, args=(job,), name="job-%s" % Path(job.image_path).name)
+                self._running[job.image_path] = (job, t)
+            t.start()
+            started += 1
+        return started
+
+    def _select(self, exclude=(), max_tier=None):
+        """
+        Deficit round-robin pick among pending jobs of the highest priority and lowest pending tier, leaving out cases
+        at their concurrency cap.  Each case earns its weight in credit per round and spends one credit per started job.
+        :param exclude: jobs not to consider (i.e. waiting for memory)
+        :param max_tier: do not consider jobs beyond this tier
+        :return: Job or None
+        """
+        eligible = [job for job in self._pending if job not in exclude]
+        if len(eligible) == 0:
+            return None
+        # Cases at their concurrency cap neither run nor hold back the priority or tier of other cases
+        at_capacity = {case_id: self._at_capacity(case_id) for case_id in set(job.case_id for job in eligible)}
+        eligible = [job for job in eligible if not at_capacity[job.case_id]]
+        if len(eligible) == 0:
+            return None
+        priority = max(job.priority for job in eligible)
+        eligible = [job for job in eligible if job.priority == priority]
+        tier = min(job.tier for job in eligible)
+        if max_tier is not None and tier > max_tier:
+            return None
+
+        by_case = OrderedDict()
+        for job in sorted(eligible, key=lambda _job: _job.sequence):
+            if job.tier == tier:
+                by_case.setdefault(job.case_id, []).append(job)
+
+        # Forget cases with nothing queued, register new ones at the end of the round
+        queued_cases = set(job.case_id for job in self._pending)
+        for case_id in [_case for _case in self._cases if _case not in queued_cases]:
+            if self._cases.index(case_id) < self._position:
+                self._position -= 1
+            self._cases.remove(case_id)
+            self._deficit.pop(case_id, None)
+        for case_id in by_case.keys():
+            if case_id not in self._cases:
+                self._cases.append(case_id)
+
+        # Cases with jobs of the tier waiting for memory are passed over, but are not idle
+        waiting = set(job.case_id for job in exclude if job.tier == tier and job in self._pending)
+        while True:
+            self._position %= len(self._cases)
+            case_id = self._cases[self._position]
+            if case_id not in by_case:
+                # Nothing eligible; an idle case does not bank credit
+                if case_id not in waiting:
+                    self._deficit[case_id] = 0
+                self._position += 1
+                continue
+            if self._deficit.get(case_id, 0) >= 1:
+                return by_case[case_id][0]
+            self._deficit[case_id] = self._deficit.get(case_id, 0) + self._weight(case_id)
+            if self._deficit[case_id] < 1:
+                self._position += 1
+
+    def _drr_state(self):
+        return list(self._cases), self._position, dict(self._deficit)
+
+    def _restore_drr_state(self, state):
+        self._cases, self._position, self._deficit = list(state[0]), state[1], dict(state[2])
+
+    def _charge(self, job):
+        self._deficit[job.case_id] = self._deficit.get(job.case_id, 0) - 1
+        if self._deficit[job.case_id] < 1:
+            self._position += 1
+
+    def _at_capacity(self, case_id):
+        max_concurrency = self._settings(case_id).get('case_max_concurrency', None)
+        if max_concurrency is None:
+            return False
+        return sum(1 for job, _ in self._running.values() if job.case_id == case_id) >= max_concurrency
+
+    def _weight(self, case_id):
+        weight = self._settings(case_id).get('case_weight', 1)
+        return weight if isinstance(weight, (int, float)) and weight > 0 else 1
+
+    def _settings(self, case_id):
+        """
+        Scheduling settings from the case override file (<case dir>/<CASE_ID>.py), re-loaded when the file changes.
+        :param case_id: case ID
+        :return: dict
+        """
+        case_dir = next((job.case_dir for job in self._pending if job.case_id == case_id), None)
+        if case_dir is None:
+            case_dir = next((job.case_dir for job, _ in self._running.values() if job.case_id == case_id), None)
+        if case_dir is None or case_id == "":
+            return dict()
+
+        try:
+            _override_config = load_case_override(case_dir, case_id)
+        except Exception as _err:
+            # Reported once per error; the loader re-raises until the file changes
+            if self._settings_errors.get(case_id) is not _err:
+                self._settings_errors[case_id] = _err
+                self.logger.warning({'_action': whoami(),
+                                     'message': "Failed to read scheduling settings from override configuration.",
+                                     'details': {'config': case_override_path(case_dir, case_id).as_posix()},
+                                     'errors': [str(_err)]})
+            return dict()
+        if _override_config is None:
+            return dict()
+        return {k: getattr(_override_config, k) for k in ('case_weight', 'case_max_concurrency')
+                if hasattr(_override_config, k)}
+
+    def _run(self, job):
+        self.admission.track(job.image_path)
+        exit_code = -1
+        try:
+            exit_code = self.runner(job)
+            job.exit_code = exit_code
+        except Exception as _err:
+            job.finished = True
+            job.exit_code = exit_code
+            self.logger.error({'_action': whoami(),
+                               'message': "Job failed unexpectedly.",
+                               'details': {'path': job.image_path},
+                               'errors': [str(_err)]})
+        finally:
+            self.admission.release(job.image_path)
+            with self._lock:
+                del self._running[job.image_path]
+                if not job.finished:
+                    job.queued = time()
+                    self._pending.append(job)
+
+        if exit_code == 0:
+            self.logger.info("Job successful")
+        else:
+            self.logger.warning("Job unsuccessful")
+
+
+def run_job_tier(job, logger, leases=None, plugin_workers=plugin_workers):
+    """
+    Run the next plugin tier of a job.  The worker is created (profile identification etc.) on the first tier.
+    :param job: scheduler Job
+    :param logger: logger instance
+    :param leases: LeaseManager in distributed mode, or None
+    :param plugin_workers: plugins run concurrently per image
+    :return: exit code
+    """
+    w_path = job.image_path
+    if job.worker is None and leases is not None and not leases.claim(w_path):
+        # Another node is processing this image
+        pop_trace(w_path)
+        job.finished = True
+        return 0
+
+    if job.worker is None:
+        job.clear_processed_flag()
+
+    trace = get_trace(w_path)
+    if trace is not None:
+        trace.add('queued' if job.worker is None else 'queued (tier %d)' % job.tier, job.queued, time(), 'queue')
+
+    logger.info({'_action': whoami(),
+                 'message': "Starting worker thread for %s" % w_path,
+                 'details': {'tier': job.tier}})
+    succeeded = False
+    try:
+        if job.worker is None:
+            job.worker = VolWorker(w_path, plugin_workers=plugin_workers, plugins=job.plugins)
+        job.worker.run_tier(job.tier)
+
+        # Skip empty tiers; they have nothing to wait for
+        job.tier += 1
+        while job.tier < len(job.worker.plugin_tiers) and len(job.tier_plugins()) == 0:
+            job.tier += 1
+        if job.tier >= len(job.worker.plugin_tiers):
+            job.worker.finish()
+            job.finished = True
+        succeeded = True
+    except CaseFolderNotFound as _err:
+        logger.error({'_action': whoami(),
+                      'message': "Unable to determine case ID. Skipping.",
+                      'errors': [str(_err)]})
+    except PreviouslyProcessed as _err:
+        logger.warning({'_action': whoami(),
+                        'message': "Previously processed case %s. Remove %s to re-process."
+                                   % (Path(w_path).name, case_processed_flag),
+                        'details': [str(_err)]
+                        })
+        return 0
+    except MemoryImageLoadFailure as _err:
+        logger.error({'_action': whoami(),
+                      'message': "Unable to load image. Skipping.",
+                      'details': {'path': w_path},
+                      'errors': [str(_err)]})
+    except MemoryImageProfileFailure:
+        logger.error({'_action': whoami(),
+                      'message': "Unable to determine profile. Terminating.",
+                      'details': {'path': w_path}
+                      })
+    except OverrideConfigFailure as _err:
+        logger.error({'_action': whoami(),
+                      'message': "Override configuration import failed.",
+                      'errors': [str(_err)]})
+    except Exception as _err:
+        logger.warning({'_action': whoami(),
+                        'message': "Failed to process %s" % w_path,
+                        'details': {'path': w_path,
+                                    'error': str(_err)}
+                        })
+        return -1
+    else:
+        return 0
+    finally:
+        # Failed jobs are not re-queued for later tiers
+        if not succeeded:
+            job.finished = True
+            if job.worker is not None:
+                job.worker.memory_dump.release()
+                # Keep what the plugins produced
+                job.worker.publish_outputs()
+                job.worker.write_trace()
+                job.worker.close_loggers()
+        if job.finished and leases is not None:
+            leases.release(w_path)
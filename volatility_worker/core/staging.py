@@ -0,0 +1,145 @@
+import os
+import errno
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from configs.defaults import image_staging, image_staging_dir, image_staging_max_bytes
+from .utils import whoami
+from .image_cache import ImageCache
+
+# Bytes read (and compared against zeros) at a time while staging
+STAGING_BLOCK_SIZE = 4 * 1024 ** 2
+
+
+def _data_ranges(fd, size):
+    """
+    Ranges of a file holding data, skipping holes where the file system reports them (SEEK_DATA / SEEK_HOLE).
+    :return: list of (start, end)
+    """
+    if not hasattr(os, 'SEEK_DATA'):
+        return [(0, size)]
+    ranges = []
+    position = 0
+    while position < size:
+        try:
+            start = os.lseek(fd, position, os.SEEK_DATA)
+            end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+        except OSError as _err:
+            if _err.errno == errno.ENXIO:
+                # Only a hole left
+                break
+            # Not supported by the file system
+            return ranges + [(position, size)]
+        ranges.append((start, end))
+        position = end
+    return ranges
+
+
+def sparse_copy(source, destination, block_size=STAGING_BLOCK_SIZE):
+    """
+    Copy a file, leaving holes for the source's holes and for all-zero blocks.  Memory images are often largely
+    zero-filled, so the copy takes a fraction of the image size on disk.
+    :param source: (Path) file to copy
+    :param destination: (Path) copy
+    :param block_size: bytes per read
+    :return: (int) bytes written
+    """
+    size = Path(source).stat().st_size
+    written = 0
+    zeros = bytes(block_size)
+    with open(source, 'rb', buffering=0) as src, open(destination, 'wb') as dst:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(src.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        for start, end in _data_ranges(src.fileno(), size):
+            src.seek(start)
+            position = start
+            while position < end:
+                block = src.read(min(block_size, end - position))
+                if not block:
+                    break
+                if block != zeros[:len(block)]:
+                    dst.seek(position)
+                    dst.write(block)
+                    written += len(block)
+                position += len(block)
+        # Trailing holes
+        dst.truncate(size)
+    return written
+
+
+def staging_key(image_path, image_cache):
+    """
+    Staged copies are keyed by the image fingerprint (which covers the file identity and modification time, see
+    ImageCache.fingerprint()), so an image replaced in place is staged again.
+    :param image_path: (Path) source image
+    :param image_cache: ImageCache
+    :return: (str) hex digest
+    """
+    digest = hashlib.sha1(image_cache.fingerprint(image_path).encode())
+    digest.update(str(Path(image_path).stat().st_mtime_ns).encode())
+    return digest.hexdigest()
+
+
+_staging_cache = None
+_staging_cache_lock = threading.Lock()
+
+
+def get_staging_cache():
+    """
+    Process-wide local staging area, created on first use from 'configs/defaults.py'.
+    :return: ImageCache or None if staging is disabled
+    """
+    global _staging_cache
+    if not image_staging:
+        return None
+
+    with _staging_cache_lock:
+        if _staging_cache is None:
+            _staging_cache = ImageCache(image_staging_dir, image_staging_max_bytes, name="image staging area")
+    return _staging_cache
+
+
+def stage_image(image_path, logger=None):
+    """
+    Copy an image (i.e. on a network share) to local scratch once, as a sparse copy.  The staged copy is pinned until
+    released with get_staging_cache().release(key).
+    :param image_path: (Path) image to stage
+    :param logger: logger instance
+    :return: (str) staging key, (Path) staged copy; (None, image_path) if staging is disabled or the image does not fit
+    """
+    logger = logger if logger is not None else logging.getLogger('root')
+    staging_cache = get_staging_cache()
+    image_path = Path(image_path)
+    if staging_cache is None:
+        return None, image_path
+
+    size = image_path.stat().st_size
+    if size > staging_cache.max_bytes:
+        logger.warning({'_action': whoami(),
+                        'message': "Image larger than the staging area.  Processing it in place.",
+                        'details': {'path': image_path.as_posix(), 'size': size,
+                                    'max_bytes': staging_cache.max_bytes}})
+        return None, image_path
+
+    key = staging_key(image_path, staging_cache)
+    staged = staging_cache.get(key)
+    if staged is not None:
+        logger.info({'_action': whoami(),
+                     'message': "Image already staged.",
+                     'details': {'path': image_path.as_posix(), 'staged': staged.as_posix()}})
+        return key, staged
+
+    # Make room first; the copy is only accounted for once complete
+    staging_cache.evict(reserve=size)
+    written = [0]
+
+    def _copy(output_file):
+        written[0] = sparse_copy(image_path, output_file)
+
+    staged = staging_cache.add(key, _copy, image_path.suffix.lstrip('.') or 'raw', source=image_path.as_posix())
+    logger.info({'_action': whoami(),
+                 'message': "Image staged to local scratch.",
+                 'details': {'path': image_path.as_posix(), 'staged': staged.as_posix(), 'size': size,
+                             'written': written[0], 'disk_size': staging_cache.disk_size(staged)}})
+    return key, staged
@@ -0,0 +1,149 @@
+import re
+import os
+import mmap
+import shutil
+import logging
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from .utils import whoami, process_pool_context
+from .compressed_output import compressed_path, open_binary_output
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Printable characters, as GNU strings: space to '~' and tab
+_PRINTABLE = b'\t\x20-\x7e'
+
+
+def _runs(mask, min_length):
+    """
+    Runs of True in a boolean array.
+    :return: (starts, ends) index arrays, ends exclusive
+    """
+    edges = numpy.diff(numpy.concatenate(([False], mask, [False])).view(numpy.int8))
+    starts = numpy.flatnonzero(edges == 1)
+    ends = numpy.flatnonzero(edges == -1)
+    keep = (ends - starts) >= min_length
+    return starts[keep], ends[keep]
+
+
+def _strings_numpy(data, min_length):
+    """
+    ASCII and UTF-16LE strings in a buffer, by vectorised byte classification.
+    :return: list of (offset in data, string)
+    """
+    found = []
+    raw = numpy.frombuffer(data, dtype=numpy.uint8)
+    printable = ((raw >= 0x20) & (raw <= 0x7e)) | (raw == 0x09)
+
+    starts, ends = _runs(printable, min_length)
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        found.append((start, bytes(data[start:end]).decode('ascii')))
+
+    # UTF-16LE: printable low byte followed by a zero high byte, at both alignments
+    for align in (0, 1):
+        count = (len(raw) - align) // 2
+        mask = printable[align:align + 2 * count:2] & (raw[align + 1:align + 2 * count:2] == 0)
+        starts, ends = _runs(mask, min_length)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            offset = align + 2 * start
+            found.append((offset, bytes(data[offset:align + 2 * end]).decode('utf-16-le')))
+    return found
+
+
+def _strings_re(data, min_length):
+    """
+    Regular expression fallback for _strings_numpy()
+    """
+    found = [(match.start(), match.group(0).decode('ascii'))
+             for match in re.finditer(b'[%s]{%d,}' % (_PRINTABLE, min_length), data)]
+    found.extend((match.start(), match.group(0).decode('utf-16-le'))
+                 for match in re.finditer(b'(?:[%s]\x00){%d,}' % (_PRINTABLE, min_length), data))
+    return found
+
+
+def _extract_chunk(image_path, start, length, min_length, max_length, part_file):
+    """
+    Write the strings starting in image[start:start + length] to part_file, as 'offset:string' lines.
+    The window is widened by one character before (to skip strings starting in the previous chunk) and by
+    'max_length' characters after (strings crossing the chunk end; longer strings are truncated).
+    :return: number of strings
+    """
+    image_size = Path(image_path).stat().st_size
+    window_start = max(0, start - 2)
+    window_end = min(image_size, start + length + 2 * max_length)
+    map_start = window_start - window_start % mmap.ALLOCATIONGRANULARITY
+    if window_end <= window_start:
+        return 0
+
+    with open(image_path, 'rb') as f, mmap.mmap(f.fileno(), window_end - map_start, offset=map_start,
+                                                  access=mmap.ACCESS_READ) as mapped:
+        data = memoryview(mapped)[window_start - map_start:]
+        try:
+            if numpy is not None:
+                found = _strings_numpy(data, min_length)
+            else:
+                found = _strings_re(data, min_length)
+        finally:
+            # The map cannot be closed while views into it exist
+            data.release()
+
+    count = 0
+    with open(part_file, 'w', encoding='utf-8', errors='replace') as out:
+        for offset, string in sorted(found):
+            offset += window_start
+            if start <= offset < start + length:
+                out.write("%d:%s\n" % (offset, string[:max_length]))
+                count += 1
+    return count
+
+
+def extract_strings(image_path, output_file, min_length=4, max_length=1024, workers=4,
+                    chunk_size=64 * 1024 ** 2, logger=None, compression=None):
+    """
+    Extract printable ASCII and UTF-16LE strings from a memory image into 'offset:string' lines (decimal offsets),
+    the input format of Volatility's 'strings' plugin.  The image is memory-mapped in chunks processed in parallel.
+    :param image_path: (Path) memory image
+    :param output_file: (Path) strings file
+    :param min_length: minimum string length, in characters
+    :param max_length: strings are truncated to this many characters
+    :param workers: pool processes
+    :param chunk_size: bytes per chunk
+    :param logger: logger instance
+    :param compression: 'gzip', 'lzma' or None for the plain file Volatility reads; see compressed_path()
+    :return: number of strings
+    """
+    logger = logger if logger is not None else logging.getLogger('root')
+    if numpy is None:
+        logger.warning({'_action': whoami(),
+                        'message': "'numpy' not installed.  Falling back to regular expressions for strings."})
+
+    output_file = Path(output_file)
+    written = compressed_path(output_file, compression)
+    image_size = Path(image_path).stat().st_size
+    starts = list(range(0, image_size, chunk_size))
+    parts = [output_file.with_name("%s.part%06d" % (output_file.name, i)) for i in range(len(starts))]
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=process_pool_context()) as pool:
+            counts = list(pool.map(_extract_chunk, [Path(image_path).as_posix()] * len(starts), starts,
+                                   [chunk_size] * len(starts), [min_length] * len(starts),
+                                   [max_length] * len(starts), [part.as_posix() for part in parts]))
+        with open_binary_output(written, compression) as out:
+            for part in parts:
+                with part.open('rb') as f:
+                    shutil.copyfileobj(f, out, 1024 * 1024)
+    finally:
+        for part in parts:
+            try:
+                os.unlink(part.as_posix())
+            except FileNotFoundError:
+                pass
+
+    logger.info({'_action': whoami(),
+                 'message': "Strings extracted.",
+                 'details': {'path': Path(image_path).as_posix(), 'output': written.as_posix(),
+                             'strings': sum(counts), 'chunks': len(starts)}
+                 })
+    return sum(counts)
@@ -0,0 +1,84 @@
+import re
+
+# Volatility 2 text renderer: a header line, a rule of dash runs (one per column, separated by a space) and
+# fixed-width rows.  Values wider than their column push the rest of the row to the right.
+_RULE_RE = re.compile(r'^-+( -+)*\s*$')
+_DASH_RUN_RE = re.compile(r'-+')
+_INT_RE = re.compile(r'^-?\d+$')
+
+
+def _layout(header, rule):
+    """
+    Column names and (start, end) boundaries from the dashed header rule.
+    :return: list of (name, start, end)
+    """
+    runs = [(match.start(), match.end()) for match in _DASH_RUN_RE.finditer(rule.rstrip())]
+    columns = []
+    for i, (start, end) in enumerate(runs):
+        # Header names may be wider than their rule; take everything up to the next column
+        name_end = runs[i + 1][0] if i + 1 < len(runs) else len(header)
+        columns.append((header[start:name_end].strip(), start, end))
+    return columns
+
+
+def _typed(value):
+    if value == '' or set(value) == {'-'}:
+        return None
+    if _INT_RE.match(value):
+        return int(value)
+    return value
+
+
+def _split_row(line, layout):
+    """
+    Slice a row into fields using the column boundaries.  A value overflowing its column (no space where the
+    column ends) shifts the following columns by the overflow.
+    """
+    fields = []
+    shift = 0
+    last = len(layout) - 1
+    for i, (_, start, end) in enumerate(layout):
+        start += shift
+        if i == last:
+            fields.append(line[start:].strip())
+            break
+        end += shift
+        while end < len(line) and not line[end].isspace():
+            end += 1
+            shift += 1
+        fields.append(line[start:end].strip())
+    return fields
+
+
+def parse_table_output(text, strict=True):
+    """
+    Parse Volatility fixed-width table output into rows, as Volatility's JSON output would provide.
+    Column boundaries come from the dashed rule under each header; outputs with several tables (i.e. one per
+    process) are supported.
+    :param text: (str) plugin text output
+    :param strict: if True, give up (return None) when any non-blank line is not part of a table, so no output is
+    lost by the conversion
+    :return: list of row dicts (column name: typed value), or None if the output is not tabular
+    """
+    lines = text.splitlines()
+    rows = []
+    layout = None
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        following = lines[i + 1] if i + 1 < len(lines) else ''
+        if line.strip() != '' and _RULE_RE.match(following):
+            # New table
+            layout = _layout(line, following)
+            i += 2
+            continue
+
+        if line.strip() == '':
+            layout = None
+        elif layout is not None:
+            rows.append({name: _typed(value) for (name, _, _), value in zip(layout, _split_row(line, layout))})
+        elif strict:
+            return None
+        i += 1
+
+    return rows if len(rows) > 0 else None
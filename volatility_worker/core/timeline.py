@@ -0,0 +1,167 @@
+import csv
+import heapq
+import tempfile
+from datetime import datetime, timezone
+from time import gmtime, strftime
+from .utils import whoami
+from .compressed_output import open_output, open_result
+
+# Same columns as 'mactime -d'
+TIMELINE_HEADER = ['Date', 'Size', 'Type', 'Mode', 'UID', 'GID', 'Meta', 'File Name']
+# Body file (TSK 3.x) columns: MD5|name|inode|mode_as_string|UID|GID|size|atime|mtime|ctime|crtime
+_BODY_FIELDS = 11
+_MACB = 'macb'
+
+
+def parse_time(value, end=False):
+    """
+    Parse a UTC time 'yyyy-mm-dd[Thh:mm[:ss]]' into epoch seconds.
+    :param value: (str) time, '' or None
+    :param end: if True, a value without seconds means the end of that day or minute
+    :return: (int) epoch seconds or None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if 'T' not in value:
+        fmt, span = '%Y-%m-%d', 86399
+    elif value.count(':') == 1:
+        fmt, span = '%Y-%m-%dT%H:%M', 59
+    else:
+        fmt, span = '%Y-%m-%dT%H:%M:%S', 0
+    epoch = int(datetime.strptime(value, fmt).replace(tzinfo=timezone.utc).timestamp())
+    return epoch + span if end else epoch
+
+
+def parse_date_range(date_range):
+    """
+    Parse a mactime style date range 'yyyy-mm-dd[Thh:mm:ss]..yyyy-mm-dd[Thh:mm:ss]' (UTC).  Either end may be
+    omitted, i.e. '2019-01-01..'.
+    :param date_range: (str) date range or None
+    :return: (start, end) epoch seconds, None for an open end
+    """
+    if not date_range:
+        return None, None
+    start, _, end = date_range.partition('..')
+    return parse_time(start), parse_time(end, end=True)
+
+
+def format_event(event):
+    """
+    :param event: (time, name, size, type, mode, uid, gid, meta)
+    :return: list of values in TIMELINE_HEADER order
+    """
+    stamp, name, size, flags, mode, uid, gid, meta = event
+    return [strftime('%a %b %d %Y %H:%M:%S', gmtime(stamp)), size, flags, mode, uid, gid, meta, name]
+
+
+def body_events(body_file, start=None, end=None):
+    """
+    Lazily parse a body file into timeline events.  Each distinct timestamp of an entry is one event; timestamps
+    shared by several of the m/a/c/b fields are combined, as mactime does.
+    :param body_file: path to body file
+    :param start: skip events before this epoch
+    :param end: skip events after this epoch
+    :return: generator of (time, name, size, type, mode, uid, gid, meta)
+    """
+    with open_result(body_file) as f:
+        for line in f:
+            fields = line.rstrip('\r\n').split('|')
+            if len(fields) < _BODY_FIELDS:
+                continue
+            # File names may contain '|'; the 9 trailing and 1 leading fields are fixed
+            if len(fields) > _BODY_FIELDS:
+                fields = [fields[0], '|'.join(fields[1:len(fields) - 9])] + fields[-9:]
+            _, name, inode, mode, uid, gid, size, atime, mtime, ctime, crtime = fields
+
+            try:
+                stamps = [int(mtime or 0), int(atime or 0), int(ctime or 0), int(crtime or 0)]
+            except ValueError:
+                continue
+
+            for stamp in sorted(set(stamps)):
+                if stamp <= 0 or (start is not None and stamp < start) or (end is not None and stamp > end):
+                    continue
+                flags = ''.join(_MACB[i] if stamps[i] == stamp else '.' for i in range(4))
+                yield stamp, name, size, flags, mode, uid, gid, inode
+
+
+def _spill(events):
+    """
+    Write sorted events to a temporary file.
+    :return: open temporary file positioned at the start
+    """
+    spill = tempfile.TemporaryFile(mode='w+', encoding='utf-8', newline='')
+    csv.writer(spill).writerows(events)
+    spill.seek(0)
+    return spill
+
+
+def _read_spill(spill):
+    for row in csv.reader(spill):
+        yield (int(row[0]),) + tuple(row[1:])
+
+
+def sorted_events(body_files, start=None, end=None, chunk_size=1000000, logger=None):
+    """
+    Sort events from all body files using bounded memory: events are sorted in chunks of 'chunk_size', spilled to
+    temporary files and k-way merged.
+    :param body_files: paths to body files.  Missing files are skipped.
+    :param start: skip events before this epoch
+    :param end: skip events after this epoch
+    :param chunk_size: events held in memory at once
+    :param logger: logger instance
+    :return: generator of events in (time, name) order
+    """
+    spills = []
+    chunk = []
+    try:
+        for body_file in body_files:
+            try:
+                for event in body_events(body_file, start, end):
+                    chunk.append(event)
+                    if len(chunk) >= chunk_size:
+                        chunk.sort()
+                        spills.append(_spill(chunk))
+                        chunk = []
+            except FileNotFoundError:
+                if logger is not None:
+                    logger.warning({'_action': whoami(),
+                                    'message': "Timeline body file not found.  Skipping.",
+                                    'details': {'path': str(body_file)}})
+        chunk.sort()
+
+        if len(spills) == 0:
+            yield from chunk
+        else:
+            yield from heapq.merge(chunk, *[_read_spill(spill) for spill in spills])
+    finally:
+        for spill in spills:
+            spill.close()
+
+
+def write_timeline(body_files, output_file, date_range=None, chunk_size=1000000, logger=None, index_writer=None,
+                   compression=None):
+    """
+    Native replacement for 'mactime -d -b': merge body files into a time-sorted CSV timeline, streamed to disk.
+    Dates are formatted in UTC.
+    :param body_files: paths to body files (mftparser, shellbags, timeliner)
+    :param output_file: path to CSV output (including any compression suffix)
+    :param date_range: mactime style date range, see parse_date_range()
+    :param chunk_size: events held in memory at once
+    :param logger: logger instance
+    :param index_writer: optional timeline_index.TimelineIndexWriter also receiving every event
+    :param compression: 'gzip', 'lzma' or None; see compressed_output.py
+    :return: (int) number of events written
+    """
+    start, end = parse_date_range(date_range)
+    count = 0
+    with open_output(output_file, compression, newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(TIMELINE_HEADER)
+        for event in sorted_events(body_files, start, end, chunk_size, logger):
+            writer.writerow(format_event(event))
+            if index_writer is not None:
+                index_writer.add(event)
+            count += 1
+    return count
@@ -0,0 +1,178 @@
+import os
+import csv
+import sys
+import struct
+import argparse
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from .timeline import TIMELINE_HEADER, format_event, parse_time
+
+# Record file ('mactime.bin'): time-ordered records, each a '<qI' header (epoch seconds, payload length) followed by
+# the UTF-8 payload 'size, type, mode, uid, gid, meta, name' separated by NUL bytes.
+# Index file ('mactime.idx'): header, then bucket start times and the offset of the first record in each non-empty
+# bucket.  A time-window query bisects the index, seeks to the bucket and scans only until the window ends.
+# Query from the command line: python -m volatility_worker.core.timeline_index <mactime.bin> --start --end --path
+INDEX_MAGIC = b'VWTLIDX1'
+_INDEX_HEADER = struct.Struct('<8sIQ')
+_RECORD_HEADER = struct.Struct('<qI')
+_SEPARATOR = '\0'
+
+
+def index_file_for(record_file):
+    return Path(record_file).with_suffix('.idx')
+
+
+def _strip_tag(name):
+    """
+    Drop the source tag Volatility prefixes to names, i.e. '[MFT FILE_NAME] Windows\\System32' -> 'Windows\\System32'
+    """
+    if name.startswith('[') and '] ' in name:
+        return name.split('] ', 1)[1]
+    return name
+
+
+class TimelineIndexWriter:
+    """
+    Writes time-sorted events to a record file and builds its sparse bucket index.  Files are written to temporary
+    names and moved in place on close, so readers never see a partial index.
+    """
+    def __init__(self, record_file, bucket_seconds=60):
+        """
+        :param record_file: (Path) record file, the index is written beside it with an '.idx' suffix
+        :param bucket_seconds: (int) width of an index bucket
+        """
+        self.record_file = Path(record_file)
+        self.index_file = index_file_for(record_file)
+        self.bucket_seconds = int(bucket_seconds)
+        self._records_tmp = self.record_file.with_name(self.record_file.name + '.tmp')
+        self._records = self._records_tmp.open('wb')
+        self._offset = 0
+        self._last_bucket = None
+        self._last_stamp = None
+        self._times = array('q')
+        self._offsets = array('Q')
+
+    def add(self, event):
+        """
+        :param event: (time, name, size, type, mode, uid, gid, meta), in time order
+        :return: None
+        """
+        stamp, name, size, flags, mode, uid, gid, meta = event
+        if self._last_stamp is not None and stamp < self._last_stamp:
+            raise ValueError("Timeline events must be added in time order.")
+        self._last_stamp = stamp
+
+        bucket = stamp - stamp % self.bucket_seconds
+        if bucket != self._last_bucket:
+            self._times.append(bucket)
+            self._offsets.append(self._offset)
+            self._last_bucket = bucket
+
+        payload = _SEPARATOR.join(str(value) for value in (size, flags, mode, uid, gid, meta, name)).encode(
+            'utf-8', 'replace')
+        self._records.write(_RECORD_HEADER.pack(stamp, len(payload)))
+        self._records.write(payload)
+        self._offset += _RECORD_HEADER.size + len(payload)
+
+    def close(self):
+        self._records.close()
+        index_tmp = self.index_file.with_name(self.index_file.name + '.tmp')
+        with index_tmp.open('wb') as f:
+            f.write(_INDEX_HEADER.pack(INDEX_MAGIC, self.bucket_seconds, len(self._times)))
+            self._times.tofile(f)
+            self._offsets.tofile(f)
+        os.replace(self._records_tmp.as_posix(), self.record_file.as_posix())
+        os.replace(index_tmp.as_posix(), self.index_file.as_posix())
+
+    def abort(self):
+        self._records.close()
+        for _tmp in (self._records_tmp, self.index_file.with_name(self.index_file.name + '.tmp')):
+            try:
+                _tmp.unlink()
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class TimelineIndex:
+    """
+    Read-only view of an indexed timeline.
+    """
+    def __init__(self, record_file):
+        """
+        :param record_file: (Path) record file written by TimelineIndexWriter
+        """
+        self.record_file = Path(record_file)
+        with index_file_for(record_file).open('rb') as f:
+            magic, self.bucket_seconds, count = _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))
+            if magic != INDEX_MAGIC:
+                raise ValueError("'%s' is not a timeline index." % index_file_for(record_file))
+            self._times = array('q')
+            self._times.fromfile(f, count)
+            self._offsets = array('Q')
+            self._offsets.fromfile(f, count)
+
+    def __len__(self):
+        return len(self._times)
+
+    def query(self, start=None, end=None, path_prefix=None):
+        """
+        Events within a time window, optionally limited to paths starting with path_prefix.
+        :param start: epoch seconds (inclusive), None for the beginning
+        :param end: epoch seconds (inclusive), None for the end
+        :param path_prefix: case-insensitive path prefix; the '[SOURCE]' tag of names is ignored
+        :return: generator of (time, name, size, type, mode, uid, gid, meta)
+        """
+        offset = 0
+        if start is not None:
+            position = bisect_right(self._times, start - start % self.bucket_seconds) - 1
+            if position >= 0:
+                offset = self._offsets[position]
+        prefix = path_prefix.lower() if path_prefix else None
+
+        with self.record_file.open('rb') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break
+                stamp, length = _RECORD_HEADER.unpack(header)
+                if end is not None and stamp > end:
+                    break
+                if start is not None and stamp < start:
+                    f.seek(length, os.SEEK_CUR)
+                    continue
+                size, flags, mode, uid, gid, meta, name = f.read(length).decode('utf-8', 'replace').split(
+                    _SEPARATOR, 6)
+                if prefix is not None and not _strip_tag(name).lower().startswith(prefix):
+                    continue
+                yield stamp, name, size, flags, mode, uid, gid, meta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query an indexed timeline ('mactime.bin').")
+    parser.add_argument('record_file', help="timeline record file")
+    parser.add_argument('--start', help="UTC start time, yyyy-mm-dd[Thh:mm[:ss]]")
+    parser.add_argument('--end', help="UTC end time, yyyy-mm-dd[Thh:mm[:ss]]")
+    parser.add_argument('--path', help="case-insensitive path prefix, i.e. 'Windows\\System32'")
+    args = parser.parse_args(argv)
+
+    writer = csv.writer(sys.stdout, lineterminator='\n')
+    writer.writerow(TIMELINE_HEADER)
+    for event in TimelineIndex(args.record_file).query(parse_time(args.start), parse_time(args.end, end=True),
+                                                       args.path):
+        writer.writerow(format_event(event))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
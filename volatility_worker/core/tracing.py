@@ -0,0 +1,161 @@
+import os
+import json
+import threading
+from time import time
+from pathlib import Path
+from contextlib import contextmanager
+from configs.defaults import trace_jobs
+
+# Per-image trace files in Chrome trace event format (chrome://tracing, https://ui.perfetto.dev).  Spans are
+# complete ('X') events on the track of the thread that ran them; Volatility processes get their own tracks.
+# A thread records into the trace it is working for (set_current()), so deep code (i.e. hpak extraction) can add
+# spans without passing the trace around.
+
+_local = threading.local()
+_lock = threading.Lock()
+# image path -> JobTrace
+_traces = dict()
+
+
+class JobTrace:
+    """
+    Spans of one memory image, across the threads and processes working on it.
+    """
+    def __init__(self, name):
+        """
+        :param name: trace (process track) name, i.e. image file name
+        """
+        self.name = name
+        self.pid = os.getpid()
+        self.events = []
+        # (pid, tid) -> track name
+        self.tracks = dict()
+        self._lock = threading.Lock()
+
+    def add(self, name, start, end, cat='job', args=None, pid=None, tid=None, track=None):
+        """
+        Record a span.
+        :param name: span name
+        :param start: (float) epoch seconds
+        :param end: (float) epoch seconds
+        :param cat: span category
+        :param args: dict shown with the span
+        :param pid: process track.  Default: this process
+        :param tid: thread track.  Default: the calling thread
+        :param track: track name.  Default: the calling thread's name
+        :return: None
+        """
+        thread = threading.current_thread()
+        pid = self.pid if pid is None else pid
+        tid = thread.ident if tid is None else tid
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'pid': pid, 'tid': tid,
+                 'ts': int(start * 1000000), 'dur': max(0, int((end - start) * 1000000))}
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+            self.tracks.setdefault((pid, tid), track if track is not None else thread.name)
+
+    @contextmanager
+    def span(self, name, cat='job', **args):
+        """
+        Time a block as a span of the calling thread.  The yielded dict can be updated with span arguments.
+        """
+        start = time()
+        try:
+            yield args
+        finally:
+            self.add(name, start, time(), cat, args)
+
+    def to_dict(self):
+        with self._lock:
+            events = list(self.events)
+            tracks = dict(self.tracks)
+        metadata = []
+        for pid in sorted(set(pid for pid, _ in tracks.keys())):
+            metadata.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                             'args': {'name': self.name if pid == self.pid else tracks.get((pid, pid), str(pid))}})
+        for (pid, tid), track in sorted(tracks.items()):
+            metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': track}})
+        return {'traceEvents': metadata + sorted(events, key=lambda event: event['ts']),
+                'displayTimeUnit': 'ms'}
+
+    def write(self, trace_file):
+        """
+        :param trace_file: (Path) JSON trace file
+        :return: (Path) trace_file
+        """
+        trace_file = Path(trace_file)
+        trace_file.parent.mkdir(parents=True, exist_ok=True)
+        _tmp = trace_file.with_name(trace_file.name + '.tmp')
+        with _tmp.open('w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(_tmp.as_posix(), trace_file.as_posix())
+        return trace_file
+
+
+def get_trace(image_path):
+    """
+    Trace of an image, created on first use.  Spans recorded before the worker exists (i.e. file transfer wait)
+    end up in the same trace.
+    :param image_path: path to memory image
+    :return: JobTrace, or None if 'trace_jobs' is off
+    """
+    if not trace_jobs:
+        return None
+    key = Path(image_path).as_posix()
+    with _lock:
+        if key not in _traces:
+            _traces[key] = JobTrace(Path(image_path).name)
+        return _traces[key]
+
+
+def pop_trace(image_path):
+    """
+    Forget the trace of an image once it is written.
+    :param image_path: path to memory image
+    :return: JobTrace or None
+    """
+    with _lock:
+        return _traces.pop(Path(image_path).as_posix(), None)
+
+
+def set_current(trace):
+    """
+    :param trace: JobTrace the calling thread records into, or None
+    :return: None
+    """
+    _local.trace = trace
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def span(name, cat='job', **args):
+    """
+    Span of the calling thread's current trace; does nothing without one.
+    """
+    trace = current()
+    if trace is None:
+        yield args
+        return
+    with trace.span(name, cat, **args) as _args:
+        yield _args
+
+
+def process_span(name, start, end, pid, args=None):
+    """
+    Span on the track of a child process (i.e. a Volatility run) in the calling thread's current trace.
+    :param name: span name
+    :param start: (float) epoch seconds
+    :param end: (float) epoch seconds
+    :param pid: child process id, None if it never started
+    :param args: dict shown with the span
+    :return: None
+    """
+    trace = current()
+    if trace is None or pid is None:
+        return
+    trace.add(name, start, end, 'process', args, pid=pid, tid=pid, track="volatility %s" % name)
@@ -1,5 +1,10 @@
+import copy
 import logging
+import multiprocessing
+import queue
+import threading
 import sys
+from logging.handlers import QueueHandler, QueueListener
 import shutil
 from datetime import datetime
 import pathlib
@@ -7,6 +12,25 @@ import subprocess
 import re
 from pathlib import Path
 import time
+import os
+import signal
+import zipfile
+from .exceptions import ChildProcessKilled
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Children run in their own session (process group) so the whole group can be killed
+_PROCESS_GROUPS = hasattr(os, 'killpg')
+# Seconds between timeout / memory pressure checks of a running child
+_SUPERVISE_INTERVAL = 1
+# Suffixes of files not worth compressing again when archiving (i.e. gzip / lzma plugin outputs)
+COMPRESSED_SUFFIXES = ('.gz', '.xz', '.bz2', '.zip', '.7z', '.png', '.jpg')
+# File systems without reliable shared memory / locking for SQLite's WAL mode
+NETWORK_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smb', 'smbfs', 'smb3', '9p', 'afs', 'ceph', 'glusterfs',
+                       'fuse.sshfs', 'fuse.glusterfs', 'fuse.cephfs')
 
 
 def set_default_logger(logger_name=None, logger_level=logging.DEBUG, propagate=False):
@@ -109,11 +133,125 @@ def add_logger_splunkhandler(logger=set_default_logger(), log_filter=None, **kwa
     return logger
 
 
+def _copy_dicts(value):
+    """
+    Copy a dict and the dicts nested in it; other values (i.e. lists of result rows) are shared.
+    """
+    if not isinstance(value, dict):
+        return value
+    value = value.copy()
+    for k, v in value.items():
+        if isinstance(v, dict):
+            value[k] = _copy_dicts(v)
+    return value
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queues log records for a QueueListener thread.  Records stay in-process, so unlike QueueHandler.prepare() the
+    message is not formatted on the calling thread; (possibly large) structured messages are only formatted by the
+    handlers that actually emit them.  Dict messages are copied, as their values (i.e. vars(plugin), runtime_stats)
+    may change before the listener formats them.
+    """
+    def prepare(self, record):
+        if isinstance(record.msg, dict):
+            record = copy.copy(record)
+            record.msg = _copy_dicts(record.msg)
+        return record
+
+
+# logger name -> QueueListener
+_queue_listeners = dict()
+_queue_listeners_lock = threading.Lock()
+
+
+def start_queue_listener(logger):
+    """
+    Move the handlers of a logger behind a queue serviced by a background thread, so log I/O (files, Splunk HEC)
+    leaves the calling thread.
+    :param logger: logging instance
+    :return: logging.Logger
+    """
+    with _queue_listeners_lock:
+        if logger.name in _queue_listeners or len(logger.handlers) == 0:
+            return logger
+        handlers = list(logger.handlers)
+        log_queue = queue.Queue(-1)
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        queue_handler = DeferredQueueHandler(log_queue)
+        queue_handler.set_name("{}_queue".format(logger.name))
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+        _queue_listeners[logger.name] = listener
+        listener.start()
+    return logger
+
+
+def stop_queue_listener(logger):
+    """
+    Flush queued records and put the handlers back on the logger.
+    :param logger: logging instance
+    :return: logging.Logger
+    """
+    with _queue_listeners_lock:
+        listener = _queue_listeners.pop(logger.name, None)
+    if listener is None:
+        return logger
+    listener.stop()
+    for handler in list(logger.handlers):
+        if isinstance(handler, DeferredQueueHandler):
+            logger.removeHandler(handler)
+            handler.close()
+    for handler in listener.handlers:
+        logger.addHandler(handler)
+    return logger
+
+
+def close_logger(logger):
+    """
+    Flush, detach and close all handlers of a logger (file descriptors, HEC sessions) and drop the logger from the
+    logging registry, i.e. once a memory image is processed.
+    :param logger: logging instance
+    :return: None
+    """
+    stop_queue_listener(logger)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        try:
+            handler.close()
+        except Exception:
+            pass
+    logging.Logger.manager.loggerDict.pop(logger.name, None)
+
+
 # https://www.oreilly.com/library/view/python-cookbook/0596001673/ch14s08.html
 def whoami():
     return sys._getframe(1).f_code.co_name
 
 
+def zip_dir(src_dir, archive_file):
+    """
+    Zip a directory, with entries relative to its parent (as shutil.make_archive).  Files already compressed (i.e.
+    gzip / lzma plugin outputs) are stored as-is rather than compressed again.
+    :param src_dir: (Path) directory to archive
+    :param archive_file: (Path) zip file to create
+    :return: (str) path to archive
+    """
+    src_dir = Path(src_dir)
+    with zipfile.ZipFile(Path(archive_file).as_posix(), 'w', compression=zipfile.ZIP_DEFLATED,
+                         allowZip64=True) as archive:
+        for root, dirs, files in os.walk(src_dir.as_posix()):
+            dirs.sort()
+            archive.write(root, Path(root).relative_to(src_dir.parent).as_posix())
+            for name in sorted(files):
+                path = Path(root, name)
+                archive.write(path.as_posix(), path.relative_to(src_dir.parent).as_posix(),
+                              compress_type=zipfile.ZIP_STORED if path.suffix.lower() in COMPRESSED_SUFFIXES
+                              else None)
+    return Path(archive_file).as_posix()
+
+
 def archive_dir(src_dir, dest_dir, logger, **kwargs):
     """
     Zip compress src_dir as archive_name to dest_dir.
@@ -121,7 +259,7 @@ def archive_dir(src_dir, dest_dir, logger, **kwargs):
     :param src_dir: Directory to archive
     :param dest_dir: Directory to store archive
     :param logger: logger instance
-    :param kwargs: other args for shutil.make_archive
+    :param kwargs: unused; kept for compatibility
     :return: (str) path to archive
     """
     s_dir = src_dir
@@ -142,7 +280,7 @@ def archive_dir(src_dir, dest_dir, logger, **kwargs):
             s_dir_ctime = datetime.strftime(datetime.utcfromtimestamp(s_dir.stat().st_ctime), "%Y-%m-%dT%H-%M")
             archive_name = pathlib.Path.joinpath(d_dir, "%s_%s" % (s_dir.stem, s_dir_ctime))
 
-            ret = shutil.make_archive(archive_name, 'zip', s_dir.parent.as_posix(), s_dir.as_posix(), logger, **kwargs)
+            ret = zip_dir(s_dir, "%s.zip" % archive_name)
         except Exception:
             raise
         else:
@@ -150,21 +288,140 @@ def archive_dir(src_dir, dest_dir, logger, **kwargs):
             return ret
 
 
+def _rlimit(resource_id, soft, hard):
+    """
+    Limits clamped to the current hard limit, which an unprivileged process cannot raise.
+    :return: (resource_id, (soft, hard))
+    """
+    _, current_hard = resource.getrlimit(resource_id)
+    if current_hard != resource.RLIM_INFINITY:
+        hard = min(hard, current_hard)
+        soft = min(soft, hard)
+    return resource_id, (soft, hard)
+
+
+def rlimits_preexec(memory_limit=None, cpu_limit=None, cpu_grace=10):
+    """
+    Resource limits set in the child between fork and exec, so the command never runs without them.  Limits are
+    computed here, in the parent; the child only calls setrlimit().  A limit that cannot be set fails the command.
+    :param memory_limit: (int) address space limit (RLIMIT_AS) in bytes
+    :param cpu_limit: (int) CPU time limit (RLIMIT_CPU) in seconds.  The child gets SIGXCPU at 'cpu_limit' and is
+    killed 'cpu_grace' seconds later.
+    :param cpu_grace: seconds between the soft and hard CPU limit
+    :return: preexec_fn for subprocess.Popen, or None without limits
+    """
+    if resource is None:
+        return None
+    limits = []
+    if memory_limit:
+        limits.append(_rlimit(resource.RLIMIT_AS, int(memory_limit), int(memory_limit)))
+    if cpu_limit:
+        limits.append(_rlimit(resource.RLIMIT_CPU, int(cpu_limit), int(cpu_limit) + cpu_grace))
+    if len(limits) == 0:
+        return None
+
+    def _preexec():
+        for resource_id, values in limits:
+            resource.setrlimit(resource_id, values)
+    return _preexec
+
+
+def process_pool_context():
+    """
+    Start method of the process pools of native plugins.  The daemon is multi-threaded: a child forked while another
+    thread holds a lock (logging, queues, imports) can deadlock, so pool processes are forked from a single-threaded
+    server process ('forkserver'), or spawned where that is not available (Windows).
+    :return: multiprocessing context, for ProcessPoolExecutor(mp_context=...)
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def kill_process_group(proc):
+    """
+    Kill a child started by run_command() and everything in its process group.
+    :param proc: subprocess.Popen
+    :return: None
+    """
+    if _PROCESS_GROUPS:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    if proc.poll() is None:
+        try:
+            proc.kill()
+        except OSError:
+            pass
+
+
 def run_command(args, **kwargs):
-    try:
-        proc = subprocess.run(args,
-                              shell=kwargs.get('shell', False),
-                              stdout=subprocess.PIPE,
-                              stderr=subprocess.PIPE,
-                              encoding=kwargs.get('encoding', 'utf-8'),
-                              errors=kwargs.get('errors', 'replace'),
-                              timeout=kwargs.get('timeout', 300),
-                              check=kwargs.get('check', True)
-                              )
-    except (subprocess.TimeoutExpired, subprocess.CalledProcessError):
-        raise
-    else:
-        return proc
+    """
+    Run a command to completion, capturing its output.  Same semantics as subprocess.run with check=True, except that
+    the child is supervised: it runs in its own process group, which is killed on timeout, on memory pressure and
+    once the child exits, so wedged children and orphaned grandchildren do not outlive it.  Output is collected while
+    the child runs and is kept when it is killed (ChildProcessKilled.output).
+    :param args: command arguments
+    :param kwargs: shell, encoding, errors, timeout, check, 'cpu_limit' (RLIMIT_CPU seconds), 'memory_limit'
+    (RLIMIT_AS bytes, default: the monitor's 'memory_limit') and 'monitor' (object with start(pid)/stop() methods
+    notified when the child process starts and exits, and optionally pressure() returning True when the child should
+    be killed to relieve memory pressure, i.e. admission.ChildMonitor)
+    :return: subprocess.CompletedProcess
+    """
+    monitor = kwargs.get('monitor', None)
+    pressure = getattr(monitor, 'pressure', None)
+    timeout = kwargs.get('timeout', 300)
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    reason = None
+    with subprocess.Popen(args,
+                          shell=kwargs.get('shell', False),
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,
+                          encoding=kwargs.get('encoding', 'utf-8'),
+                          errors=kwargs.get('errors', 'replace'),
+                          start_new_session=_PROCESS_GROUPS,
+                          preexec_fn=rlimits_preexec(kwargs.get('memory_limit',
+                                                                getattr(monitor, 'memory_limit', None)),
+                                                     kwargs.get('cpu_limit', None))
+                          ) as proc:
+        if monitor is not None:
+            monitor.start(proc.pid)
+        try:
+            while True:
+                wait = _SUPERVISE_INTERVAL if deadline is None \
+                    else max(0, min(_SUPERVISE_INTERVAL, deadline - time.monotonic()))
+                try:
+                    # Output read so far is kept between calls
+                    stdout, stderr = proc.communicate(timeout=wait)
+                    break
+                except subprocess.TimeoutExpired:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        reason = 'timeout'
+                    elif pressure is not None and pressure():
+                        reason = 'memory pressure'
+                    if reason is not None:
+                        kill_process_group(proc)
+                        stdout, stderr = proc.communicate()
+                        break
+        except BaseException:
+            kill_process_group(proc)
+            raise
+        finally:
+            if monitor is not None:
+                monitor.stop()
+            # Grandchildren left behind by the child
+            kill_process_group(proc)
+        retcode = proc.poll()
+
+    if reason is None and retcode is not None and retcode < 0:
+        # Killed by a resource limit or the OOM killer
+        reason = 'cpu limit' if -retcode == getattr(signal, 'SIGXCPU', None) else 'signal %d' % -retcode
+    if reason is not None:
+        raise ChildProcessKilled(reason=reason, output=stdout, stderr=stderr, errors=proc.args)
+    if kwargs.get('check', True) and retcode:
+        raise subprocess.CalledProcessError(retcode, proc.args, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(proc.args, retcode, stdout, stderr)
 
 
 def volatility_error(stderr):
@@ -196,3 +453,41 @@ def file_transfer_complete(file_path, timeout=600, pause=10):
                 return False
 
         return True
+
+
+def _unescape_mount(path):
+    # /proc/mounts escapes spaces, tabs, newlines and backslashes as octal
+    return re.sub(r'\\([0-7]{3})', lambda match: chr(int(match.group(1), 8)), path)
+
+
+def network_filesystem(path, mounts='/proc/mounts'):
+    """
+    Whether a path is on a network file system (NFS, SMB / CIFS, ...): the mount point containing it is looked up in
+    /proc/mounts.  On Windows, UNC paths (\\\\server\\share) are network paths.
+    :param path: (Path) file or folder, need not exist
+    :param mounts: mount table
+    :return: (bool) True on a network file system, False otherwise or if unknown
+    """
+    path = Path(path)
+    if path.drive.startswith('\\\\'):
+        return True
+    try:
+        with open(mounts, 'r', encoding='utf-8', errors='replace') as f:
+            table = [line.split() for line in f]
+    except OSError:
+        return False
+
+    resolved = Path(os.path.abspath(path.as_posix()))
+    for parent in [resolved] + list(resolved.parents):
+        if parent.exists():
+            resolved = parent.resolve()
+            break
+    best, fstype = None, None
+    for fields in table:
+        if len(fields) < 3:
+            continue
+        mount_point = Path(_unescape_mount(fields[1]))
+        if (mount_point == resolved or mount_point in resolved.parents) and \
+                (best is None or len(mount_point.parts) > len(best.parts)):
+            best, fstype = mount_point, fields[2]
+    return fstype is not None and fstype.lower() in NETWORK_FILESYSTEMS
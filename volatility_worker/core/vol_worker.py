@@ -1,19 +1,35 @@
-import sys
 import json
 import shutil
-import importlib
-from configs.base_plugins import BasePlugins  # Default plugins set
-from configs.base_plugins_configs import VolPlugin, BasePluginsConfigs  # Default plugin configs
+from ordered_set import OrderedSet
+from configs.base_plugins import get_base_plugins, split_into_tiers  # Default plugins set
+from configs.base_plugins_configs import BasePluginsConfigs  # Default plugin configs
 from configs.defaults import case_dir_filter, case_archive_dir, case_processed_flag, \
-    case_log_dir, case_output_dir, log_level, enable_splunk_integration, extracted_mem_dump_cleanup, AUTO_EXTRACT_SUFFIX
+    case_log_dir, case_output_dir, log_level, enable_splunk_integration, extracted_mem_dump_cleanup, AUTO_EXTRACT_SUFFIX, \
+    dedup_store_dir, dedup_plugins, dedup_workers, async_logging, results_db, results_db_pivots, parse_text_tables, \
+    diff_reports, diff_to_splunk, diff_plugins, plugin_workers, pool_prescan, pool_prescan_workers, \
+    pool_prescan_chunk_size, pool_prescan_min_hits, pool_scan_rate, pool_scan_hit_seconds, multiscan_pool_scanners, \
+    output_staging, output_publish
 from .memory import MemoryDump
 from .exceptions import *
 from .memory_utils import execute_volatility_command
+from .native_plugins import execute_native_plugin
+from .dedup import DedupStore
+from .results_db import ResultsDB
+from .text_tables import parse_table_output
+from .compressed_output import COMPRESSION_SUFFIXES, compressed_path, resolve_output, open_output
+from .image_diff import previous_image, write_diff_report
+from .overrides import load_case_override, case_override_path
+from .admission import get_admission_controller
+from .pool_prescan import POOL_TAGS, get_pool_index, estimate_runtime
+from .multiscan import multiscan_groups
+from .output_staging import local_output_dir, local_log_file, publish_dir, publish_log
+from .tracing import get_trace, pop_trace, set_current, span
 from .utils import whoami, set_default_logger, add_logger_filehandler, \
-        add_logger_streamhandler, archive_dir, volatility_error
+        add_logger_streamhandler, archive_dir, volatility_error, start_queue_listener, close_logger
 from pathlib import Path
 from logging import Filter
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from time import time
 
 if enable_splunk_integration:
@@ -27,23 +43,88 @@ class ResultsExcludeFilter(Filter):
     Logging filter to filter out results sent to Splunk.
     """
     def filter(self, record):
-        if enable_splunk_integration:
-            return not record.getMessage().count(splunk_results_index) >= 1
+        if enable_splunk_integration and isinstance(record.msg, dict):
+            # Check the event fields instead of formatting the (possibly huge) results into a string
+            return record.msg.get('fields', {}).get('index', None) != splunk_results_index
         else:
             return True
 
 
+def get_case_id(dump_path):
+    """
+    Each memory dump must be associated with a case ID/Security Incident Request (SIR).
+    From the memory dump path, the top most folder matching the case_dir_filter is used as the case_id folder.
+    case_id folder is where the logs, archives, outputs folders will be created.
+    :param dump_path: (Path) path to memory dump
+    :return: (str) case_id, (str) path to top most case ID folder
+    """
+    dump_path = Path(dump_path)
+    _case_id = None
+    _parent_parts = dump_path.parent.parts
+    for part in _parent_parts:
+        if case_dir_filter.search(part):
+            _case_id = part
+            break
+
+    if _case_id is None:
+        _case_id = ""
+        _case_dir = Path.joinpath(dump_path.parent, _case_id)
+    else:
+        _path = dump_path.as_posix()
+        _case_dir = _path[0:_path.find(_case_id) + len(_case_id)]
+
+    return _case_id.upper(), Path(_case_dir)
+
+
 class VolWorker:
-    def __init__(self, mem_image_path):
+    def __init__(self, mem_image_path, plugin_workers=plugin_workers, plugins=None):
+        """
+        :param mem_image_path: path to memory image
+        :param plugin_workers: plugins of a tier run concurrently.  Default: 'plugin_workers' in 'defaults.py'
+        :param plugins: plugin names to run (i.e. submitted through the HTTP API), replacing the default or case
+        override active plugins.  Default: None
+        """
         s_time = int(time())
         self.dump_path = Path(mem_image_path)
+        self.plugin_workers = plugin_workers
+        self.requested_plugins = plugins
+        # plugin name -> 'pending', 'running', 'done', 'empty' (no output), 'failed' or 'killed'
+        self.plugin_status = dict()
+        # Set once the pool tag prescan ran, see prescan_before_tier()
+        self.pool_prescanned = False
         self.image_name = self.dump_path.stem
         self.case_id, self.case_dir = self.get_case_id()
 
         self.logger = None
         self.logging_args = None
+        self.log_file = Path.joinpath(self.case_dir, case_log_dir, "%s-%s.log" % (self.case_id, self.dump_path.stem))
+        self.trace_file = Path.joinpath(self.case_dir, case_log_dir,
+                                        "%s-%s.trace.json" % (self.case_id, self.dump_path.stem))
         self.set_loggers()
+        self.trace = get_trace(self.dump_path)
+        set_current(self.trace)
+        try:
+            with span('initialise', 'worker'):
+                self._load(s_time)
+        except PreviouslyProcessed:
+            # Keep the trace of the run that processed it
+            pop_trace(self.dump_path)
+            self.close_loggers()
+            raise
+        except Exception:
+            # Unusable worker; release its log handlers and image cache pins
+            if hasattr(self, 'memory_dump'):
+                self.memory_dump.release()
+            self.write_trace()
+            self.close_loggers()
+            raise
 
+    def _load(self, s_time):
+        """
+        Check the case folder, load the memory image, identify its profile and establish the plugins to run.
+        :param s_time: worker start time
+        :return: None
+        """
         # Case ID's are key to Splunk logging and results correlation.
         # Refuse to process if Case ID folder structure is absent.
         if self.case_id == "":
@@ -58,13 +139,15 @@ class VolWorker:
 
         # Check to see if the memory dump is supported by Volatility.
         try:
-            self.memory_dump = MemoryDump(self.dump_path.as_posix(), self.logger)
+            with span('load image', 'io'):
+                self.memory_dump = MemoryDump(self.dump_path.as_posix(), self.logger)
         except Exception as _err:
             self.logger.error({'_action': whoami(), 'message': "Unable to load image. Skipping."})
             raise MemoryImageLoadFailure(errors=_err)
 
         try:
-            self.memory_dump.identify_profile()
+            with span('identify profile', 'worker'):
+                self.memory_dump.identify_profile()
         except Exception as err:
             self.del_auto_extracted_image()
             self.logger.error({'_action': whoami(),
@@ -78,7 +161,12 @@ class VolWorker:
                 self.logger.error({'_action': whoami(), 'message': "Unable to determine profile. Terminating."})
                 raise MemoryImageProfileFailure
 
-        self.plugins_output_dir = Path.joinpath(self.case_dir, case_output_dir, self.image_name)
+        # Plugins write to 'plugins_output_dir', local scratch with 'output_staging'; outputs are published to
+        # 'published_output_dir' in the case folder
+        self.published_output_dir = Path.joinpath(self.case_dir, case_output_dir, self.image_name)
+        self.plugins_output_dir = local_output_dir(self.case_id, self.image_name) if output_staging \
+            else self.published_output_dir
+        self.published = set()
         self.archive_dir = Path.joinpath(self.case_dir, case_archive_dir)
         self.create_output_dir()
 
@@ -91,46 +179,200 @@ class VolWorker:
         else:
             # collect stats on plugin execution
             self.runtime_stats = Counter({k: 0 for k in self.plugins.keys()})
+            self.plugin_status = {k: 'pending' for k in self.plugins.keys()}
             self.runtime_stats['initialization'] = int(time()) - s_time
 
     def del_auto_extracted_image(self):
+        # Staged copies are kept for re-processing; the staging area enforces its own disk budget.
+        self.memory_dump.release_staged_image()
+        # Cached *.vol files are kept for re-processing; the cache enforces its own disk budget.
+        if self.memory_dump.cache_key is not None:
+            self.memory_dump.release_cached_image()
+            return
+
         # Clean-up *.vol file
         if extracted_mem_dump_cleanup \
-                and self.memory_dump.memory_path.suffix.lower() == "." + AUTO_EXTRACT_SUFFIX.lower():
+                and self.memory_dump.image_path.suffix.lower() == "." + AUTO_EXTRACT_SUFFIX.lower():
             self.logger.info({'_action': whoami(),
-                              'message': "Deleting %s" % self.memory_dump.memory_path.name,
+                              'message': "Deleting %s" % self.memory_dump.image_path.name,
                               'details': {'path': self.case_dir.as_posix()}
                               })
-            self.memory_dump.memory_path.unlink()
+            self.memory_dump.image_path.unlink()
 
     def run(self):
+        """
+        Run all plugin tiers back to back and finish the image.
+        :return: None
+        """
         self.logger.info({'_action': whoami(),
                           'message': "Processing %s." % self.dump_path.name,
                           'details': {'path': self.dump_path.as_posix(),
                                       'profile': self.memory_dump.profile,
                                       'plugins': list(self.plugins.keys())}
                           })
-        self.run_plugins()
+        for tier in range(len(self.plugin_tiers)):
+            self.run_tier(tier)
+        self.finish()
+
+    def run_tier(self, tier):
+        """
+        Run the plugins of a single tier.  The scheduler uses this to run a tier across all queued images before
+        moving on to the next tier.
+        :param tier: (int) index into plugin_tiers
+        :return: None
+        """
+        tier_name, tier_plugins = self.plugin_tiers[tier]
+        if len(tier_plugins) == 0:
+            return
+
+        self.logger.info({'_action': whoami(),
+                          'message': "Processing %s tier '%s'." % (self.dump_path.name, tier_name),
+                          'details': {'path': self.dump_path.as_posix(),
+                                      'profile': self.memory_dump.profile,
+                                      'tier': tier_name,
+                                      'plugins': tier_plugins}
+                          })
+        # Tiers run on scheduler threads
+        set_current(self.trace)
+        with span("tier '%s'" % tier_name, 'tier', plugins=list(tier_plugins)):
+            self.prescan_before_tier(tier)
+            self.run_plugins(tier_plugins)
+
+    def prescan_before_tier(self, tier):
+        """
+        Pool tag prescan, once, just before the first tier running a pool scanner.  The triage tier does not wait for
+        a pass over the whole image: its pool scanners (i.e. 'netscan') run regardless.  Pool scanners with nothing to
+        find are dropped from this and later tiers.
+        :param tier: (int) index into plugin_tiers
+        :return: None
+        """
+        if not pool_prescan or self.pool_prescanned or (tier == 0 and len(self.plugin_tiers) > 1):
+            return
+        if not any(name in POOL_TAGS for name in self.plugin_tiers[tier][1]):
+            return
+        self.pool_prescanned = True
+
+        skipped = self.prescan_pool_tags({name: self.plugins[name] for _, names in self.plugin_tiers[tier:]
+                                          for name in names})
+        if len(skipped) == 0:
+            return
+        for name in skipped:
+            del self.plugins[name]
+            self.plugin_status.pop(name, None)
+            self.runtime_stats.pop(name, None)
+            # Output of a previous run
+            shutil.rmtree(Path.joinpath(self.plugins_output_dir, name).as_posix(), ignore_errors=True)
+        for _, names in self.plugin_tiers[tier:]:
+            names[:] = [name for name in names if name not in skipped]
+        if multiscan_pool_scanners:
+            self.multiscan_groups = multiscan_groups(self.plugin_tiers, self.plugins)
+
+    def finish(self):
+        """
+        Mark the image as processed once all tiers have run.
+        :return: None
+        """
+        set_current(self.trace)
+        # Outputs are in the case folder before the image is flagged as processed
+        self.publish_outputs()
 
         # Drop processing completed flag
         Path.joinpath(self.case_dir, "{}{}".format(self.image_name, case_processed_flag)).touch()
 
-        # housecleaning
-        self.del_auto_extracted_image()
+        with span('finish', 'worker'):
+            # housecleaning
+            self.del_auto_extracted_image()
+
+            if diff_reports:
+                self.diff_reports()
 
         self.logger.info({'_action': whoami(),
                           'message': "Runtime stats",
                           'details': self.runtime_stats})
+        self.write_trace()
+        self.close_loggers()
+
+    def diff_reports(self):
+        """
+        Diff structured results of 'diff_plugins' against the previously processed image of the case.
+        :return: None
+        """
+        case_output = self.published_output_dir.parent
+        for plugin_name, options in diff_plugins.items():
+            if plugin_name not in self.plugins:
+                continue
+            base_image = previous_image(case_output, self.image_name, plugin_name)
+            if base_image is None:
+                continue
+            try:
+                report_file = write_diff_report(case_output, base_image, self.image_name, plugin_name,
+                                                options.get('key', ()), options.get('ignore', ()), self.logger)
+            except Exception as _err:
+                self.logger.error({'_action': whoami(),
+                                   'message': "Failed to diff plugin '%s' results." % plugin_name,
+                                   'details': {'base': base_image, 'target': self.image_name},
+                                   'errors': [str(_err)]
+                                   })
+                continue
+
+            if report_file is not None and enable_splunk_integration and diff_to_splunk:
+                with report_file.open('r') as f:
+                    report = json.load(f)
+                self.logger.info({'_action': whoami(),
+                                  'fields': {'source': "%s:%s:diff" % (self.logging_args['source'], plugin_name),
+                                             'index': splunk_results_index,
+                                             'sourcetype': splunk_results_sourcetype},
+                                  'results': report,
+                                  'details': {'report_file': report_file.as_posix(),
+                                              'counts': report['counts']}
+                                  })
+
+    def write_trace(self):
+        """
+        Write the image's trace to <case>/logs/<CASE_ID>-<image>.trace.json (see tracing.py) and forget it.
+        :return: None
+        """
+        trace = pop_trace(self.dump_path)
+        if trace is None:
+            return
+        trace_file = self.trace_file
+        try:
+            trace.write(trace_file)
+        except OSError as _err:
+            self.logger.warning({'_action': whoami(),
+                                 'message': "Failed to write trace.",
+                                 'details': {'path': trace_file.as_posix()},
+                                 'errors': [str(_err)]})
+        else:
+            self.logger.info({'_action': whoami(),
+                              'message': "Trace written.",
+                              'details': {'path': trace_file.as_posix(), 'spans': len(trace.events)}})
+
+    def close_loggers(self):
+        """
+        Flush and close the image's log handlers.  The daemon processes images for weeks; handlers left open leak
+        file descriptors, HEC sessions and logger objects.
+        :return: None
+        """
+        if self.logger is not None:
+            close_logger(self.logger)
+        if output_staging:
+            try:
+                publish_log(local_log_file(self.case_id, self.log_file.name), self.log_file)
+            except OSError:
+                # Left in the staging folder; the next run of the image appends it
+                pass
 
     def create_output_dir(self):
-        if self.plugins_output_dir.exists():
+        if self.published_output_dir.exists():
             try:
                 # Archive results from previous runs
-                archive_loc = archive_dir(self.plugins_output_dir, self.archive_dir, self.logger)
+                with span('archive', 'io'):
+                    archive_loc = archive_dir(self.published_output_dir, self.archive_dir, self.logger)
             except Exception as _err:
                 self.logger.warning({'_action': whoami(),
                                      'message': "Failed to archive older plugins output",
-                                     'details': {'src_dir': self.plugins_output_dir.as_posix(),
+                                     'details': {'src_dir': self.published_output_dir.as_posix(),
                                                  'dest_dir': self.archive_dir.as_posix()},
                                      'errors': [str(_err)]
                                      })
@@ -139,8 +381,10 @@ class VolWorker:
                                   'message': "Successfully archived plugins output folder.",
                                   'details': {'archive_file': archive_loc}
                                   })
-        else:
-            self.plugins_output_dir.mkdir(parents=True)
+        if output_staging and self.plugins_output_dir.exists():
+            # Left over by an interrupted run
+            shutil.rmtree(self.plugins_output_dir.as_posix())
+        self.plugins_output_dir.mkdir(parents=True, exist_ok=True)
 
     def set_loggers(self):
         """
@@ -156,16 +400,21 @@ class VolWorker:
         _format = "%(asctime)s  %(levelname)s  %(module)s  %(message)s"
 
         _handlers = [handler.get_name() for handler in self.logger.handlers]
+        if "{}_queue".format(self.image_name) in _handlers:
+            # Handlers already set up (behind the log queue)
+            return
 
         if (log_level.upper() == "DEBUG") and ("{}_stream".format(self.image_name) not in _handlers):
             add_logger_streamhandler(self.logger, logger_level=log_level, log_format=_format,
                                      log_filter=ResultsExcludeFilter())
 
         if "{}_file".format(self.image_name) not in _handlers:
-            log_file = Path.joinpath(self.case_dir, case_log_dir,
-                                     "%s-%s.log" % (self.case_id, self.dump_path.stem))
+            log_file = self.log_file
+            if output_staging:
+                # Appended to the case log in close_loggers()
+                log_file = local_log_file(self.case_id, log_file.name)
             if log_file.parent.exists() is False:
-                log_file.parent.mkdir()
+                log_file.parent.mkdir(parents=True)
 
             add_logger_filehandler(self.logger, logger_level=log_level,
                                    filename=log_file.as_posix(), log_format=_format, log_filter=ResultsExcludeFilter())
@@ -178,76 +427,78 @@ class VolWorker:
             except Exception as _err:
                 self.logger.warning("Failed to add Splunk log handler. %s" % _err)
 
+        if async_logging:
+            start_queue_listener(self.logger)
+
         return
 
     def get_case_id(self):
         """
         Each memory dump must be associated with a case ID/Security Incident Request (SIR).
-        From the memory dump path, the top most folder matching the case_dir_filter is used as the case_id folder.
-        case_id folder is where the logs, archives, outputs folders will be created.
+        See get_case_id() below.
         :return: (str) case_id, (str) path to top most case ID folder
         """
-        _case_id = None
-        _parent_parts = self.dump_path.parent.parts
-        for part in _parent_parts:
-            if case_dir_filter.search(part):
-                _case_id = part
-                break
-
-        if _case_id is None:
-            _case_id = ""
-            _case_dir = Path.joinpath(self.dump_path.parent, _case_id)
-        else:
-            _path = self.dump_path.as_posix()
-            _case_dir = _path[0:_path.find(_case_id) + len(_case_id)]
-
-        return _case_id.upper(), Path(_case_dir)
+        return get_case_id(self.dump_path)
 
     def get_plugins(self):
         """
-        Establish active plugins and merge default and override plugins configs
-        :return: None
+        Establish active plugins and merge default and override plugins configs.  Also splits the active plugins into
+        'plugin_tiers'.
+        :return: OrderedDict of plugin name: VolPlugin
         """
-        # override config must be named as upper-case CASE_ID.py
-        _plugins = dict({})
-        _plugins_set = BasePlugins().active_plugins
+        _base_plugins = get_base_plugins()
+        # BasePlugins is shared; copy before modifying
+        _plugins_set = OrderedSet(_base_plugins.active_plugins)
+        _plugin_tiers = _base_plugins.plugin_tiers
+        _plugins_configs = dict()
 
-        case_override_config = Path.joinpath(self.case_dir, "%s.py" % self.case_id)
-        if case_override_config.exists():
-            sys.path.append(self.case_dir.as_posix())
-            try:
-                _override_config = importlib.import_module('{}'.format(self.case_id))
-            except Exception as _err:
-                sys.path.remove(self.case_dir.as_posix())
-                self.logger.error({'_action': whoami(), 'message': "Override configuration import failed."})
-                raise OverrideConfigFailure(errors=_err)
-            else:
-                self.logger.debug({'_action': whoami(),
-                                  'message': "Override configuration import successful.",
-                                   'details': {'config': case_override_config.as_posix()}})
-
-                # Only run plugins specified in override file
-                if hasattr(_override_config, "active_plugins"):
-                    _plugins_set = _override_config.active_plugins
-
-                # Run default plugins + additional plugins
-                if hasattr(_override_config, "additional_plugins"):
-                    _plugins_set.update(_override_config.additional_plugins)
-
-                # Remove any excluded plugins
-                if hasattr(_override_config, "exclude_plugins"):
-                    _plugins_set.difference_update(_override_config.exclude_plugins)
-
-                # Get default configs for active plugins
-                _plugins = BasePluginsConfigs(self).get_active_plugins_configs(_plugins_set)
-
-                # Override default configs
-                if case_override_config.exists() and hasattr(_override_config, "plugins_configs"):
-                    for _plugin in _plugins_set:
-                        if _plugin in _override_config.plugins_configs.keys():
-                            _plugins[_plugin] = VolPlugin(_plugin, **_override_config.plugins_configs[_plugin])
-        else:
-            _plugins = BasePluginsConfigs(self).get_active_plugins_configs(_plugins_set)
+        try:
+            _override_config = load_case_override(self.case_dir, self.case_id)
+        except Exception as _err:
+            self.logger.error({'_action': whoami(), 'message': "Override configuration import failed.",
+                               'errors': [str(_err)]})
+            raise OverrideConfigFailure(errors=_err)
+
+        if _override_config is not None:
+            self.logger.debug({'_action': whoami(),
+                               'message': "Override configuration import successful.",
+                               'details': {'config': case_override_path(self.case_dir, self.case_id).as_posix()}})
+
+            # Only run plugins specified in override file
+            if hasattr(_override_config, "active_plugins"):
+                _plugins_set = OrderedSet(_override_config.active_plugins)
+
+            # Run default plugins + additional plugins
+            if hasattr(_override_config, "additional_plugins"):
+                _plugins_set.update(_override_config.additional_plugins)
+
+            # Remove any excluded plugins
+            if hasattr(_override_config, "exclude_plugins"):
+                _plugins_set.difference_update(_override_config.exclude_plugins)
+
+            # Custom plugin tiers
+            if hasattr(_override_config, "plugin_tiers"):
+                _plugin_tiers = _override_config.plugin_tiers
+
+            if hasattr(_override_config, "plugins_configs"):
+                _plugins_configs = _override_config.plugins_configs
+
+        # Plugin set requested with the job
+        if self.requested_plugins is not None:
+            _plugins_set = OrderedSet(self.requested_plugins)
+
+        # Get default configs for active plugins
+        _configs = BasePluginsConfigs(self)
+        _plugins = _configs.get_active_plugins_configs(_plugins_set)
+
+        # Override default configs
+        for _plugin in _plugins_set:
+            if _plugin in _plugins_configs.keys():
+                _plugins[_plugin] = _configs.plugin_config(_plugin, _plugins_configs[_plugin])
+
+        self.plugin_tiers = split_into_tiers(_plugins.keys(), _plugin_tiers)
+        # Pool scanners of a tier share a single pass over the image
+        self.multiscan_groups = multiscan_groups(self.plugin_tiers, _plugins) if multiscan_pool_scanners else dict()
 
         # Plugins output folder clean-up.
         for _dir in self.plugins_output_dir.iterdir():
@@ -256,72 +507,259 @@ class VolWorker:
 
         return _plugins
 
-    def run_plugins(self):
+    def prescan_pool_tags(self, plugins):
+        """
+        Count the pool tags of the pool scanners in one pass over the image (see pool_prescan.py).  Scanners without a
+        tag hit are to be skipped; the runtime of the others is estimated from their hits.
+        :param plugins: dict of plugin name: VolPlugin
+        :return: list of skipped plugin names
+        """
+        try:
+            with span('pool prescan', 'io'):
+                index = get_pool_index(self.memory_dump.memory_path, workers=pool_prescan_workers,
+                                       chunk_size=pool_prescan_chunk_size, logger=self.logger)
+        except Exception as _err:
+            self.logger.warning({'_action': whoami(),
+                                 'message': "Pool tag prescan failed.  Running all pool scanners.",
+                                 'details': {'path': self.memory_dump.memory_path.as_posix()},
+                                 'errors': [str(_err)]})
+            return []
+
+        # Too few hits overall: pool memory is probably not visible in this image format
+        reliable = index.total >= pool_prescan_min_hits
+        skipped = []
+        for name in list(plugins.keys()):
+            hits = index.hits(name)
+            if hits is None or plugins[name].native is not None:
+                continue
+            if hits == 0 and reliable:
+                skipped.append(name)
+            else:
+                plugins[name].estimated_runtime = estimate_runtime(index, name, pool_scan_rate, pool_scan_hit_seconds)
+
+        self.logger.info({'_action': whoami(),
+                          'message': "Skipping pool scanners without pool tag hits: %s." % ", ".join(skipped)
+                                     if len(skipped) > 0 else "No pool scanners skipped.",
+                          'details': {'path': self.memory_dump.memory_path.as_posix(),
+                                      'hits': {name: index.hits(name) for name in POOL_TAGS.keys()},
+                                      'total_hits': index.total,
+                                      'reliable': reliable,
+                                      'estimated_runtime': {name: int(plugin.estimated_runtime)
+                                                            for name, plugin in plugins.items()
+                                                            if plugin.estimated_runtime is not None}}
+                          })
+        return skipped
+
+    def run_plugins(self, plugins=None):
         """
         This is the meat of the automation.  This function iterates over ACTIVE_PLUGINS and runs each using the
-        associated configuration option (PLUGINS_CONFIG).
+        associated configuration option (PLUGINS_CONFIG).  Up to 'plugin_workers' plugins run concurrently.
+        :param plugins: plugin names to run.  Default: all active plugins
         :return: None
         """
-
-        for plugin in self.plugins.values():
+        _plugins = [self.plugins[name] for name in (plugins if plugins is not None else self.plugins.keys())]
+        if self.plugin_workers <= 1 or len(_plugins) <= 1:
+            for plugin in _plugins:
+                self.run_plugin(plugin)
+            return
+
+        # Longest (estimated) first, so a long scanner does not start last and hold up the tier
+        _plugins.sort(key=lambda _plugin: -(_plugin.estimated_runtime or 0))
+        # Volatility processes started by pool threads are monitored as part of this job
+        admission = get_admission_controller()
+        job_key = admission.current_job()
+
+        def _run(plugin):
+            admission.track(job_key)
+            set_current(self.trace)
+            self.run_plugin(plugin)
+
+        with ThreadPoolExecutor(max_workers=self.plugin_workers,
+                                thread_name_prefix="plugins-%s" % self.image_name) as pool:
+            list(pool.map(_run, _plugins))
+
+    def run_plugin(self, plugin):
+        """
+        Run a single plugin and store its results.
+        :param plugin: VolPlugin
+        :return: None
+        """
+        with span(plugin.name, 'plugin'):
             s_time = int(time())
+            self.plugin_status[plugin.name] = 'running'
             try:
                 self.logger.info({'_action': whoami(),
                                   'message': "Executing plugin '%s'." % plugin.name,
                                   'details': vars(plugin)
                                   })
-                plugin_output = execute_volatility_command(self.memory_dump,
-                                                           plugin.name,
-                                                           self.logger,
-                                                           **vars(plugin))
+                # Plugin output folders are only created for plugins that run
+                Path.joinpath(self.plugins_output_dir, plugin.name).mkdir(parents=True, exist_ok=True)
+                if plugin.native is not None:
+                    plugin_output = execute_native_plugin(self, plugin)
+                elif plugin.name in self.multiscan_groups:
+                    plugin_output = self.multiscan_groups[plugin.name].output(self, plugin)
+                else:
+                    plugin_output = execute_volatility_command(self.memory_dump,
+                                                               plugin.name,
+                                                               self.logger,
+                                                               **vars(plugin))
+            except ChildProcessKilled as _err:
+                self.plugin_status[plugin.name] = 'killed'
+                self.logger.error({'_action': whoami(),
+                                   'message': "Plugin '%s' was killed (%s)." % (plugin.name, _err.reason),
+                                   'details': vars(plugin),
+                                   'errors': [str(_err)]
+                                   })
+                if _err.output:
+                    self.store_partial_result(plugin, _err)
             except Exception as _err:
+                self.plugin_status[plugin.name] = 'failed'
                 self.logger.error({'_action': whoami(),
                                    'message': "Failed to run plugin '%s'" % plugin.name,
                                    'details': vars(plugin),
-                                   'errors': [volatility_error(_err.stderr)]
+                                   'errors': [volatility_error(_err.stderr) if getattr(_err, 'stderr', None)
+                                              else str(_err)]
                                    })
             else:
                 if len(plugin_output) > 0:
                     try:
-                        self.store_result(plugin, plugin_output)
+                        with span('store result', 'worker'):
+                            self.store_result(plugin, plugin_output)
+                        self.plugin_status[plugin.name] = 'done'
                     except Exception as _err:
+                        self.plugin_status[plugin.name] = 'failed'
                         self.logger.error({'_action': whoami(),
                                            'message': "Failed to commit results for plugin '%s'" % plugin.name,
                                            'details': {'length': len(plugin_output)}.update(vars(plugin)),
                                            'errors': [str(_err)]
                                            })
                 else:
+                    self.plugin_status[plugin.name] = 'empty'
                     self.logger.warning({'_action': whoami(),
                                          'message': "Plugin '%s' ran successfully but produced no output; maybe normal."
                                                     % plugin.name,
                                          'details': vars(plugin)
                                          })
+                # Staged outputs are deduplicated once published (the store must be on the case file system)
+                if dedup_store_dir is not None and plugin.name in dedup_plugins and not output_staging:
+                    self.dedup_artifacts(plugin)
             finally:
+                if output_staging and output_publish == 'plugin':
+                    self.publish_output(plugin)
                 self.runtime_stats[plugin.name] = int(time()) - s_time
 
+    def publish_output(self, plugin):
+        """
+        Publish a plugin's local output folder to the case folder (see output_staging.py).  With 'output_publish'
+        set to 'plugin', the local copy is kept for dependent plugins (i.e. 'mactime') until the image is done.
+        :param plugin: VolPlugin
+        :return: None
+        """
+        local_dir = Path.joinpath(self.plugins_output_dir, plugin.name)
+        if not local_dir.is_dir():
+            return
+        try:
+            with span('publish', 'io'):
+                published_dir = publish_dir(local_dir, Path.joinpath(self.published_output_dir, plugin.name),
+                                            keep=output_publish == 'plugin')
+        except Exception as _err:
+            self.logger.error({'_action': whoami(),
+                               'message': "Failed to publish plugin '%s' output." % plugin.name,
+                               'details': {'src_dir': local_dir.as_posix(),
+                                           'dest_dir': self.published_output_dir.as_posix()},
+                               'errors': [str(_err)]
+                               })
+            return
+        self.published.add(plugin.name)
+        self.logger.debug({'_action': whoami(),
+                           'message': "Published plugin '%s' output." % plugin.name,
+                           'details': {'path': published_dir.as_posix()}})
+        if dedup_store_dir is not None and plugin.name in dedup_plugins:
+            self.dedup_artifacts(plugin)
+
+    def published_path(self, path):
+        """
+        :param path: (Path) file under plugins_output_dir
+        :return: (Path) the file in the case folder, once published
+        """
+        return Path.joinpath(self.published_output_dir, Path(path).relative_to(self.plugins_output_dir))
+
+    def publish_outputs(self):
+        """
+        Publish the plugin outputs not published yet and remove the image's local output folder.
+        :return: None
+        """
+        if not output_staging or not hasattr(self, 'plugins'):
+            return
+        for name, plugin in self.plugins.items():
+            if name not in self.published:
+                self.publish_output(plugin)
+        shutil.rmtree(self.plugins_output_dir.as_posix(), ignore_errors=True)
+
+    def dedup_artifacts(self, plugin):
+        """
+        Move artifacts dumped by a plugin into the content-addressed dedup store, hardlinking the originals.
+        :param plugin: VolPlugin
+        :return: None
+        """
+        plugin_dir = Path.joinpath(self.published_output_dir, plugin.name)
+        if not plugin_dir.is_dir():
+            return
+        try:
+            DedupStore(dedup_store_dir, workers=dedup_workers, logger=self.logger).ingest_dir(
+                plugin_dir, plugin.name,
+                exclude=[name + suffix
+                         for name in ("%s.txt" % plugin.name, "%s.json" % plugin.name, "%s.partial.txt" % plugin.name,
+                                      'summary.txt')
+                         for suffix in [''] + list(COMPRESSION_SUFFIXES.values())])
+        except Exception as _err:
+            self.logger.error({'_action': whoami(),
+                               'message': "Failed to deduplicate artifacts for plugin '%s'" % plugin.name,
+                               'details': {'path': plugin_dir.as_posix()},
+                               'errors': [str(_err)]
+                               })
+
     def store_result(self, plugin, plugin_output):
         """
         This function is responsible for writing the Volatility output to disk and Splunk.
         if splunk_output is set to "Auto" (default), then events are only committed to Splunk if the output
         is less than splunk_output_max limit.
         :param plugin: (str) plugin name
-        :param plugin_output: (str) Volatility output
+        :param plugin_output: (str) Volatility output, or list of row dicts for JSON output plugins
         :return:
         """
         results = plugin_output
-        try:
-            results = json.loads(plugin_output)
-        except (TypeError, json.JSONDecodeError):
-            file_ext = 'txt'
-        else:
+        # Compared with 'splunk_output_max': the text length for text output, even when parsed into rows
+        output_length = None
+        if isinstance(plugin_output, list):
             file_ext = 'json'
+        else:
+            try:
+                results = json.loads(plugin_output)
+            except (TypeError, json.JSONDecodeError):
+                file_ext = 'txt'
+                rows = parse_table_output(plugin_output) if parse_text_tables else None
+                if rows is not None:
+                    # Keep the text as Volatility printed it; structured rows take the JSON output path
+                    self._save_to_disk(plugin, plugin_output, Path.joinpath(self.plugins_output_dir, plugin.name,
+                                                                            "%s.txt" % plugin.name))
+                    results = rows
+                    output_length = len(plugin_output)
+                    file_ext = 'json'
+            else:
+                file_ext = 'json'
 
-        plugin_output_file = Path.joinpath(self.plugins_output_dir, plugin.name, "%s.%s" % (plugin.name, file_ext))
+        with span('save', 'io'):
+            plugin_output_file = self._save_to_disk(
+                plugin, results, Path.joinpath(self.plugins_output_dir, plugin.name, "%s.%s" % (plugin.name, file_ext)))
 
-        self._save_to_disk(plugin, results, plugin_output_file)
+        if results_db and isinstance(results, list):
+            with span('results database', 'io'):
+                self._save_to_results_db(plugin, results)
 
         if enable_splunk_integration:
-            self._send_to_splunk(plugin, results, plugin_output_file)
+            with span('splunk', 'io'):
+                self._send_to_splunk(plugin, results, plugin_output_file, output_length)
 
         self.logger.info({'_action': whoami(),
                           'message': "Plugin '%s' results processing successful." % plugin.name,
@@ -329,30 +767,95 @@ class VolWorker:
                                       'length': len(results)}
                           })
 
+    def store_partial_result(self, plugin, killed):
+        """
+        Keep the output a plugin printed before it was killed (timeout, memory pressure, CPU limit), as
+        <plugin>.partial.txt starting with a marker line.  Partial output is not sent to Splunk or the results database.
+        :param plugin: VolPlugin
+        :param killed: ChildProcessKilled
+        :return: None
+        """
+        partial_file = compressed_path(Path.joinpath(self.plugins_output_dir, plugin.name,
+                                                     "%s.partial.txt" % plugin.name), plugin.compression)
+        try:
+            with open_output(partial_file, plugin.compression) as f:
+                f.write("# PARTIAL OUTPUT: plugin '%s' was killed (%s); results are incomplete.\n"
+                        % (plugin.name, killed.reason))
+                f.write(killed.output)
+        except OSError as _err:
+            self.logger.error({'_action': whoami(),
+                               'message': "Failed to save partial output of plugin '%s'" % plugin.name,
+                               'errors': [str(_err)]
+                               })
+            return
+        self.logger.warning({'_action': whoami(),
+                             'message': "Saved partial output of plugin '%s'." % plugin.name,
+                             'details': {'results_file': partial_file.as_posix(), 'length': len(killed.output),
+                                         'reason': killed.reason, 'partial': True}
+                             })
+
     def _save_to_disk(self, plugin, results, plugin_output_file):
-        if not plugin_output_file.exists():
-            Path(plugin_output_file.parent).mkdir(parents=True, exist_ok=True)
-            results_file = open(plugin_output_file.as_posix(), 'w')
-            results_file.writelines(results)
-            results_file.close()
+        """
+        Stream results to disk through the plugin's output compression.
+        :param plugin: VolPlugin
+        :param results: (str) text output or JSON serialisable results
+        :param plugin_output_file: (Path) plain output file name, i.e. <plugin>.txt; the compression suffix is added
+        :return: (Path) file written, or the existing output file
+        """
+        existing_file = resolve_output(plugin_output_file)
+        if existing_file is None:
+            output_file = compressed_path(plugin_output_file, plugin.compression)
+            Path(output_file.parent).mkdir(parents=True, exist_ok=True)
+            with open_output(output_file, plugin.compression) as results_file:
+                if isinstance(results, str):
+                    results_file.write(results)
+                else:
+                    json.dump(results, results_file)
+            return output_file
         else:
             # Some plugins (shellbags, mftparser, timeliner) can specify output file as part of the config.
             # We don't want to clobber that output.
             self.logger.warning({'_action': whoami(),
                                  'message': "Plugin output file (%s) exists.  Refusing to overwrite."
-                                            % plugin_output_file.name,
+                                            % existing_file.name,
                                  'details': vars(plugin)
                                  })
+            return existing_file
+
+    def _save_to_results_db(self, plugin, results):
+        """
+        Bulk-load structured results into the case database for cross-image queries.
+        :param plugin: VolPlugin
+        :param results: list of row dicts
+        :return: None
+        """
+        db_path = Path.joinpath(self.case_dir, case_output_dir, "%s.sqlite" % self.case_id)
+        try:
+            ResultsDB(db_path, pivot_columns=results_db_pivots, logger=self.logger).insert_rows(
+                self.image_name, plugin.name, results)
+        except Exception as _err:
+            self.logger.error({'_action': whoami(),
+                               'message': "Failed to store '%s' results in case database." % plugin.name,
+                               'details': {'database': db_path.as_posix()},
+                               'errors': [str(_err)]
+                               })
 
-    def _send_to_splunk(self, plugin, results, plugin_output_file):
-        results_len = len(results)
+    def _send_to_splunk(self, plugin, results, plugin_output_file, output_length=None):
+        """
+        :param plugin: VolPlugin
+        :param results: (str) text output or JSON serialisable results
+        :param plugin_output_file: (Path) output file written
+        :param output_length: size compared with 'splunk_output_max' instead of len(results), i.e. the text length of
+        output parsed into rows
+        """
+        results_len = len(results) if output_length is None else output_length
         if (plugin.splunk_output and results_len <= splunk_output_max) and (splunk_output.lower() == "auto"):
             self.logger.info({'_action': whoami(),
                               'fields': {'source': "%s:%s" % (self.logging_args['source'], plugin.name),
                                          'index': splunk_results_index,
                                          'sourcetype': splunk_results_sourcetype},
                               'results': results,
-                              'details': {'results_file': plugin_output_file.as_posix(),
+                              'details': {'results_file': self.published_path(plugin_output_file).as_posix(),
                                           'length': results_len,
                                           'splunk_output': plugin.splunk_output}
                               })
@@ -364,15 +867,8 @@ class VolWorker:
                                          'index': splunk_results_index,
                                          'sourcetype': splunk_results_sourcetype},
                               'message': "Plugin output suppressed.",
-                              'details': {'results_file': plugin_output_file.as_posix(),
+                              'details': {'results_file': self.published_path(plugin_output_file).as_posix(),
                                           'length': results_len,
                                           'splunk_output': plugin.splunk_output,
                                           'splunk_threshold': splunk_output_max}
                               })
-
-    def __del__(self):
-        try:
-            # Override config is sourced by adding the Case ID folder to the sys.path.  Remove on exit.
-            sys.path.remove(self.case_dir.as_posix())
-        except ValueError:
-            pass
@@ -0,0 +1,77 @@
+import volatility.obj as obj
+import volatility.debug as debug
+import volatility.utils as utils
+import volatility.commands as commands
+import volatility.registry as registry
+import volatility.plugins.common as common
+
+# Pool scanner plugins combined by default
+SCANNERS = ['psscan', 'thrdscan', 'filescan', 'mutantscan', 'driverscan', 'symlinkscan', 'modscan', 'sockscan',
+            'connscan']
+# Each scanner's output starts with this line, followed by the plugin name.  volatility_worker splits the output on
+# it (see volatility_worker/core/multiscan.py).
+MARKER = "### multiscan:"
+
+
+class MultiScan(common.AbstractScanCommand):
+    """ Runs several pool scanners in a single pass over the physical address space; the output of each scanner is
+    rendered in its own section, as if it had run alone"""
+    def __init__(self, config, *args, **kwargs):
+        common.AbstractScanCommand.__init__(self, config, *args, **kwargs)
+        config.add_option("SCANNERS", default=",".join(SCANNERS), type='str',
+                          help="Comma separated pool scanner plugins")
+        # Instantiated now so the scanners' own options (i.e. mutantscan --silent) are accepted on the command line
+        plugins = registry.get_plugin_classes(commands.Command, lower=True)
+        self.commands = dict()
+        for name in SCANNERS:
+            if name in plugins:
+                self.commands[name] = plugins[name](config, *args, **kwargs)
+
+    def calculate(self):
+        addr_space = utils.load_as(self._config)
+
+        selected = []
+        for name in self._config.SCANNERS.split(","):
+            name = name.strip().lower()
+            command = self.commands.get(name, None)
+            if command is None or not getattr(command, 'scanners', None):
+                debug.warning("'%s' is not a pool scanner plugin; skipped." % name)
+            elif not command.is_valid_profile(addr_space.profile):
+                debug.warning("'%s' does not support this profile; skipped." % name)
+            else:
+                selected.append((name, command))
+
+        # Hits are routed back to their plugin by structure type
+        plugin_by_struct = dict()
+        self.scanners = []
+        for name, command in selected:
+            for scanner in command.scanners:
+                plugin_by_struct[scanner(addr_space).struct_name] = name
+                if scanner not in self.scanners:
+                    self.scanners.append(scanner)
+
+        # Only offsets are kept; objects are re-created when rendered, so large scans (i.e. files) fit in memory
+        hits = dict((name, []) for name, _ in selected)
+        spaces = dict()
+        debug.info("Scanning for %s" % ", ".join(name for name, _ in selected))
+        for found in self.scan_results(addr_space):
+            name = plugin_by_struct.get(found.obj_type, None)
+            if name is None:
+                continue
+            hits[name].append((found.obj_type, found.obj_offset))
+            spaces.setdefault(name, (found.obj_vm, found.obj_native_vm))
+
+        return [(name, command, hits[name], spaces.get(name, None)) for name, command in selected]
+
+    @staticmethod
+    def _objects(hits, spaces):
+        if spaces is None:
+            return
+        vm, native_vm = spaces
+        for struct_name, offset in hits:
+            yield obj.Object(struct_name, offset=offset, vm=vm, native_vm=native_vm)
+
+    def render_text(self, outfd, data):
+        for name, command, hits, spaces in data:
+            outfd.write("%s %s\n" % (MARKER, name))
+            command.render_text(outfd, self._objects(hits, spaces))